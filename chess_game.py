@@ -1,227 +1,728 @@
-import copy # 引入 copy 函式庫，用來進行安全的棋盤模擬
+import random
+import re
+import threading
+from collections import OrderedDict
+
+# --- 棋盤表示法：64 格的 bytearray，每格一個整數棋子代碼 (低 3 位元是兵種，第 4 位元代表黑方) ---
+# 格子編號 sq = row * 8 + col，row 0 是第 8 排 (黑方底線)，跟舊的 board[row][col] 方向一致
+EMPTY, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = 0, 1, 2, 3, 4, 5, 6
+BLACK_PIECE = 8
+WHITE, BLACK = 0, 1
+COLOR_NAMES = ('white', 'black')
+PIECE_CHARS = '.PNBRQK??pnbrqk'
+CHAR_TO_CODE = {ch: code for code, ch in enumerate(PIECE_CHARS) if ch != '?'}
+PROMOTION_CODES = {'q': QUEEN, 'r': ROOK, 'b': BISHOP, 'n': KNIGHT}
+
+# 易位權用 4 個位元表示
+CASTLE_WK, CASTLE_WQ, CASTLE_BK, CASTLE_BQ = 1, 2, 4, 8
+ALL_CASTLING = CASTLE_WK | CASTLE_WQ | CASTLE_BK | CASTLE_BQ
+
+FEN_CASTLING = {'K': CASTLE_WK, 'Q': CASTLE_WQ, 'k': CASTLE_BK, 'q': CASTLE_BQ}
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+
+# 對局結果 (跟 PGN 一樣的寫法) 與結束原因
+WHITE_WINS, BLACK_WINS, DRAW = '1-0', '0-1', '1/2-1/2'
+CHECKMATE, STALEMATE, FIFTY_MOVES, REPETITION, INSUFFICIENT_MATERIAL = (
+    'checkmate', 'stalemate', 'fifty_moves', 'threefold_repetition', 'insufficient_material')
+
+# 座標換算表，整個模組共用一份
+COL_TO_INDEX = {'a': 0, 'b': 1, 'c': 2, 'd': 3, 'e': 4, 'f': 5, 'g': 6, 'h': 7}
+INDEX_TO_COL = {v: k for k, v in COL_TO_INDEX.items()}
+
+START_SQUARES = bytes(CHAR_TO_CODE[ch] for ch in (
+    'rnbqkbnr' 'pppppppp' '........' '........' '........' '........' 'PPPPPPPP' 'RNBQKBNR'))
+
+# --- Zobrist 雜湊：每種 (棋子, 格子)、易位權組合、過路兵所在直行、輪到黑方 都對應一個固定的 64 位元亂數 ---
+# 用固定種子產生，所以不同行程 (伺服器的多個 worker) 算出來的雜湊值也一樣
+_zobrist_rng = random.Random(20240101)
+ZOBRIST_PIECES = tuple(_zobrist_rng.getrandbits(64) if PIECE_CHARS[code] not in '.?' else 0
+                       for code in range(len(PIECE_CHARS)) for _ in range(64)) # 索引是 code * 64 + sq
+ZOBRIST_CASTLING = tuple(_zobrist_rng.getrandbits(64) for _ in range(16))
+ZOBRIST_EP_FILE = tuple(_zobrist_rng.getrandbits(64) for _ in range(8))
+ZOBRIST_SIDE = _zobrist_rng.getrandbits(64)
+
+
+class MoveCache:
+    # 以 Zobrist 雜湊為鍵的 LRU 快取，記住某個局面的合法棋步與是否被將軍
+    # 同一個局面 (例如開局) 再次出現時，只要查一次 dict 就好，不用重新產生棋步
+    def __init__(self, capacity=50000):
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def peek(self, key):
+        # 只看不算命中率、不調整 LRU 順序
+        with self._lock:
+            return self._entries.get(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear(); self.hits = 0; self.misses = 0
+
+    def __len__(self): return len(self._entries)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {'size': len(self._entries), 'capacity': self.capacity, 'hits': self.hits,
+                'misses': self.misses, 'hit_rate': self.hits / total if total else 0.0}
+
+# 所有棋盤共用的快取，要調整容量可以直接改 move_cache.capacity
+move_cache = MoveCache()
+
+# --- 棋步編碼：一個 16 位元整數，低 6 位是起點、接著 6 位是終點、最高 3 位是升變兵種 (0 代表沒有升變) ---
+def encode_move(from_sq, to_sq, promotion=EMPTY):
+    return from_sq | (to_sq << 6) | (promotion << 12)
+
+def decode_move(move):
+    return move & 63, (move >> 6) & 63, move >> 12
+
+def square_name(sq):
+    return INDEX_TO_COL[sq & 7] + str(8 - (sq >> 3))
+
+def parse_square(name):
+    if len(name) != 2 or name[0] not in COL_TO_INDEX or name[1] not in '12345678': return None
+    return (8 - int(name[1])) * 8 + COL_TO_INDEX[name[0]]
+
+def move_to_uci(move):
+    # 例如 e2e4、e7e8q，perft 的 divide 輸出和記錄棋譜都用這個格式
+    from_sq, to_sq, promotion = decode_move(move)
+    return square_name(from_sq) + square_name(to_sq) + (PIECE_CHARS[promotion | BLACK_PIECE] if promotion else '')
+
+def parse_uci(text):
+    if len(text) not in (4, 5): return None
+    from_sq = parse_square(text[:2]); to_sq = parse_square(text[2:4])
+    promotion = PROMOTION_CODES.get(text[4:].lower(), -1) if len(text) == 5 else EMPTY
+    if from_sq is None or to_sq is None or promotion < 0: return None
+    return encode_move(from_sq, to_sq, promotion)
+
+# SAN (標準代數記譜，PGN 用的格式)：例如 Nf3、exd5、R1a3、e8=Q+、O-O
+SAN_RE = re.compile(r'^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$')
+SAN_PIECES = {'N': KNIGHT, 'B': BISHOP, 'R': ROOK, 'Q': QUEEN, 'K': KING}
+SAN_CASTLING = {'O-O': 2, '0-0': 2, 'O-O-O': -2, '0-0-0': -2}
+
+# --- 預先算好的走法表：每一格能跳到哪些格子、每個方向的射線依序經過哪些格子 ---
+KNIGHT_OFFSETS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+KING_OFFSETS = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+ROOK_DIRECTIONS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+BISHOP_DIRECTIONS = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+
+def _build_jump_table(offsets):
+    return tuple(tuple((r + dr) * 8 + c + dc for dr, dc in offsets if 0 <= r + dr <= 7 and 0 <= c + dc <= 7)
+                 for r in range(8) for c in range(8))
+
+def _build_ray_table(directions):
+    table = []
+    for r in range(8):
+        for c in range(8):
+            rays = []
+            for dr, dc in directions:
+                ray = []; tr, tc = r + dr, c + dc
+                while 0 <= tr <= 7 and 0 <= tc <= 7:
+                    ray.append(tr * 8 + tc); tr += dr; tc += dc
+                if ray: rays.append(tuple(ray))
+            table.append(tuple(rays))
+    return tuple(table)
+
+KNIGHT_TARGETS = _build_jump_table(KNIGHT_OFFSETS)
+KING_TARGETS = _build_jump_table(KING_OFFSETS)
+ROOK_RAYS = _build_ray_table(ROOK_DIRECTIONS)
+BISHOP_RAYS = _build_ray_table(BISHOP_DIRECTIONS)
+QUEEN_RAYS = tuple(ROOK_RAYS[sq] + BISHOP_RAYS[sq] for sq in range(64))
+# PAWN_CAPTURES[side][sq]：該方的兵站在 sq 時斜吃得到的格子；反過來看也就是「哪些格子的敵兵會攻擊 sq」
+PAWN_CAPTURES = (_build_jump_table(((-1, -1), (-1, 1))), _build_jump_table(((1, -1), (1, 1))))
+
+# 棋子離開或抵達這些格子時，要清掉對應的易位權 (國王或城堡動了、城堡被吃了)
+CASTLING_MASK = [ALL_CASTLING] * 64
+CASTLING_MASK[60] &= ~(CASTLE_WK | CASTLE_WQ); CASTLING_MASK[63] &= ~CASTLE_WK; CASTLING_MASK[56] &= ~CASTLE_WQ
+CASTLING_MASK[4] &= ~(CASTLE_BK | CASTLE_BQ); CASTLING_MASK[7] &= ~CASTLE_BK; CASTLING_MASK[0] &= ~CASTLE_BQ
+CASTLING_MASK = tuple(CASTLING_MASK)
+# (哪一方, 易位權, 國王起點, 國王終點, 城堡起點, 城堡終點, 必須淨空的格子, 國王經過的格子)
+CASTLING_RULES = (
+    (WHITE, CASTLE_WK, 60, 62, 63, 61, (61, 62), 61), (WHITE, CASTLE_WQ, 60, 58, 56, 59, (57, 58, 59), 59),
+    (BLACK, CASTLE_BK, 4, 6, 7, 5, (5, 6), 5), (BLACK, CASTLE_BQ, 4, 2, 0, 3, (1, 2, 3), 3),
+)
+
+
+class _RowView:
+    # 相容舊介面的唯讀視圖：board.board[row][col] 依然拿得到 'P'、'k'、'.' 這種字元
+    __slots__ = ('_squares', '_offset')
+
+    def __init__(self, squares, row): self._squares = squares; self._offset = row * 8
+    def __getitem__(self, col): return PIECE_CHARS[self._squares[self._offset + col]]
+    def __iter__(self): return (PIECE_CHARS[code] for code in self._squares[self._offset:self._offset + 8])
+    def __len__(self): return 8
+
+
+class _BoardView:
+    __slots__ = ('_squares',)
+
+    def __init__(self, squares): self._squares = squares
+    def __getitem__(self, row): return _RowView(self._squares, row)
+    def __iter__(self): return (_RowView(self._squares, row) for row in range(8))
+    def __len__(self): return 8
+
 
 class Board:
+    __slots__ = ('squares', 'side', 'castling', 'ep_square', 'halfmove_clock', 'fullmove_number',
+                 'king_squares', 'piece_squares', 'move_stack', 'zobrist_key', 'keys')
+
     def __init__(self):
-        self.col_to_index = {'a': 0, 'b': 1, 'c': 2, 'd': 3, 'e': 4, 'f': 5, 'g': 6, 'h': 7}
-        self.index_to_col = {v: k for k, v in self.col_to_index.items()}
-        self.board = [
-            ['r', 'n', 'b', 'q', 'k', 'b', 'n', 'r'], ['p', 'p', 'p', 'p', 'p', 'p', 'p', 'p'],
-            ['.', '.', '.', '.', '.', '.', '.', '.'], ['.', '.', '.', '.', '.', '.', '.', '.'],
-            ['.', '.', '.', '.', '.', '.', '.', '.'], ['.', '.', '.', '.', '.', '.', '.', '.'],
-            ['P', 'P', 'P', 'P', 'P', 'P', 'P', 'P'], ['R', 'N', 'B', 'Q', 'K', 'B', 'N', 'R']
-        ]
-        self.current_turn = 'white'
-        self.en_passant_target = None
-        self.has_moved = {
-            'w_king': False, 'b_king': False, 'w_rook_a': False, 'w_rook_h': False,
-            'b_rook_a': False, 'b_rook_h': False
-        }
+        self.squares = bytearray(START_SQUARES)
+        self.side = WHITE
+        self.castling = ALL_CASTLING
+        self.ep_square = -1
+        self.halfmove_clock = 0 # 距離上次吃子或動兵過了幾個半回合 (50 步規則用)
+        self.fullmove_number = 1
+        # 悔棋堆疊：每一步 make_move 都會把還原所需的資訊打包成一個整數推進來，unmake_move 再依序彈出
+        # 低 16 位是棋步，接著是 棋子(4) 被吃的棋子(4) 被吃的格子(6) 過路兵格子+1(7) 易位權(4) 走之前輪到誰(1)，剩下的高位是 50 步計數
+        # (輪到誰要另外存：檢查非輪到的一方的棋步時也會 make/unmake，不能從棋子的顏色推回去)
+        # 整數比 tuple 省很多記憶體；走之前的 Zobrist 雜湊不存在這裡，在 keys 裡
+        self.move_stack = []
+        self._index_pieces()
+
+    def copy(self):
+        # 棋盤本體與棋子位置表都是 bytearray，複製就是幾次記憶體拷貝；悔棋紀錄與雜湊都是整數，兩份共用同一批物件
+        other = Board.__new__(Board)
+        other.squares = bytearray(self.squares)
+        other.side = self.side
+        other.castling = self.castling
+        other.ep_square = self.ep_square
+        other.halfmove_clock = self.halfmove_clock
+        other.fullmove_number = self.fullmove_number
+        other.king_squares = self.king_squares[:]
+        other.piece_squares = [self.piece_squares[WHITE][:], self.piece_squares[BLACK][:]]
+        other.move_stack = self.move_stack[:]
+        other.zobrist_key = self.zobrist_key
+        other.keys = self.keys[:]
+        return other
+
+    @classmethod
+    def from_fen(cls, fen):
+        # 從 FEN 字串擺出任意局面，格式不對就丟 ValueError
+        board = cls.__new__(cls)
+        board.set_fen(fen)
+        return board
+
+    def set_fen(self, fen):
+        # 就地把這個棋盤換成 FEN 描述的局面 (悔棋堆疊會清空)
+        fields = fen.split()
+        if len(fields) < 4:
+            raise ValueError(f"FEN 欄位不足: {fen!r}")
+        rows = fields[0].split('/')
+        if len(rows) != 8:
+            raise ValueError(f"FEN 棋盤必須有 8 排: {fen!r}")
+        squares = bytearray()
+        for row in rows:
+            row_squares = bytearray()
+            for ch in row:
+                if ch.isdigit(): row_squares.extend(bytes(int(ch)))
+                elif ch in CHAR_TO_CODE and ch != '.': row_squares.append(CHAR_TO_CODE[ch])
+                else: raise ValueError(f"FEN 含有不認得的棋子 {ch!r}: {fen!r}")
+            if len(row_squares) != 8:
+                raise ValueError(f"FEN 每排必須剛好 8 格: {fen!r}")
+            squares.extend(row_squares)
+        if fields[1] not in ('w', 'b'):
+            raise ValueError(f"FEN 輪到哪一方只能是 w 或 b: {fen!r}")
+        if squares.count(KING) != 1 or squares.count(KING | BLACK_PIECE) != 1:
+            raise ValueError(f"FEN 雙方都必須剛好有一個國王: {fen!r}")
+        # 兵不可能在第 1、8 排 (走棋產生器會算出棋盤外的格子)
+        if any(code & 7 == PAWN for code in squares[:8] + squares[56:]):
+            raise ValueError(f"FEN 的兵不能在第 1 或第 8 排: {fen!r}")
+
+        castling = 0
+        if fields[2] != '-':
+            for ch in fields[2]:
+                if ch not in FEN_CASTLING: raise ValueError(f"FEN 易位權不正確: {fen!r}")
+                castling |= FEN_CASTLING[ch]
+        # 國王或城堡不在原位的易位權不算數 (例如 Chess960 的棋譜)，不然會從空格子產生易位
+        for rule_side, right, king_from, _, rook_from, _, _, _ in CASTLING_RULES:
+            color_bit = BLACK_PIECE if rule_side == BLACK else 0
+            if squares[king_from] != KING | color_bit or squares[rook_from] != ROOK | color_bit:
+                castling &= ~right
+        ep_square = -1
+        if fields[3] != '-':
+            ep_pos = self._notation_to_coords(fields[3])
+            if ep_pos is None: raise ValueError(f"FEN 過路兵格子不正確: {fen!r}")
+            ep_square = ep_pos[0] * 8 + ep_pos[1]
+            # 過路兵格子必須是對方剛剛兩步兵經過的那一格：輪白方時在第 6 排，輪黑方時在第 3 排，
+            # 前面站著對方的兵，這一格和兵的起點都是空的
+            if fields[1] == 'w': pawn_sq, origin_sq, pawn = ep_square + 8, ep_square - 8, PAWN | BLACK_PIECE
+            else: pawn_sq, origin_sq, pawn = ep_square - 8, ep_square + 8, PAWN
+            if (ep_pos[0] != (2 if fields[1] == 'w' else 5) or squares[pawn_sq] != pawn
+                    or squares[ep_square] != EMPTY or squares[origin_sq] != EMPTY):
+                raise ValueError(f"FEN 過路兵格子不正確: {fen!r}")
+        try:
+            halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+            fullmove_number = int(fields[5]) if len(fields) > 5 else 1
+        except ValueError:
+            raise ValueError(f"FEN 回合數必須是整數: {fen!r}") from None
+
+        # 全部檢查完才寫回，解析失敗時原本的局面不會被改壞
+        self.squares = squares
+        self.side = WHITE if fields[1] == 'w' else BLACK
+        self.castling = castling
+        self.ep_square = ep_square
+        self.halfmove_clock = halfmove_clock
+        self.fullmove_number = fullmove_number
+        self.move_stack = []
+        self._index_pieces()
+
+    def to_fen(self):
+        rows = []
+        for row in range(8):
+            text = ''; empty = 0
+            for code in self.squares[row * 8:row * 8 + 8]:
+                if code == EMPTY:
+                    empty += 1; continue
+                if empty: text += str(empty); empty = 0
+                text += PIECE_CHARS[code]
+            if empty: text += str(empty)
+            rows.append(text)
+        castling = ''.join(ch for ch, right in FEN_CASTLING.items() if self.castling & right) or '-'
+        ep = square_name(self.ep_square) if self.ep_square >= 0 else '-'
+        return f"{'/'.join(rows)} {'w' if self.side == WHITE else 'b'} {castling} {ep} {self.halfmove_clock} {self.fullmove_number}"
+
+    __copy__ = copy
+    def __deepcopy__(self, memo): return self.copy()
+
+    # --- 相容舊介面的屬性 ---
+    @property
+    def board(self): return _BoardView(self.squares)
+
+    @property
+    def current_turn(self): return COLOR_NAMES[self.side]
+
+    @current_turn.setter
+    def current_turn(self, color):
+        side = WHITE if color == 'white' else BLACK
+        if side != self.side: self.switch_turn()
+
+    @property
+    def en_passant_target(self): return None if self.ep_square < 0 else divmod(self.ep_square, 8)
+
+    @en_passant_target.setter
+    def en_passant_target(self, pos):
+        if self.ep_square >= 0: self.zobrist_key ^= ZOBRIST_EP_FILE[self.ep_square & 7]
+        self.ep_square = -1 if pos is None else pos[0] * 8 + pos[1]
+        if self.ep_square >= 0: self.zobrist_key ^= ZOBRIST_EP_FILE[self.ep_square & 7]
+        self.keys[-1] = self.zobrist_key
 
     def print_board(self):
         print(f"\n--- {self.current_turn.capitalize()}'s Turn ---"); print("  a b c d e f g h"); print("  ---------------")
         for i, row in enumerate(self.board): print(f"{8 - i}| {' '.join(row)}")
-    
+
     def coords_to_notation(self, pos):
         row, col = pos
         if not (0 <= row <= 7 and 0 <= col <= 7):
             return None
-        col_char = self.index_to_col[col]
+        col_char = INDEX_TO_COL[col]
         row_char = str(8 - row)
         return col_char + row_char
-        
+
     def _notation_to_coords(self, notation):
         if len(notation) != 2 or not notation[0].isalpha() or not notation[1].isdigit(): return None
         col_char = notation[0].lower(); row_char = notation[1]
-        if col_char not in self.col_to_index or not (1 <= int(row_char) <= 8): return None
-        col = self.col_to_index[col_char]; row = 8 - int(row_char)
+        if col_char not in COL_TO_INDEX or not (1 <= int(row_char) <= 8): return None
+        col = COL_TO_INDEX[col_char]; row = 8 - int(row_char)
         return (row, col)
-        
-    def get_piece(self, pos): row, col = pos; return self.board[row][col]
-    
-    def switch_turn(self): self.current_turn = 'black' if self.current_turn == 'white' else 'white'
-        
+
+    def get_piece(self, pos): row, col = pos; return PIECE_CHARS[self.squares[row * 8 + col]]
+
+    def switch_turn(self): self.side ^= 1; self.zobrist_key ^= ZOBRIST_SIDE; self.keys[-1] = self.zobrist_key
+
+    def _index_pieces(self):
+        # 依目前棋盤重建每一方的棋子位置表、國王位置與 Zobrist 雜湊，之後由 make/unmake_move 逐步維護
+        # 位置表是最多 16 格的 bytearray，順序沒有意義；找某一格用 index()，在 C 裡掃 16 個 byte
+        self.piece_squares = [bytearray(), bytearray()]
+        self.king_squares = [-1, -1]
+        key = ZOBRIST_CASTLING[self.castling]
+        for sq, code in enumerate(self.squares):
+            if code == EMPTY: continue
+            self.piece_squares[code >> 3].append(sq)
+            if code & 7 == KING: self.king_squares[code >> 3] = sq
+            key ^= ZOBRIST_PIECES[code * 64 + sq]
+        if self.ep_square >= 0: key ^= ZOBRIST_EP_FILE[self.ep_square & 7]
+        if self.side == BLACK: key ^= ZOBRIST_SIDE
+        self.zobrist_key = key
+        # 每個走過的局面的雜湊 (keys[-1] 是目前局面)，悔棋時還原雜湊、判斷重複局面都靠它
+        self.keys = [key]
+
     def is_square_attacked(self, position, attacker_color):
-        for r in range(8):
-            for c in range(8):
-                piece = self.get_piece((r, c))
-                if piece != '.':
-                    is_white_piece = piece.isupper()
-                    if (attacker_color == 'white' and is_white_piece) or \
-                       (attacker_color == 'black' and not is_white_piece):
-                        
-                        # UPDATED! 核心修正！在「偵查」模式下，我們不再遞迴檢查「將軍」狀態
-                        # 這樣就打破了 is_in_check <-> is_valid_move 的無限循環
-                        if self.is_valid_move((r, c), position, check_for_check=False):
-                            return True
-        return False
+        return self._square_attacked(position[0] * 8 + position[1], WHITE if attacker_color == 'white' else BLACK)
 
-    def is_in_check(self, king_color):
-        king_char = 'K' if king_color == 'white' else 'k'
-        attacker_color = 'black' if king_color == 'white' else 'white'
-        king_pos = None
-        for r in range(8):
-            for c in range(8):
-                if self.get_piece((r, c)) == king_char:
-                    king_pos = (r, c)
+    def _square_attacked(self, sq, attacker):
+        # 從目標格「反向」往外看：只要在對應的跳躍表或射線上找到會攻擊這格的敵方棋子就成立
+        # 射線碰到第一個棋子就停，不需要掃描整個棋盤
+        squares = self.squares
+        color_bit = BLACK_PIECE if attacker == BLACK else 0
+        pawn = PAWN | color_bit; knight = KNIGHT | color_bit; king = KING | color_bit
+        bishop = BISHOP | color_bit; rook = ROOK | color_bit; queen = QUEEN | color_bit
+        # 攻擊 sq 的兵，會站在「防守方的兵從 sq 斜吃出去」的位置上
+        for source in PAWN_CAPTURES[attacker ^ 1][sq]:
+            if squares[source] == pawn: return True
+        for source in KNIGHT_TARGETS[sq]:
+            if squares[source] == knight: return True
+        for source in KING_TARGETS[sq]:
+            if squares[source] == king: return True
+        for ray in ROOK_RAYS[sq]:
+            for source in ray:
+                code = squares[source]
+                if code:
+                    if code == rook or code == queen: return True
+                    break
+        for ray in BISHOP_RAYS[sq]:
+            for source in ray:
+                code = squares[source]
+                if code:
+                    if code == bishop or code == queen: return True
                     break
-            if king_pos: break
-        if king_pos:
-            return self.is_square_attacked(king_pos, attacker_color)
         return False
 
+    def is_in_check(self, king_color):
+        return self._in_check(WHITE if king_color == 'white' else BLACK)
+
+    def _in_check(self, side):
+        # 國王位置是隨時維護好的，不用再滿棋盤找國王
+        king_sq = self.king_squares[side]
+        return king_sq >= 0 and self._square_attacked(king_sq, side ^ 1)
+
     def is_valid_move(self, start_pos, end_pos, check_for_check=True):
-        piece = self.get_piece(start_pos)
-        target_piece = self.get_piece(end_pos)
-        if target_piece != '.' and piece.isupper() == target_piece.isupper():
+        from_sq = start_pos[0] * 8 + start_pos[1]; to_sq = end_pos[0] * 8 + end_pos[1]
+        if self.squares[from_sq] == EMPTY:
             return False
-        
-        # 預言未來：模擬這一步棋，並檢查自己是否會被將軍
-        if check_for_check:
-            temp_board = copy.deepcopy(self)
-            temp_board.board[end_pos[0]][end_pos[1]] = piece
-            temp_board.board[start_pos[0]][start_pos[1]] = '.'
-            if temp_board.is_in_check(self.current_turn):
-                return False # 如果移動後自己會被將軍，這就是不合法棋步
-
-        p_type = piece.lower()
-        # 核心修正！在檢查王車易位時，把 check_for_check 參數也傳下去！
-        if p_type == 'k' and self._is_valid_castling(start_pos, end_pos, check_for_check):
+        # 直接從這顆棋子真正走得到的格子裡找，不再逐一套用每種棋子的規則
+        # 偵查模式 (check_for_check=False) 不產生王車易位，也不模擬走完後是否被將軍
+        for move in self._pseudo_moves_from(from_sq, with_castling=check_for_check):
+            if (move >> 6) & 63 == to_sq:
+                # 預言未來：直接在棋盤上走這一步，檢查自己是否會被將軍，再原地退回
+                return not check_for_check or not self._leaves_king_in_check(move)
+        return False
+
+    def _leaves_king_in_check(self, move):
+        mover = self.squares[move & 63] >> 3
+        self.push_move(move)
+        in_check = self._in_check(mover)
+        self.unmake_move()
+        return in_check
+
+    def _pseudo_moves_from(self, from_sq, with_castling=True):
+        # 只列出這顆棋子「照走法」走得到的格子 (還沒檢查走完後自己的國王會不會被將軍)
+        squares = self.squares
+        code = squares[from_sq]
+        side = code >> 3
+        p_type = code & 7
+
+        if p_type == PAWN:
+            step = -8 if side == WHITE else 8
+            to_sq = from_sq + step
+            promotes = to_sq < 8 or to_sq >= 56
+            # 直走 (不能吃子)，在起點可以一次走兩步
+            if squares[to_sq] == EMPTY:
+                if promotes:
+                    for promotion in (QUEEN, ROOK, BISHOP, KNIGHT):
+                        yield from_sq | (to_sq << 6) | (promotion << 12)
+                else:
+                    yield from_sq | (to_sq << 6)
+                    start_row = 6 if side == WHITE else 1
+                    if from_sq >> 3 == start_row and squares[to_sq + step] == EMPTY:
+                        yield from_sq | ((to_sq + step) << 6)
+            # 斜走 (一定要吃子，或是吃過路兵)
+            for to_sq in PAWN_CAPTURES[side][from_sq]:
+                target = squares[to_sq]
+                if target and target >> 3 != side:
+                    if promotes:
+                        for promotion in (QUEEN, ROOK, BISHOP, KNIGHT):
+                            yield from_sq | (to_sq << 6) | (promotion << 12)
+                    else:
+                        yield from_sq | (to_sq << 6)
+                elif to_sq == self.ep_square and side == self.side: # 過路兵只屬於輪到的一方 (對方剛走兩步)
+                    yield from_sq | (to_sq << 6)
+            return
+
+        if p_type == KNIGHT or p_type == KING:
+            for to_sq in (KNIGHT_TARGETS if p_type == KNIGHT else KING_TARGETS)[from_sq]:
+                target = squares[to_sq]
+                if target == EMPTY or target >> 3 != side:
+                    yield from_sq | (to_sq << 6)
+            if p_type == KING and with_castling and self.castling:
+                yield from self._castling_moves(side)
+            return
+
+        # 滑行棋子：沿著每條射線一路走，碰到第一個棋子就停
+        rays = ROOK_RAYS if p_type == ROOK else BISHOP_RAYS if p_type == BISHOP else QUEEN_RAYS
+        for ray in rays[from_sq]:
+            for to_sq in ray:
+                target = squares[to_sq]
+                if target == EMPTY:
+                    yield from_sq | (to_sq << 6)
+                    continue
+                if target >> 3 != side:
+                    yield from_sq | (to_sq << 6)
+                break
+
+    def _castling_moves(self, side):
+        # 易位權還在、中間要淨空、國王與城堡要在原位。國王不能正被將軍，也不能「經過」被攻擊的格子
+        squares = self.squares
+        color_bit = BLACK_PIECE if side == BLACK else 0
+        for rule_side, right, king_from, king_to, rook_from, _, empty_squares, pass_sq in CASTLING_RULES:
+            if rule_side != side or not self.castling & right:
+                continue
+            if squares[king_from] != KING | color_bit or squares[rook_from] != ROOK | color_bit:
+                continue
+            if any(squares[sq] for sq in empty_squares):
+                continue
+            if self._in_check(side) or self._square_attacked(pass_sq, side ^ 1):
+                continue
+            yield king_from | (king_to << 6)
+
+    def iter_pseudo_moves(self, side=None, origin=None):
+        # 惰性產生器：只列出真正走得到的候選棋步 (16 位元編碼)，需要時才算下一步
+        # 給了 origin (格子編號) 就只看那一格，GUI 點一顆棋子時不必把整盤都算一遍
+        side = self.side if side is None else side
+        if origin is not None:
+            code = self.squares[origin]
+            if code and code >> 3 == side:
+                yield from self._pseudo_moves_from(origin)
+            return
+        # 只走訪自己的棋子位置表；先複製一份，因為 make/unmake 會在產生途中動到它
+        for from_sq in bytes(self.piece_squares[side]):
+            yield from self._pseudo_moves_from(from_sq)
+
+    def iter_moves(self, side=None, origin=None):
+        # 在候選棋步上用 make/unmake 過濾掉「走完自己被將軍」的棋步，一樣是惰性產生
+        for move in self.iter_pseudo_moves(side, origin):
+            if not self._leaves_king_in_check(move):
+                yield move
+
+    def _decoded(self, moves):
+        for move in moves:
+            from_sq, to_sq, promotion = move & 63, (move >> 6) & 63, move >> 12
+            yield divmod(from_sq, 8), divmod(to_sq, 8), PIECE_CHARS[promotion | BLACK_PIECE] if promotion else None
+
+    def pseudo_legal_moves(self, color=None, origin=None):
+        # 相容介面：一樣是惰性產生，但用 (起點, 終點, 升變) 的座標形式
+        side = None if color is None else (WHITE if color == 'white' else BLACK)
+        return self._decoded(self.iter_pseudo_moves(side, None if origin is None else origin[0] * 8 + origin[1]))
+
+    def legal_moves(self, color=None, origin=None):
+        side = None if color is None else (WHITE if color == 'white' else BLACK)
+        return self._decoded(self.iter_moves(side, None if origin is None else origin[0] * 8 + origin[1]))
+
+    def analyze_position(self):
+        # 輪到的一方的所有合法棋步與是否被將軍，先查共用的 LRU 快取，沒有才真的產生
+        entry = move_cache.get(self.zobrist_key)
+        if entry is None:
+            entry = (tuple(self.iter_moves()), self._in_check(self.side))
+            move_cache.put(self.zobrist_key, entry)
+        return entry
+
+    # --- 對局結束判斷：每一步之後呼叫也很便宜，不必產生全部的合法棋步 ---
+    def has_legal_move(self):
+        # 找到第一個合法棋步就停；快取裡有這個局面就直接用。先試國王，被將軍時最常是它能走
+        entry = move_cache.peek(self.zobrist_key)
+        if entry is not None:
+            return bool(entry[0])
+        king_sq = self.king_squares[self.side]
+        if king_sq >= 0 and next(self.iter_moves(origin=king_sq), None) is not None:
             return True
+        return next(self.iter_moves(), None) is not None
 
-        # 其他棋子的檢查維持不變
-        if p_type == 'p': return self._is_valid_pawn_move(start_pos, end_pos, piece)
-        if p_type == 'r': return self._is_valid_rook_move(start_pos, end_pos)
-        if p_type == 'n': return self._is_valid_knight_move(start_pos, end_pos)
-        if p_type == 'b': return self._is_valid_bishop_move(start_pos, end_pos)
-        if p_type == 'q': return self._is_valid_queen_move(start_pos, end_pos)
-        if p_type == 'k': return self._is_valid_king_move(start_pos, end_pos)
-        return False
+    def move_history(self):
+        # 從這個棋盤的起始局面開始走過的棋步 (16 位元編碼)
+        return [entry & 0xFFFF for entry in self.move_stack]
 
-    def _is_valid_castling(self, start_pos, end_pos, check_for_check=True):
-        start_row, start_col = start_pos; end_row, end_col = end_pos
-        if start_row != end_row or abs(start_col - end_col) != 2:
-            return False
-        
-        # 核心修正！只有在「真實世界」的檢查中，才需要檢查是否被將軍
-        if check_for_check and self.is_in_check(self.current_turn):
-            return False
+    def repetition_count(self):
+        # 只往回看上一個「不可逆」的棋步 (吃子或動兵) 之後、同一方走的局面，之前的不可能再出現
+        keys = self.keys
+        last = len(keys) - 1
+        return keys[last - 2 * (min(self.halfmove_clock, last) // 2)::2].count(self.zobrist_key)
 
-        # 後續的檢查邏輯不變
-        if self.current_turn == 'white':
-            if self.has_moved['w_king']: return False
-            if end_col > start_col:
-                if self.has_moved['w_rook_h']: return False
-                if self.get_piece((7, 5)) != '.' or self.get_piece((7, 6)) != '.': return False
-            else:
-                if self.has_moved['w_rook_a']: return False
-                if self.get_piece((7, 1)) != '.' or self.get_piece((7, 2)) != '.' or self.get_piece((7, 3)) != '.': return False
+    def is_insufficient_material(self):
+        # 只剩國王、單騎或單象，或是雙方都只剩同色格的象：誰都不可能將死對方
+        minors = []
+        for sq in self.piece_squares[WHITE] + self.piece_squares[BLACK]:
+            p_type = self.squares[sq] & 7
+            if p_type == KING: continue
+            if p_type not in (KNIGHT, BISHOP): return False
+            minors.append((p_type, ((sq >> 3) + sq) & 1))
+        if len(minors) <= 1:
+            return True
+        return all(p_type == BISHOP for p_type, _ in minors) and len({color for _, color in minors}) == 1
+
+    def outcome(self, has_moves=None):
+        # 對局還沒結束回傳 None，否則回傳 (結果, 原因)，例如 ('1-0', 'checkmate')
+        # has_moves 是 has_legal_move() 的結果：別處 (例如驗證棋步的 worker) 已經算好就傳進來，這裡只剩便宜的檢查
+        if has_moves is None:
+            has_moves = self.has_legal_move()
+        if not has_moves:
+            if self._in_check(self.side):
+                return (BLACK_WINS if self.side == WHITE else WHITE_WINS), CHECKMATE
+            return DRAW, STALEMATE
+        if self.halfmove_clock >= 100:
+            return DRAW, FIFTY_MOVES
+        if self.repetition_count() >= 3:
+            return DRAW, REPETITION
+        if self.is_insufficient_material():
+            return DRAW, INSUFFICIENT_MATERIAL
+        return None
+
+    def generate_legal_moves(self, color, origin=None):
+        # 相容舊介面：回傳 (起點, 終點) 的列表，升變只留一筆 (預設升后)
+        if color == self.current_turn:
+            moves = self.analyze_position()[0]
+            if origin is not None:
+                from_sq = origin[0] * 8 + origin[1]
+                moves = [move for move in moves if move & 63 == from_sq]
+            decoded = self._decoded(moves)
         else:
-            if self.has_moved['b_king']: return False
-            if end_col > start_col:
-                if self.has_moved['b_rook_h']: return False
-                if self.get_piece((0, 5)) != '.' or self.get_piece((0, 6)) != '.': return False
-            else:
-                if self.has_moved['b_rook_a']: return False
-                if self.get_piece((0, 1)) != '.' or self.get_piece((0, 2)) != '.' or self.get_piece((0, 3)) != '.': return False
-        return True
-
-    def _is_valid_pawn_move(self, start_pos, end_pos, piece):
-        start_row, start_col = start_pos
-        end_row, end_col = end_pos
-        
-        # 決定前進方向 (白兵向上-1, 黑兵向下+1)
-        direction = -1 if piece.isupper() else 1
-        
-        # --- 情況一：直走 (不能吃子) ---
-        if start_col == end_col:
-            # 檢查目標格子是否為空。如果不為空，就直接判定為非法移動 (修正Bug #2)
-            if self.get_piece(end_pos) != '.':
-                return False
-
-            # 1. 普通走一步
-            if end_row == start_row + direction:
-                return True
-            
-            # 2. 從起點走兩步
-            start_rank = 6 if piece.isupper() else 1
-            if start_row == start_rank and end_row == start_row + 2 * direction:
-                # 檢查中間的路徑是否也被擋住 (更嚴謹的檢查)
-                if self.get_piece((start_row + direction, start_col)) == '.':
-                    return True
-
-        # --- 情況二：斜走 (一定要吃子) ---
-        elif abs(start_col - end_col) == 1 and end_row == start_row + direction:
-            target_piece = self.get_piece(end_pos)
-            
-            # 1. 一般吃子
-            # 目標格子必須「有東西」而且「是敵人」(修正Bug #3)
-            if target_piece != '.' and (target_piece.isupper() != piece.isupper()):
-                return True
-
-            # 2. 吃過路兵
-            if end_pos == self.en_passant_target:
-                return True
-        
-        # 如果以上所有合法情況都不滿足 (例如後退)，就判定為非法移動 (修正Bug #1)
-        return False
+            decoded = self.legal_moves(color, origin)
+        return [(start_pos, end_pos) for start_pos, end_pos, promotion in decoded
+                if promotion is None or promotion == 'q']
+
+    def parse_san(self, san):
+        # 把 SAN 轉成目前局面下的 16 位元棋步；看不懂、不合法或沒寫清楚是哪一顆棋子都回傳 None
+        san = san.rstrip('+#!?')
+        if san in SAN_CASTLING:
+            king_sq = self.king_squares[self.side]
+            for move in self.iter_moves(origin=king_sq):
+                if (move >> 6) & 63 == king_sq + SAN_CASTLING[san]: return move
+            return None
+        match = SAN_RE.match(san)
+        if match is None:
+            return None
+        piece, from_file, from_rank, target, promotion = match.groups()
+        p_type = SAN_PIECES[piece] if piece else PAWN
+        to_sq = parse_square(target)
+        promotion = SAN_PIECES[promotion] if promotion else EMPTY
+        from_col = COL_TO_INDEX[from_file] if from_file else -1
+        from_row = 8 - int(from_rank) if from_rank else -1
+        squares = self.squares
+        found = None
+        # 只看這個兵種的棋子，不必產生整盤的棋步
+        for from_sq in bytes(self.piece_squares[self.side]):
+            if squares[from_sq] & 7 != p_type or (from_col >= 0 and from_sq & 7 != from_col) or (from_row >= 0 and from_sq >> 3 != from_row):
+                continue
+            for move in self.iter_moves(origin=from_sq):
+                if (move >> 6) & 63 != to_sq or move >> 12 != promotion: continue
+                if found is not None: return None
+                found = move
+        return found
 
-    def _is_valid_rook_move(self, start_pos, end_pos):
-        start_row, start_col = start_pos; end_row, end_col = end_pos
-        if start_row != end_row and start_col != end_col: return False
-        if start_row == end_row:
-            step = 1 if end_col > start_col else -1
-            for c in range(start_col + step, end_col, step):
-                if self.get_piece((start_row, c)) != '.': return False
+    def apply_san(self, san):
+        # 走一步 SAN 棋步並回傳它的 16 位元編碼；不合法就丟 ValueError，棋盤不會被改動
+        move = self.parse_san(san)
+        if move is None:
+            raise ValueError(f"不合法或有歧義的棋步: {san!r}")
+        self.push_move(move)
+        return move
+
+    def make_move(self, start_pos, end_pos, promotion=None):
+        # 不做任何規則檢查，直接在原棋盤上執行一步 (含王車易位、吃過路兵、升變)，呼叫者要自己確定這步是合理的
+        promotion_code = PROMOTION_CODES[promotion.lower()] if promotion else EMPTY
+        self.push_move(encode_move(start_pos[0] * 8 + start_pos[1], end_pos[0] * 8 + end_pos[1], promotion_code))
+
+    def push_move(self, move):
+        # make_move 的整數版本，內部的搜尋與驗證都直接走這條路
+        squares = self.squares
+        from_sq = move & 63; to_sq = (move >> 6) & 63
+        piece = squares[from_sq]
+        mover = piece >> 3
+        p_type = piece & 7
+        captured = squares[to_sq]
+        captured_sq = to_sq
+        placed = piece
+        rook_from = rook_to = -1
+
+        if p_type == PAWN:
+            if to_sq == self.ep_square and captured == EMPTY and (to_sq - from_sq) & 7:
+                captured_sq = to_sq + (8 if mover == WHITE else -8); captured = squares[captured_sq]
+                squares[captured_sq] = EMPTY
+            elif to_sq < 8 or to_sq >= 56:
+                placed = (move >> 12 or QUEEN) | (piece & BLACK_PIECE)
+        elif p_type == KING and (to_sq - from_sq == 2 or from_sq - to_sq == 2):
+            rook_from, rook_to = (from_sq + 3, from_sq + 1) if to_sq > from_sq else (from_sq - 4, from_sq - 1)
+
+        self.move_stack.append(move | piece << 16 | captured << 20 | captured_sq << 24 | (self.ep_square + 1) << 30
+                               | self.castling << 37 | self.side << 41 | self.halfmove_clock << 42)
+        key = self.zobrist_key ^ ZOBRIST_SIDE ^ ZOBRIST_PIECES[piece * 64 + from_sq] ^ ZOBRIST_PIECES[placed * 64 + to_sq]
+
+        squares[to_sq] = placed; squares[from_sq] = EMPTY
+        own_squares = self.piece_squares[mover]
+        own_squares[own_squares.index(from_sq)] = to_sq
+        if captured:
+            self.piece_squares[mover ^ 1].remove(captured_sq)
+            key ^= ZOBRIST_PIECES[captured * 64 + captured_sq]
+        if rook_from >= 0:
+            rook = squares[rook_from]
+            squares[rook_to] = rook; squares[rook_from] = EMPTY
+            own_squares[own_squares.index(rook_from)] = rook_to
+            key ^= ZOBRIST_PIECES[rook * 64 + rook_from] ^ ZOBRIST_PIECES[rook * 64 + rook_to]
+        if p_type == KING:
+            self.king_squares[mover] = to_sq
+
+        # 更新易位權與過路兵目標，雜湊也跟著把舊的值 XOR 掉、新的值 XOR 進來
+        castling = self.castling & CASTLING_MASK[from_sq] & CASTLING_MASK[to_sq]
+        if castling != self.castling:
+            key ^= ZOBRIST_CASTLING[self.castling] ^ ZOBRIST_CASTLING[castling]
+            self.castling = castling
+        if self.ep_square >= 0:
+            key ^= ZOBRIST_EP_FILE[self.ep_square & 7]
+        if p_type == PAWN and (to_sq - from_sq == 16 or from_sq - to_sq == 16):
+            self.ep_square = (from_sq + to_sq) >> 1
+            key ^= ZOBRIST_EP_FILE[from_sq & 7]
         else:
-            step = 1 if end_row > start_row else -1
-            for r in range(start_row + step, end_row, step):
-                if self.get_piece((r, start_col)) != '.': return False
-        return True
-
-    def _is_valid_knight_move(self, start_pos, end_pos):
-        start_row, start_col = start_pos; end_row, end_col = end_pos
-        row_diff = abs(start_row - end_row); col_diff = abs(start_col - end_col)
-        return (row_diff == 2 and col_diff == 1) or (row_diff == 1 and col_diff == 2)
-
-    def _is_valid_bishop_move(self, start_pos, end_pos):
-        start_row, start_col = start_pos; end_row, end_col = end_pos
-        if abs(start_row - end_row) != abs(start_col - end_col): return False
-        row_step = 1 if end_row > start_row else -1; col_step = 1 if end_col > start_col else -1
-        r, c = start_row + row_step, start_col + col_step
-        while r != end_row:
-            if self.get_piece((r, c)) != '.': return False
-            r += row_step; c += col_step
-        return True
-
-    def _is_valid_queen_move(self, start_pos, end_pos):
-        return self._is_valid_rook_move(start_pos, end_pos) or self._is_valid_bishop_move(start_pos, end_pos)
-
-    def _is_valid_king_move(self, start_pos, end_pos):
-        start_row, start_col = start_pos; end_row, end_col = end_pos
-        row_diff = abs(start_row - end_row); col_diff = abs(start_col - end_col)
-        return row_diff <= 1 and col_diff <= 1
-        
-    def generate_legal_moves(self, color):
-        legal_moves = []
-        for r1 in range(8):
-            for c1 in range(8):
-                piece = self.get_piece((r1, c1))
-                if piece != '.' and (piece.isupper() if color == 'white' else piece.islower()):
-                    for r2 in range(8):
-                        for c2 in range(8):
-                            # UPDATED! 核心修正！在這裡也加上 check_for_check=False
-                            # 這樣它在模擬時，就不會再掉進 is_in_check 的無窮迴圈了
-                            if self.is_valid_move((r1, c1), (r2, c2), check_for_check=False):
-                                # 雖然上面初步檢查通過了，但我們還是要在這裡做一次「真實的」合法性檢查
-                                # 也就是模擬移動後，自己的國王不能被將軍
-                                temp_board = copy.deepcopy(self)
-                                temp_board.board[r2][c2] = piece
-                                temp_board.board[r1][c1] = '.'
-                                if not temp_board.is_in_check(color):
-                                    legal_moves.append( ((r1, c1), (r2, c2)) )
-        return legal_moves
-
-    def move_piece(self, start_notation, end_notation):
+            self.ep_square = -1
+        if mover == BLACK: self.fullmove_number += 1
+        self.side = mover ^ 1
+        self.zobrist_key = key
+        self.keys.append(key)
+        self.halfmove_clock = 0 if p_type == PAWN or captured else self.halfmove_clock + 1
+
+    def unmake_move(self):
+        # 把最後一步從堆疊彈出，原封不動地還原棋盤與所有狀態
+        entry = self.move_stack.pop()
+        keys = self.keys
+        keys.pop(); self.zobrist_key = keys[-1]
+        from_sq = entry & 63; to_sq = (entry >> 6) & 63
+        piece = (entry >> 16) & 15; captured = (entry >> 20) & 15; captured_sq = (entry >> 24) & 63
+        self.ep_square = ((entry >> 30) & 127) - 1; self.castling = (entry >> 37) & 15; self.halfmove_clock = entry >> 42
+        mover = piece >> 3
+        self.side = (entry >> 41) & 1
+        squares = self.squares
+        own_squares = self.piece_squares[mover]
+        if piece & 7 == KING:
+            self.king_squares[mover] = from_sq
+            if to_sq - from_sq == 2 or from_sq - to_sq == 2: # 王車易位，城堡也要退回去
+                rook_from, rook_to = (from_sq + 3, from_sq + 1) if to_sq > from_sq else (from_sq - 4, from_sq - 1)
+                squares[rook_from] = squares[rook_to]; squares[rook_to] = EMPTY
+                own_squares[own_squares.index(rook_to)] = rook_from
+        squares[from_sq] = piece; squares[to_sq] = EMPTY
+        own_squares[own_squares.index(to_sq)] = from_sq
+        if captured:
+            squares[captured_sq] = captured
+            self.piece_squares[mover ^ 1].append(captured_sq)
+        if mover == BLACK: self.fullmove_number -= 1
+
+    def move_piece(self, start_notation, end_notation, promotion='q'):
         start_pos = self._notation_to_coords(start_notation)
         end_pos = self._notation_to_coords(end_notation)
         if start_pos is None or end_pos is None:
@@ -229,7 +730,7 @@ class Board:
             return
 
         piece = self.get_piece(start_pos)
-        
+
         # 1. 檢查是否為空格
         if piece == '.':
             print(f"\n唉呀！{start_notation} 這個位置是空的！")
@@ -241,7 +742,7 @@ class Board:
            (self.current_turn == 'black' and is_white_piece):
             print(f"\n不行喔！現在是 {self.current_turn} 方回合！")
             return
-            
+
         # 3. 呼叫總規則檢查官，進行最終審判！
         if self.is_valid_move(start_pos, end_pos):
             # --- 合法移動！開始執行！ ---
@@ -251,38 +752,22 @@ class Board:
             action_text = ""
 
             if is_castling:
-                self.board[end_pos[0]][end_pos[1]] = piece; self.board[start_pos[0]][start_pos[1]] = '.'
-                if end_pos[1] > start_pos[1]:
-                    rook = self.get_piece((start_pos[0], 7)); self.board[start_pos[0]][5] = rook; self.board[start_pos[0]][7] = '.'
-                    action_text = "發動了「王翼易位」！"
-                else:
-                    rook = self.get_piece((start_pos[0], 0)); self.board[start_pos[0]][3] = rook; self.board[start_pos[0]][0] = '.'
-                    action_text = "發動了「后翼易位」！"
+                action_text = "發動了「王翼易位」！" if end_pos[1] > start_pos[1] else "發動了「后翼易位」！"
             elif en_passant_capture:
-                action_text = f"移動 {piece} 從 {start_notation} 到 {end_notation}"
-                captured_pawn_pos = (start_pos[0], end_pos[1]); captured_pawn = self.get_piece(captured_pawn_pos)
-                self.board[captured_pawn_pos[0]][captured_pawn_pos[1]] = '.'; action_text += f"，順路吃掉了 '{captured_pawn}'！"
-                self.board[end_pos[0]][end_pos[1]] = piece; self.board[start_pos[0]][start_pos[1]] = '.'
+                captured_pawn = self.get_piece((start_pos[0], end_pos[1]))
+                action_text = f"移動 {piece} 從 {start_notation} 到 {end_notation}，順路吃掉了 '{captured_pawn}'！"
             else:
                 action_text = f"移動 {piece} 從 {start_notation} 到 {end_notation}"
                 if target_piece != '.':
                     action_text += f"，吃掉了 '{target_piece}'！"
-                self.board[end_pos[0]][end_pos[1]] = piece; self.board[start_pos[0]][start_pos[1]] = '.'
+                if piece.lower() == 'p' and end_pos[0] in (0, 7):
+                    action_text += f"，升變成 '{promotion.upper() if is_white_piece else promotion.lower()}'！"
 
+            self.make_move(start_pos, end_pos, promotion)
             print(f"\n{action_text}")
-
-            # 更新履歷和記憶
-            if piece == 'K': self.has_moved['w_king'] = True
-            elif piece == 'k': self.has_moved['b_king'] = True
-            elif piece == 'R' and start_pos == (7, 0): self.has_moved['w_rook_a'] = True
-            elif piece == 'R' and start_pos == (7, 7): self.has_moved['w_rook_h'] = True
-            elif piece == 'r' and start_pos == (0, 0): self.has_moved['b_rook_a'] = True
-            elif piece == 'r' and start_pos == (0, 7): self.has_moved['b_rook_h'] = True
-            self.en_passant_target = None
-            if piece.lower() == 'p' and abs(start_pos[0] - end_pos[0]) == 2:
-                self.en_passant_target = ((start_pos[0] + end_pos[0]) // 2, start_pos[1])
-            
-            self.switch_turn()
+            outcome = self.outcome()
+            if outcome is not None:
+                print(f"\n對局結束：{outcome[0]} ({outcome[1]})")
         else:
             # 不合法移動！駁回！
             print(f"\n不行喔！'{piece}' 不能這樣走！")
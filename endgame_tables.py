@@ -0,0 +1,193 @@
+# 殘局表：王+后對王 (KQK)、王+車對王 (KRK) 的每一個局面，事先用逆向分析 (retrograde analysis) 算出殺棋距離
+# 一個局面用 (輪到誰, 強方王, 弱方王, 強方的后/車) 的格子編號當索引，每個局面 1 byte，整張表 512 KB，直接 mmap 查詢
+#   0 = 和棋 (弱方可以吃掉后/車或被逼和)、255 = 不可能出現的局面、其他 = 殺棋距離 (半回合) + 1
+#   強方走時存的是「強方幾步內殺棋」，弱方走時存的是「弱方幾步內被殺」
+# 強方是黑方的局面上下翻轉、黑白對調後查同一張表
+# 產生：python endgame_tables.py build <目錄>    (純 Python 每張表大約幾秒)
+import mmap
+import os
+import struct
+
+import chess_game
+from chess_game import KING_TARGETS, ROOK_RAYS, QUEEN_RAYS, ROOK, QUEEN, WHITE, BLACK
+
+MAGIC = b'CHESSEG1'
+HEADER = struct.Struct('>8sB7x')
+TABLE_SIZE = 2 * 64 * 64 * 64
+DRAW, ILLEGAL = 0, 255
+MATERIALS = {'KQK': QUEEN, 'KRK': ROOK}
+
+def index(side, strong_king, weak_king, piece):
+    return ((side * 64 + strong_king) * 64 + weak_king) * 64 + piece
+
+def _between_table(rays):
+    # between[p][t]：t 在 p 的某條射線上時，回傳兩格之間的格子；不在射線上是 None
+    table = [[None] * 64 for _ in range(64)]
+    for p in range(64):
+        for ray in rays[p]:
+            for i, t in enumerate(ray):
+                table[p][t] = frozenset(ray[:i])
+    return table
+
+class _Generator:
+    # 強方一律當成白方 (side 0)，弱方是黑方 (side 1)
+    def __init__(self, p_type):
+        self.rays = QUEEN_RAYS if p_type == QUEEN else ROOK_RAYS
+        self.between = _between_table(self.rays)
+
+    def piece_attacks(self, piece, target, strong_king):
+        # 弱方王自己的格子不算阻擋：它一移動，原本被它擋住的那條線就通了
+        between = self.between[piece][target]
+        return between is not None and strong_king not in between
+
+    def legal(self, side, wk, bk, p):
+        if wk == bk or p == wk or p == bk or bk in KING_TARGETS[wk]:
+            return False
+        return side == BLACK or not self.piece_attacks(p, bk, wk) # 強方走時弱方不可能正被將軍
+
+    def weak_moves(self, wk, bk, p):
+        # 弱方王的合法去處；第二個回傳值表示能不能安全吃掉后/車
+        targets = []
+        can_capture = False
+        for t in KING_TARGETS[bk]:
+            if t in KING_TARGETS[wk]:
+                continue
+            if t == p:
+                if p not in KING_TARGETS[wk]: can_capture = True
+                continue
+            if not self.piece_attacks(p, t, wk):
+                targets.append(t)
+        return targets, can_capture
+
+    def piece_squares_from(self, p, wk, bk):
+        for ray in self.rays[p]:
+            for t in ray:
+                if t == wk or t == bk: break
+                yield t
+
+    def build(self):
+        table = bytearray([ILLEGAL]) * TABLE_SIZE
+        counts = [0] * (TABLE_SIZE // 2) # 弱方走的局面還剩幾個「沒被證明會輸」的棋步
+        frontier = []
+        for wk in range(64):
+            for bk in range(64):
+                for p in range(64):
+                    if self.legal(WHITE, wk, bk, p): table[index(WHITE, wk, bk, p)] = DRAW
+                    if not self.legal(BLACK, wk, bk, p): continue
+                    i = index(BLACK, wk, bk, p)
+                    table[i] = DRAW
+                    targets, can_capture = self.weak_moves(wk, bk, p)
+                    if can_capture:
+                        counts[i - TABLE_SIZE // 2] = -1 # 可以吃掉后/車，這個局面不會輸
+                    elif not targets and self.piece_attacks(p, bk, wk):
+                        table[i] = 1; frontier.append((wk, bk, p)) # 已經被將死 (距離 0)
+                    else:
+                        counts[i - TABLE_SIZE // 2] = len(targets) # 沒有棋步又沒被將軍就是逼和，count 是 0 但不會進 frontier
+
+        distance = 0
+        while frontier:
+            # frontier 是弱方走、剛確定「distance 半回合內被殺」的局面；往回推一步找強方走的前一個局面
+            won = []
+            for wk, bk, p in frontier:
+                for f in KING_TARGETS[wk]:
+                    if f != p and f != bk and self.legal(WHITE, f, bk, p) and table[index(WHITE, f, bk, p)] == DRAW:
+                        table[index(WHITE, f, bk, p)] = distance + 2; won.append((f, bk, p))
+                for f in self.piece_squares_from(p, wk, bk):
+                    if self.legal(WHITE, wk, bk, f) and table[index(WHITE, wk, bk, f)] == DRAW:
+                        table[index(WHITE, wk, bk, f)] = distance + 2; won.append((wk, bk, f))
+            # 強方必勝的局面再往回推：弱方走的前一個局面，所有棋步都導向必敗時才算輸
+            frontier = []
+            for wk, bk, p in won:
+                for f in KING_TARGETS[bk]:
+                    if f == wk or f == p or not self.legal(BLACK, wk, f, p):
+                        continue
+                    i = index(BLACK, wk, f, p)
+                    slot = i - TABLE_SIZE // 2
+                    if table[i] != DRAW or counts[slot] <= 0:
+                        continue
+                    counts[slot] -= 1
+                    if counts[slot] == 0:
+                        table[i] = distance + 3; frontier.append((wk, f, p))
+            distance += 2
+        return table
+
+def build_table(name):
+    return _Generator(MATERIALS[name]).build()
+
+def write_table(path, name, table):
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, MATERIALS[name]))
+        f.write(table)
+
+class EndgameTables:
+    # 讀取目錄裡所有 *.egt；沒有的表就查不到 (probe 回傳 None)
+    def __init__(self, directory):
+        self._files = []
+        self._tables = {}
+        for name in MATERIALS:
+            path = os.path.join(directory, f"{name}.egt")
+            if not os.path.exists(path):
+                continue
+            f = open(path, 'rb')
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, p_type = HEADER.unpack_from(data, 0)
+            if magic != MAGIC or len(data) != HEADER.size + TABLE_SIZE:
+                data.close(); f.close()
+                raise ValueError(f"{path} 不是殘局表檔案")
+            self._files.append((f, data))
+            self._tables[p_type] = data
+
+    def __contains__(self, name): return MATERIALS.get(name) in self._tables
+
+    def probe(self, board):
+        # 回傳 (結果, 半回合數)：結果是輪到的一方的 'win' / 'loss' / 'draw'；不是表裡的子力組合回傳 None
+        white, black = board.piece_squares
+        if len(white) + len(black) != 3:
+            return None
+        strong = WHITE if len(white) == 2 else BLACK
+        squares = board.squares
+        piece = next(sq for sq in board.piece_squares[strong] if squares[sq] & 7 != chess_game.KING)
+        data = self._tables.get(squares[piece] & 7)
+        if data is None:
+            return None
+        wk, bk = board.king_squares[strong], board.king_squares[strong ^ 1]
+        side = WHITE if board.side == strong else BLACK
+        if strong == BLACK:
+            wk, bk, piece = wk ^ 56, bk ^ 56, piece ^ 56 # 上下翻轉，讓強方變成白方
+        value = data[HEADER.size + index(side, wk, bk, piece)]
+        if value == DRAW or value == ILLEGAL:
+            return ('draw', 0)
+        return ('win' if side == WHITE else 'loss', value - 1)
+
+    def best_move(self, board):
+        # 贏的時候挑最快殺棋的一步，輸的時候挑撐最久的一步；不在表裡回傳 None
+        if self.probe(board) is None:
+            return None
+        best_key, best_move = None, None
+        for move in board.iter_moves():
+            board.push_move(move)
+            child = self.probe(board) or ('draw', 0) # 吃掉了后/車，只剩兩個王
+            board.unmake_move()
+            result, plies = child
+            key = (2, -plies) if result == 'loss' else (0, plies) if result == 'win' else (1, 0)
+            if best_key is None or key > best_key:
+                best_key, best_move = key, move
+        return best_move
+
+    def close(self):
+        for f, data in self._files:
+            data.close(); f.close()
+        self._files = []; self._tables = {}
+
+if __name__ == '__main__':
+    import sys
+    import time
+    if len(sys.argv) != 3 or sys.argv[1] != 'build':
+        sys.exit("用法：python endgame_tables.py build <目錄>")
+    os.makedirs(sys.argv[2], exist_ok=True)
+    for name in MATERIALS:
+        started = time.perf_counter()
+        table = build_table(name)
+        write_table(os.path.join(sys.argv[2], f"{name}.egt"), name, table)
+        longest = max(value for value in table if value != ILLEGAL) - 1
+        print(f"{name}: {time.perf_counter() - started:.1f}s，最長殺棋 {longest} 個半回合")
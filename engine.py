@@ -0,0 +1,364 @@
+# 電腦對手：建立在 chess_game.Board 上的 negamax alpha-beta 搜尋
+#   反覆加深 (iterative deepening)，在時間預算內盡量搜深，時間到就用上一層完整的結果
+#   棋步排序：置換表的最佳步 > 吃子 (MVV-LVA，先吃大的、用小的吃) > killer moves > 其他
+#   葉節點接靜態搜尋 (quiescence，只看吃子與升變)，避免在交換到一半的局面停下來評估
+#   置換表以 Zobrist 雜湊為鍵，記錄 (深度, 邊界種類, 分數, 最佳步)
+# parallel_search 把根節點的棋步分給多個行程各自搜尋 (root splitting)，用滿所有核心
+# Engine 是給伺服器用的：每一局電腦對手的一步丟進行程池，不佔用 eventlet 的事件迴圈
+# 有開局庫或殘局表時先查表 (微秒等級)，查不到才搜尋
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import chess_game
+from chess_game import PAWN, WHITE
+from endgame_tables import EndgameTables
+from opening_book import OpeningBook
+from worker_pool import WorkerPool
+
+MATE = 100000
+INFINITY = MATE + 1
+MAX_PLY = 128
+MAX_DEPTH = 64
+EXACT, LOWER, UPPER = 0, 1, 2 # 置換表的分數是精確值、下界 (beta 截斷) 還是上界 (沒有超過 alpha)
+
+PIECE_VALUES = (0, 100, 320, 330, 500, 900, 20000)
+
+# 位置加分表 (白方視角，第 0 列是第 8 橫列，跟 Board.squares 同順序)；黑方用 sq ^ 56 上下翻轉
+PIECE_SQUARE_TABLES = (
+    (0,) * 64,
+    (0, 0, 0, 0, 0, 0, 0, 0,
+     50, 50, 50, 50, 50, 50, 50, 50,
+     10, 10, 20, 30, 30, 20, 10, 10,
+     5, 5, 10, 25, 25, 10, 5, 5,
+     0, 0, 0, 20, 20, 0, 0, 0,
+     5, -5, -10, 0, 0, -10, -5, 5,
+     5, 10, 10, -20, -20, 10, 10, 5,
+     0, 0, 0, 0, 0, 0, 0, 0),
+    (-50, -40, -30, -30, -30, -30, -40, -50,
+     -40, -20, 0, 0, 0, 0, -20, -40,
+     -30, 0, 10, 15, 15, 10, 0, -30,
+     -30, 5, 15, 20, 20, 15, 5, -30,
+     -30, 0, 15, 20, 20, 15, 0, -30,
+     -30, 5, 10, 15, 15, 10, 5, -30,
+     -40, -20, 0, 5, 5, 0, -20, -40,
+     -50, -40, -30, -30, -30, -30, -40, -50),
+    (-20, -10, -10, -10, -10, -10, -10, -20,
+     -10, 0, 0, 0, 0, 0, 0, -10,
+     -10, 0, 5, 10, 10, 5, 0, -10,
+     -10, 5, 5, 10, 10, 5, 5, -10,
+     -10, 0, 10, 10, 10, 10, 0, -10,
+     -10, 10, 10, 10, 10, 10, 10, -10,
+     -10, 5, 0, 0, 0, 0, 5, -10,
+     -20, -10, -10, -10, -10, -10, -10, -20),
+    (0, 0, 0, 0, 0, 0, 0, 0,
+     5, 10, 10, 10, 10, 10, 10, 5,
+     -5, 0, 0, 0, 0, 0, 0, -5,
+     -5, 0, 0, 0, 0, 0, 0, -5,
+     -5, 0, 0, 0, 0, 0, 0, -5,
+     -5, 0, 0, 0, 0, 0, 0, -5,
+     -5, 0, 0, 0, 0, 0, 0, -5,
+     0, 0, 0, 5, 5, 0, 0, 0),
+    (-20, -10, -10, -5, -5, -10, -10, -20,
+     -10, 0, 0, 0, 0, 0, 0, -10,
+     -10, 0, 5, 5, 5, 5, 0, -10,
+     -5, 0, 5, 5, 5, 5, 0, -5,
+     0, 0, 5, 5, 5, 5, 0, -5,
+     -10, 5, 5, 5, 5, 5, 0, -10,
+     -10, 0, 5, 0, 0, 0, 0, -10,
+     -20, -10, -10, -5, -5, -10, -10, -20),
+    (-30, -40, -40, -50, -50, -40, -40, -30,
+     -30, -40, -40, -50, -50, -40, -40, -30,
+     -30, -40, -40, -50, -50, -40, -40, -30,
+     -30, -40, -40, -50, -50, -40, -40, -30,
+     -20, -30, -30, -40, -40, -30, -30, -20,
+     -10, -20, -20, -20, -20, -20, -20, -10,
+     20, 20, 0, 0, 0, 0, 20, 20,
+     20, 30, 10, 0, 0, 10, 30, 20),
+)
+# 依棋子代碼 (含顏色) 與格子直接查「子力 + 位置」分數，評估時一次查表就好
+PIECE_SCORES = tuple(
+    tuple(PIECE_VALUES[code & 7] + PIECE_SQUARE_TABLES[code & 7][sq if code >> 3 == WHITE else sq ^ 56] for sq in range(64))
+    if chess_game.PIECE_CHARS[code] not in '.?' else (0,) * 64
+    for code in range(len(chess_game.PIECE_CHARS)))
+
+SearchResult = namedtuple('SearchResult', 'move score depth nodes elapsed')
+
+class SearchTimeout(Exception):
+    pass
+
+def evaluate(board):
+    # 從輪到的一方來看的靜態分數
+    squares = board.squares
+    white = sum(PIECE_SCORES[squares[sq]][sq] for sq in board.piece_squares[WHITE])
+    black = sum(PIECE_SCORES[squares[sq]][sq] for sq in board.piece_squares[chess_game.BLACK])
+    return white - black if board.side == WHITE else black - white
+
+def captured_value(board, move):
+    # 這步吃到的子的價值 (吃過路兵算一個兵)，不是吃子就回傳 0
+    target = board.squares[(move >> 6) & 63]
+    if target:
+        return PIECE_VALUES[target & 7]
+    if (move >> 6) & 63 == board.ep_square and board.squares[move & 63] & 7 == PAWN:
+        return PIECE_VALUES[PAWN]
+    return 0
+
+class Searcher:
+    def __init__(self, tt_size=200000):
+        self.tt_size = tt_size
+        self.tt = {}
+        self.board = None
+        self.nodes = 0
+        self.deadline = 0.0
+        self.killers = [[0, 0] for _ in range(MAX_PLY)]
+
+    def search(self, board, time_limit=1.0, max_depth=MAX_DEPTH, root_moves=None):
+        # 在 board 的複本上搜尋，呼叫端的棋盤不會被動到；root_moves 可以限制根節點只看哪些棋步
+        started = time.perf_counter()
+        self.board = board = board.copy()
+        self.nodes = 0
+        self.deadline = started + time_limit
+        self.killers = [[0, 0] for _ in range(MAX_PLY)]
+        if len(self.tt) >= self.tt_size: self.tt.clear()
+        moves = list(board.iter_moves()) if root_moves is None else list(root_moves)
+        if not moves:
+            return SearchResult(None, -MATE if board._in_check(board.side) else 0, 0, 0, 0.0)
+
+        entry = self.tt.get(board.zobrist_key)
+        moves = self._ordered(moves, entry[3] if entry else 0, 0)
+        best = SearchResult(moves[0], evaluate(board), 0, 0, 0.0)
+        for depth in range(1, max_depth + 1):
+            try:
+                move, score = self._search_root(moves, depth)
+            except SearchTimeout:
+                break
+            elapsed = time.perf_counter() - started
+            best = SearchResult(move, score, depth, self.nodes, elapsed)
+            moves.remove(move); moves.insert(0, move) # 上一層的最佳步下一層先搜，截斷最多
+            if abs(score) >= MATE - MAX_PLY or elapsed * 2 > time_limit:
+                break # 已經找到殺棋，或剩下的時間大概不夠搜完下一層
+        return best._replace(nodes=self.nodes, elapsed=time.perf_counter() - started)
+
+    def _search_root(self, moves, depth):
+        board = self.board
+        alpha, best_move = -INFINITY, moves[0]
+        for move in moves:
+            board.push_move(move)
+            try:
+                score = -self._negamax(depth - 1, -INFINITY, -alpha, 1)
+            finally:
+                board.unmake_move()
+            if score > alpha:
+                alpha, best_move = score, move
+        self._store(board.zobrist_key, depth, EXACT, alpha, best_move, 0)
+        return best_move, alpha
+
+    def _negamax(self, depth, alpha, beta, ply):
+        board = self.board
+        if self._is_draw():
+            return 0
+        in_check = board._in_check(board.side)
+        if in_check: depth += 1 # 被將軍時多看一層，不要在將軍中途停下來
+        if depth <= 0 or ply >= MAX_PLY - 1:
+            return self._quiesce(alpha, beta, ply)
+        self._tick()
+
+        key = board.zobrist_key
+        entry = self.tt.get(key)
+        tt_move = 0
+        if entry is not None:
+            entry_depth, flag, score, tt_move = entry
+            if entry_depth >= depth:
+                score = self._from_tt(score, ply)
+                if flag == EXACT or (flag == LOWER and score >= beta) or (flag == UPPER and score <= alpha):
+                    return score
+
+        original_alpha = alpha
+        best_score, best_move = -INFINITY, 0
+        mover = board.side
+        for move in self._ordered(board.iter_pseudo_moves(), tt_move, ply):
+            board.push_move(move)
+            if board._in_check(mover):
+                board.unmake_move(); continue
+            try:
+                score = -self._negamax(depth - 1, -beta, -alpha, ply + 1)
+            finally:
+                board.unmake_move()
+            if score > best_score:
+                best_score, best_move = score, move
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        if not captured_value(board, move):
+                            killers = self.killers[ply]
+                            if killers[0] != move: killers[1] = killers[0]; killers[0] = move
+                        break
+        if best_move == 0:
+            return -MATE + ply if in_check else 0 # 沒有合法棋步：被將死或逼和
+
+        flag = LOWER if best_score >= beta else UPPER if best_score <= original_alpha else EXACT
+        self._store(key, depth, flag, best_score, best_move, ply)
+        return best_score
+
+    def _quiesce(self, alpha, beta, ply):
+        board = self.board
+        self._tick()
+        stand_pat = evaluate(board)
+        if stand_pat >= beta:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+        mover = board.side
+        noisy = [move for move in board.iter_pseudo_moves() if move >> 12 or captured_value(board, move)]
+        for move in self._ordered(noisy, 0, None):
+            board.push_move(move)
+            if board._in_check(mover):
+                board.unmake_move(); continue
+            try:
+                score = -self._quiesce(-beta, -alpha, ply + 1)
+            finally:
+                board.unmake_move()
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+        return alpha
+
+    def _ordered(self, moves, tt_move, ply):
+        board = self.board
+        squares = board.squares
+        killers = self.killers[ply] if ply is not None else (0, 0)
+        def order_key(move):
+            if move == tt_move: return 1000000
+            victim = captured_value(board, move)
+            if victim or move >> 12:
+                # MVV-LVA：被吃的越值錢越前面，同樣的被吃子用越便宜的棋子去吃越前面
+                return 100000 + victim * 10 - PIECE_VALUES[squares[move & 63] & 7] // 10 + PIECE_VALUES[move >> 12]
+            if move == killers[0]: return 90000
+            if move == killers[1]: return 80000
+            return 0
+        return sorted(moves, key=order_key, reverse=True)
+
+    def _is_draw(self):
+        # 50 步規則，或同一個局面已經出現過 (搜尋中第二次出現就當作和棋)；Board 自己維護重複計數
+        board = self.board
+        return board.halfmove_clock >= 100 or board.repetition_count() > 1
+
+    def _tick(self):
+        self.nodes += 1
+        if not self.nodes & 1023 and time.perf_counter() > self.deadline:
+            raise SearchTimeout()
+
+    def _store(self, key, depth, flag, score, move, ply):
+        if len(self.tt) >= self.tt_size and key not in self.tt:
+            return
+        # 殺棋分數存成「距離這個局面幾步」，從不同深度查到時才會對
+        if score >= MATE - MAX_PLY: score += ply
+        elif score <= -MATE + MAX_PLY: score -= ply
+        self.tt[key] = (depth, flag, score, move)
+
+    @staticmethod
+    def _from_tt(score, ply):
+        if score >= MATE - MAX_PLY: return score - ply
+        if score <= -MATE + MAX_PLY: return score + ply
+        return score
+
+_worker_searcher = None
+_worker_tables = {} # 路徑 -> 已經 mmap 的開局庫/殘局表，每個 worker 行程只開一次
+
+def _open_table(cls, path):
+    if path not in _worker_tables:
+        _worker_tables[path] = cls(path)
+    return _worker_tables[path]
+
+def board_from(fen, keys=None):
+    # FEN 不記得之前的局面；keys 是上一個不可逆棋步之後的局面雜湊 (Board.keys 的尾巴)，有給就接上，重複局面的判斷才看得到對局歷史
+    board = chess_game.Board.from_fen(fen)
+    if keys and keys[-1] == board.zobrist_key:
+        board.keys = list(keys)
+    return board
+
+def search_fen(fen, time_limit=1.0, max_depth=MAX_DEPTH, root_moves=None, book_path=None, tables_dir=None, keys=None):
+    # 在 worker 行程裡執行；同一個行程重複使用同一個 Searcher，置換表可以跨局面沿用
+    global _worker_searcher
+    board = board_from(fen, keys)
+    if root_moves is None:
+        move = _open_table(OpeningBook, book_path).pick(board) if book_path else None
+        if move is None and tables_dir:
+            move = _open_table(EndgameTables, tables_dir).best_move(board)
+        if move is not None:
+            return SearchResult(move, 0, 0, 0, 0.0)
+    if _worker_searcher is None:
+        _worker_searcher = Searcher()
+    return _worker_searcher.search(board, time_limit, max_depth, root_moves)
+
+def play_fen(fen, time_limit=1.0, book_path=None, tables_dir=None, keys=None):
+    # 伺服器的電腦對手用：搜尋之後順便在 worker 裡算好走完這步對方還有沒有合法棋步 (見 Board.outcome)
+    move = search_fen(fen, time_limit, MAX_DEPTH, None, book_path, tables_dir, keys).move
+    if move is None:
+        return None, None
+    board = chess_game.Board.from_fen(fen)
+    board.push_move(move)
+    return move, board.has_legal_move()
+
+def parallel_search(board, time_limit=1.0, max_depth=MAX_DEPTH, processes=None, executor=None):
+    # root splitting：根節點的合法棋步輪流分給每個行程，各自反覆加深，最後取分數最高的一步
+    # (分數相同時取搜得比較深的)；每個行程只看自己那份棋步，所以同樣的時間能搜得更深
+    moves = list(board.iter_moves())
+    processes = min(processes or os.cpu_count() or 1, len(moves))
+    if processes <= 1:
+        return Searcher().search(board, time_limit, max_depth)
+    fen = board.to_fen()
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=processes)
+    try:
+        futures = [executor.submit(search_fen, fen, time_limit, max_depth, moves[i::processes]) for i in range(processes)]
+        results = [future.result() for future in futures]
+    finally:
+        if own_executor: executor.shutdown()
+    best = max(results, key=lambda result: (result.score, result.depth))
+    return best._replace(nodes=sum(result.nodes for result in results),
+                         elapsed=max(result.elapsed for result in results))
+
+class Engine:
+    # 伺服器的電腦對手：跟 MoveValidator 一樣把搜尋丟進 WorkerPool，等待時不卡住其他房間
+    # workers=0 代表直接在呼叫端搜尋 (測試或單機除錯用)；max_searches 是同時進行的搜尋上限，多的排隊等
+    def __init__(self, workers=None, time_limit=0.5, use_processes=True, book_path=None, tables_dir=None,
+                 sleep=None, max_searches=None):
+        self._pool = WorkerPool(workers, use_processes, name='engine', sleep=sleep, max_pending=max_searches)
+        self.workers = self._pool.workers
+        self.time_limit = time_limit
+        self.book_path = book_path
+        self.tables_dir = tables_dir
+
+    def play(self, fen, keys=None):
+        # 回傳 (整數棋步, 走完後對方還有沒有合法棋步)；沒有合法棋步 (已經被將死或逼和) 時回傳 (None, None)
+        # keys 見 board_from：不給的話引擎看不到這盤棋之前的局面，會走進 (或錯過) 三次重複
+        return self._pool.run(play_fen, fen, self.time_limit, self.book_path, self.tables_dir, keys)
+
+    def searching(self): return self._pool.in_flight
+
+    def shutdown(self): self._pool.shutdown()
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='搜尋一個局面的最佳步')
+    parser.add_argument('--fen', default=chess_game.START_FEN)
+    parser.add_argument('--time', type=float, default=2.0, help='每步的時間預算 (秒)')
+    parser.add_argument('--depth', type=int, default=MAX_DEPTH)
+    parser.add_argument('--processes', type=int, default=1, help='>1 時用多個行程分攤根節點')
+    parser.add_argument('--book', help='開局庫檔案 (opening_book.py build 產生)')
+    parser.add_argument('--tables', help='殘局表目錄 (endgame_tables.py build 產生)')
+    args = parser.parse_args()
+    board = chess_game.Board.from_fen(args.fen)
+    if args.book or args.tables:
+        result = search_fen(args.fen, args.time, args.depth, None, args.book, args.tables)
+    elif args.processes > 1:
+        result = parallel_search(board, args.time, args.depth, args.processes)
+    else:
+        result = Searcher().search(board, args.time, args.depth)
+    move = chess_game.move_to_uci(result.move) if result.move is not None else '(none)'
+    print(f"bestmove {move}  score {result.score}  depth {result.depth}  nodes {result.nodes}  "
+          f"{result.nodes / result.elapsed if result.elapsed else 0:.0f} nps")
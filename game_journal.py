@@ -0,0 +1,312 @@
+# 棋局日誌：每一步被伺服器接受的棋都追加到該局的日誌檔，伺服器重開後重播日誌就能把棋局接回來
+#   active/<局號>.log    進行中的棋局，只會往後追加
+#   archive/games.dat    結束的棋局整局搬進這一個檔案
+#   archive/games.idx    固定長度的索引 (局號雜湊, 位移, 長度)，可以直接 mmap，依封存順序追加
+#   archive/games.sorted.idx  同樣的索引依局號雜湊排序 (標頭記著涵蓋前幾筆)，查詢一局是一次二分搜尋
+# 寫入由背景執行緒批次處理，一批只 fsync 一次 (group commit)，下棋的路徑只是把紀錄丟進佇列，不會等磁碟
+# 寫入失敗 (磁碟滿了、檔案被刪了) 時丟掉那一批並回報，寫入執行緒繼續處理下一批；errors / lost 可以拿來監控
+# 匯出：python game_journal.py export <日誌目錄>   (每行一局 JSON，棋步用 UCI 表示)
+import hashlib
+import json
+import mmap
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import chess_game
+import protocol
+
+START, MOVE, END = b'S', b'M', b'E'
+RECORD_HEADER = struct.Struct('>cH') # 紀錄種類 + 內容長度
+INDEX_ENTRY = struct.Struct('>QQI')  # 局號雜湊、在 games.dat 的位移、長度
+SORTED_MAGIC = b'CHESSIX1'
+SORTED_HEADER = struct.Struct('>8sQ') # 魔術字 + 涵蓋 games.idx 的前幾筆
+SORTED_REBUILD_TAIL = 1024 # 排序索引之後又封存了超過這麼多局才重建，之前的逐筆比對
+
+def game_key(game_id):
+    return int.from_bytes(hashlib.blake2b(game_id.encode(), digest_size=8).digest(), 'big')
+
+def encode_record(kind, payload):
+    return RECORD_HEADER.pack(kind, len(payload)) + payload
+
+def parse_records(data):
+    # 依序取出 (種類, 內容)；最後一筆如果只寫了一半 (例如當機)，就當作沒寫
+    offset = 0
+    while offset + RECORD_HEADER.size <= len(data):
+        kind, length = RECORD_HEADER.unpack_from(data, offset)
+        start = offset + RECORD_HEADER.size
+        if start + length > len(data):
+            return
+        yield kind, bytes(data[start:start + length])
+        offset = start + length
+
+def replay(data):
+    # 把一局的日誌內容重播成 {'game_id', 'meta', 'moves', 'result', 'board'}
+    game = {'game_id': None, 'meta': {}, 'moves': [], 'result': None, 'board': None}
+    for kind, payload in parse_records(data):
+        if kind == START:
+            game['meta'] = json.loads(payload)
+            game['game_id'] = game['meta'].get('game_id')
+            game['board'] = chess_game.Board.from_fen(game['meta'].get('fen', chess_game.START_FEN))
+        elif kind == MOVE and game['board'] is not None:
+            seq, move = protocol.unpack_move(payload)
+            if seq != len(game['moves']):
+                break # 序號對不上代表日誌損壞，停在最後一個可信的局面
+            game['board'].push_move(move)
+            game['moves'].append(move)
+        elif kind == END:
+            game['result'] = payload.decode()
+    return game
+
+class GameJournal:
+    def __init__(self, directory, flush_interval=0.05, max_batch=4096, max_open_files=256, on_error=None):
+        self.directory = directory
+        self.active_dir = os.path.join(directory, 'active')
+        self.archive_dir = os.path.join(directory, 'archive')
+        os.makedirs(self.active_dir, exist_ok=True)
+        os.makedirs(self.archive_dir, exist_ok=True)
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_open_files = max_open_files
+        self.on_error = on_error # 寫入失敗時用例外呼叫它，沒給就印到 stderr
+        self.errors = 0 # 失敗次數
+        self.lost = 0   # 因為失敗或寫入執行緒已停止而沒寫進去的紀錄數
+        self._queue = queue.Queue()
+        self._open_files = OrderedDict()
+        self._thread = threading.Thread(target=self._run, name='game-journal', daemon=True)
+        self._thread.start()
+
+    # --- 下棋路徑上呼叫的 API：只丟進佇列，立刻返回 ---
+    def record_start(self, game_id, meta):
+        meta = dict(meta, game_id=game_id)
+        self._put((START, game_id, json.dumps(meta).encode()))
+
+    def record_move(self, game_id, seq, move):
+        self._put((MOVE, game_id, protocol.pack_move(seq, move)))
+
+    def record_end(self, game_id, result):
+        self._put((END, game_id, result.encode()))
+
+    def _put(self, item):
+        # 寫入執行緒已經停了 (close 之後，或意外結束) 就不再收，免得佇列無限長大
+        if not self._thread.is_alive():
+            self.lost += 1
+            return
+        self._queue.put(item)
+
+    def pending(self): return self._queue.qsize() # 還沒寫到磁碟的紀錄數
+
+    def alive(self): return self._thread.is_alive()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def recover(self):
+        # 伺服器啟動時呼叫：把所有還沒結束的棋局重播出來
+        games = []
+        for name in sorted(os.listdir(self.active_dir)):
+            if not name.endswith('.log'):
+                continue
+            with open(os.path.join(self.active_dir, name), 'rb') as f:
+                game = replay(f.read())
+            if game['board'] is not None and game['result'] is None:
+                games.append(game)
+        return games
+
+    # --- 背景寫入執行緒 ---
+    def _run(self):
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                batch = [item]
+                deadline = time.monotonic() + self.flush_interval
+                stop = False
+                while len(batch) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    try:
+                        item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stop = True; break
+                    batch.append(item)
+                try:
+                    self._write_batch(batch)
+                except Exception as error:
+                    # 這一批算是遺失了；關掉所有開著的檔案，下一批重新開，不要讓寫入執行緒跟著死掉
+                    self.lost += len(batch)
+                    self._close_files()
+                    self._report(error)
+                if stop:
+                    break
+        finally:
+            self._close_files()
+
+    def _report(self, error):
+        self.errors += 1
+        if self.on_error is not None:
+            self.on_error(error)
+        else:
+            print(f"棋局日誌寫入失敗: {error!r}", file=sys.stderr)
+
+    def _close_files(self):
+        for f in self._open_files.values():
+            try:
+                f.close()
+            except OSError:
+                pass
+        self._open_files.clear()
+
+    def _active_path(self, game_id):
+        return os.path.join(self.active_dir, f"{game_id}.log")
+
+    def _file(self, game_id):
+        f = self._open_files.get(game_id)
+        if f is not None:
+            self._open_files.move_to_end(game_id)
+            return f
+        while len(self._open_files) >= self.max_open_files:
+            _, oldest = self._open_files.popitem(last=False)
+            oldest.flush(); os.fsync(oldest.fileno()); oldest.close()
+        f = self._open_files[game_id] = open(self._active_path(game_id), 'ab')
+        return f
+
+    def _write_batch(self, batch):
+        touched = {}
+        finished = []
+        for kind, game_id, payload in batch:
+            f = self._file(game_id)
+            f.write(encode_record(kind, payload))
+            touched[game_id] = f
+            if kind == END:
+                finished.append(game_id)
+        # group commit：這一批寫到的檔案各 fsync 一次
+        for f in touched.values():
+            if not f.closed:
+                f.flush(); os.fsync(f.fileno())
+        for game_id in finished:
+            f = self._open_files.pop(game_id, None)
+            if f is not None: f.close()
+            try:
+                self._compact(game_id)
+            except OSError as error:
+                # 日誌檔還留在 active/，裡面已經有結束紀錄，重開時不會被當成進行中的棋局
+                self._report(error)
+
+    def _compact(self, game_id):
+        # 結束的棋局整段搬進 games.dat，索引追加一筆，再刪掉原本的日誌檔
+        path = self._active_path(game_id)
+        with open(path, 'rb') as f:
+            data = f.read()
+        with open(os.path.join(self.archive_dir, 'games.dat'), 'ab') as dat:
+            offset = dat.tell()
+            dat.write(data); dat.flush(); os.fsync(dat.fileno())
+        with open(os.path.join(self.archive_dir, 'games.idx'), 'ab') as idx:
+            idx.write(INDEX_ENTRY.pack(game_key(game_id), offset, len(data))); idx.flush(); os.fsync(idx.fileno())
+        os.remove(path)
+
+def write_sorted_index(archive_dir, idx, count):
+    # 把 games.idx 的前 count 筆依 (局號雜湊, 位移) 排序寫成 games.sorted.idx；先寫暫存檔再換名，讀的人不會看到寫一半的檔案
+    entries = sorted(INDEX_ENTRY.unpack_from(idx, i * INDEX_ENTRY.size) for i in range(count))
+    path = os.path.join(archive_dir, 'games.sorted.idx')
+    temp = f"{path}.{os.getpid()}.tmp"
+    with open(temp, 'wb') as f:
+        f.write(SORTED_HEADER.pack(SORTED_MAGIC, count))
+        for entry in entries:
+            f.write(INDEX_ENTRY.pack(*entry))
+    os.replace(temp, path)
+
+class ArchiveReader:
+    # 以 mmap 讀取已結束的棋局；逐局產生，不會一次把整個封存檔讀進記憶體
+    def __init__(self, directory):
+        archive_dir = os.path.join(directory, 'archive')
+        self._files = []
+        self._dat = self._map(os.path.join(archive_dir, 'games.dat'))
+        self._idx = self._map(os.path.join(archive_dir, 'games.idx'))
+        self._sorted, self._sorted_count = self._open_sorted(archive_dir)
+
+    def _map(self, path):
+        # 還沒有任何結束的棋局 (檔案不存在或是空的) 時，當成空的封存檔
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return b''
+        f = open(path, 'rb')
+        self._files.append(f)
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _open_sorted(self, archive_dir):
+        # 排序索引落後太多 (或還沒有) 就重建；封存目錄不能寫的話照用舊的，多出來的尾巴逐筆比對
+        path = os.path.join(archive_dir, 'games.sorted.idx')
+        for attempt in range(2):
+            data = self._map(path)
+            count = 0
+            if len(data) >= SORTED_HEADER.size:
+                magic, count = SORTED_HEADER.unpack_from(data, 0)
+                if magic != SORTED_MAGIC or count > len(self) or SORTED_HEADER.size + count * INDEX_ENTRY.size > len(data):
+                    count = 0
+            if attempt or len(self) - count <= SORTED_REBUILD_TAIL:
+                return data, count
+            try:
+                write_sorted_index(archive_dir, self._idx, len(self))
+            except OSError:
+                return data, count
+            if isinstance(data, mmap.mmap): data.close()
+
+    def __len__(self):
+        return len(self._idx) // INDEX_ENTRY.size
+
+    def entries(self, start=0):
+        for offset in range(start * INDEX_ENTRY.size, len(self) * INDEX_ENTRY.size, INDEX_ENTRY.size):
+            yield INDEX_ENTRY.unpack_from(self._idx, offset)
+
+    def __iter__(self):
+        for _, offset, length in self.entries():
+            yield replay(self._dat[offset:offset + length])
+
+    def _locations(self, key):
+        # 排序索引上二分搜尋找到這個雜湊的所有 (位移, 長度)，再加上排序索引之後才封存的那些
+        low, high = 0, self._sorted_count
+        while low < high: # 找第一筆 >= key 的位置
+            mid = (low + high) // 2
+            if INDEX_ENTRY.unpack_from(self._sorted, SORTED_HEADER.size + mid * INDEX_ENTRY.size)[0] < key: low = mid + 1
+            else: high = mid
+        while low < self._sorted_count:
+            entry_key, offset, length = INDEX_ENTRY.unpack_from(self._sorted, SORTED_HEADER.size + low * INDEX_ENTRY.size)
+            if entry_key != key: break
+            yield offset, length
+            low += 1
+        for entry_key, offset, length in self.entries(self._sorted_count):
+            if entry_key == key: yield offset, length
+
+    def find(self, game_id):
+        for offset, length in self._locations(game_key(game_id)):
+            game = replay(self._dat[offset:offset + length])
+            if game['game_id'] == game_id:
+                return game
+        return None
+
+    def close(self):
+        for mapped in (self._dat, self._idx, self._sorted):
+            if isinstance(mapped, mmap.mmap): mapped.close()
+        for f in self._files:
+            f.close()
+
+def export_games(directory, out=sys.stdout):
+    reader = ArchiveReader(directory)
+    try:
+        for game in reader:
+            out.write(json.dumps({'game_id': game['game_id'], 'meta': game['meta'], 'result': game['result'],
+                                  'moves': [chess_game.move_to_uci(move) for move in game['moves']]}) + '\n')
+    finally:
+        reader.close()
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3 or sys.argv[1] != 'export':
+        sys.exit("用法：python game_journal.py export <日誌目錄>")
+    export_games(sys.argv[2])
@@ -1,6 +1,8 @@
 # In gui_chess.py (WebSocket Version)
 import pygame
 import chess_game
+import protocol
+from position_service import PositionService
 import socketio # NEW! 引入新的函式庫
 import threading
 
@@ -12,12 +14,15 @@ COLOR_WHITE = (238, 238, 210)
 COLOR_BLACK = (118, 150, 86)
 HIGHLIGHT_COLOR = (255, 255, 51, 150)
 POSSIBLE_MOVE_COLOR = (0, 0, 0, 70)
+MAX_FPS = 60            # 畫面更新的上限 (連續點擊或大量網路事件時)
+IDLE_WAKEUP_MS = 1000   # 閒置時最多隔多久醒來一次；平常都是被事件叫醒
+REDRAW_EVENT = pygame.USEREVENT + 1 # 網路執行緒改了狀態後丟這個事件叫醒主迴圈
 PIECE_MAPPING = {
     'P': 'w_pawn', 'R': 'w_rook', 'N': 'w_knight', 'B': 'w_bishop', 'Q': 'w_queen', 'K': 'w_king',
     'p': 'b_pawn', 'r': 'b_rook', 'n': 'b_knight', 'b': 'b_bishop', 'q': 'b_queen', 'k': 'b_king'
 }
 
-# --- 繪圖函式 (維持原樣) ---
+# --- 繪圖函式 ---
 def load_piece_images():
     images = {}
     for piece_char, piece_key in PIECE_MAPPING.items():
@@ -29,124 +34,258 @@ def draw_board(screen):
         for col in range(8):
             color = COLOR_WHITE if (row + col) % 2 == 0 else COLOR_BLACK
             pygame.draw.rect(screen, color, [col * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE])
-def draw_pieces(screen, board_state, piece_images):
-    for row in range(8):
-        for col in range(8):
-            piece = board_state[row][col]
-            if piece != '.': screen.blit(piece_images[piece], (col * SQUARE_SIZE, row * SQUARE_SIZE))
-def draw_highlights(screen, selected_pos, valid_moves):
-    if selected_pos:
-        row, col = selected_pos; s = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE), pygame.SRCALPHA); s.fill(HIGHLIGHT_COLOR)
-        screen.blit(s, (col * SQUARE_SIZE, row * SQUARE_SIZE))
-    for move in valid_moves:
-        row, col = move[1]; s = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE), pygame.SRCALPHA)
-        pygame.draw.circle(s, POSSIBLE_MOVE_COLOR, (SQUARE_SIZE // 2, SQUARE_SIZE // 2), SQUARE_SIZE // 6)
-        screen.blit(s, (col * SQUARE_SIZE, row * SQUARE_SIZE))
-def draw_message(screen, font, message):
+def render_message(font, message):
     text_surf = font.render(message, True, (200, 20, 20))
     bg_rect = pygame.Rect(0, 0, text_surf.get_width() + 40, text_surf.get_height() + 40)
     bg_rect.center = (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2)
-    bg_surf = pygame.Surface(bg_rect.size, pygame.SRCALPHA); bg_surf.fill((0, 0, 0, 180))
-    screen.blit(bg_surf, bg_rect.topleft)
-    text_rect = text_surf.get_rect(center=bg_rect.center)
-    screen.blit(text_surf, text_rect)
+    surface = pygame.Surface(bg_rect.size, pygame.SRCALPHA); surface.fill((0, 0, 0, 180))
+    surface.blit(text_surf, text_surf.get_rect(center=(bg_rect.width // 2, bg_rect.height // 2)))
+    return surface, bg_rect
+
+class BoardRenderer:
+    # 只重畫跟上一幀不一樣的格子，回傳需要 display.update 的區域
+    # 棋盤底圖、選取框、可走位置的圓點、訊息框都只產生一次，之後重複使用
+    def __init__(self, screen, piece_images, font):
+        self.screen = screen; self.piece_images = piece_images; self.font = font
+        self.background = pygame.Surface((BOARD_SIZE, BOARD_SIZE)); draw_board(self.background)
+        self.highlight = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE), pygame.SRCALPHA); self.highlight.fill(HIGHLIGHT_COLOR)
+        self.move_dot = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE), pygame.SRCALPHA)
+        pygame.draw.circle(self.move_dot, POSSIBLE_MOVE_COLOR, (SQUARE_SIZE // 2, SQUARE_SIZE // 2), SQUARE_SIZE // 6)
+        self.square_rects = [pygame.Rect(col * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE)
+                             for row in range(8) for col in range(8)]
+        self.messages = {}
+        self.invalidate()
+
+    def invalidate(self):
+        # 視窗被蓋住又露出來之類的情況，下一幀整個重畫
+        self.drawn = [None] * 64; self.drawn_message = None; self.message_rect = None
+
+    def message(self, message):
+        if message not in self.messages: self.messages[message] = render_message(self.font, message)
+        return self.messages[message]
+
+    def render(self, board_state, selected_pos, valid_moves, message=None):
+        targets = {move[1] for move in valid_moves}
+        states = [(board_state[row][col], (row, col) == selected_pos, (row, col) in targets)
+                  for row in range(8) for col in range(8)]
+        dirty = {i for i in range(64) if states[i] != self.drawn[i]}
+        overlay, overlay_rect = self.message(message) if message else (None, None)
+        message_changed = message != self.drawn_message
+        if message_changed and self.message_rect is not None:
+            dirty.update(i for i in range(64) if self.square_rects[i].colliderect(self.message_rect)) # 擦掉舊訊息
+        # 訊息框是半透明的，底下的格子只要有一格要重畫，整塊都重畫再蓋一次，避免疊出深淺不一
+        covered = [i for i in range(64) if overlay_rect is not None and self.square_rects[i].colliderect(overlay_rect)]
+        redraw_overlay = overlay is not None and (message_changed or any(i in dirty for i in covered))
+        if redraw_overlay: dirty.update(covered)
+
+        rects = []
+        for i in sorted(dirty):
+            rect = self.square_rects[i]; piece, selected, target = states[i]
+            self.screen.blit(self.background, rect, rect)
+            if selected: self.screen.blit(self.highlight, rect)
+            if target: self.screen.blit(self.move_dot, rect)
+            if piece != '.': self.screen.blit(self.piece_images[piece], rect)
+            self.drawn[i] = states[i]; rects.append(rect)
+        if redraw_overlay:
+            self.screen.blit(overlay, overlay_rect); rects.append(overlay_rect)
+        if message_changed and self.message_rect is not None: rects.append(self.message_rect)
+        self.drawn_message = message; self.message_rect = overlay_rect
+        return rects
+
+STATUS_MESSAGES = {'waiting': "等待對手加入...", 'opponent_disconnected': "對手已斷線！",
+                   'opponent_reconnecting': "對手斷線，等待重新連線...", 'room_closed': "房間閒置太久，已關閉"}
+RESULT_TEXT = {chess_game.WHITE_WINS: "白方獲勝", chess_game.BLACK_WINS: "黑方獲勝", chess_game.DRAW: "和棋"}
+REASON_TEXT = {chess_game.CHECKMATE: "將死！", chess_game.STALEMATE: "逼和！", chess_game.FIFTY_MOVES: "50 步規則，",
+               chess_game.REPETITION: "三次重複局面，", chess_game.INSUFFICIENT_MATERIAL: "子力不足，"}
+
+def status_message(game_state):
+    if game_state['status'] == 'game_over':
+        result, reason = game_state['outcome']
+        return REASON_TEXT.get(reason, '') + RESULT_TEXT.get(result, result)
+    return STATUS_MESSAGES.get(game_state['status'])
 
 # --- 主程式 (WebSocket 大改造) ---
-def main():
+def main(max_fps=MAX_FPS, idle_wakeup_ms=IDLE_WAKEUP_MS):
     # 1. 初始化 & 資源載入
     pygame.init()
     screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
     font = pygame.font.SysFont("Arial", 50, bold=True)
     pygame.display.set_caption("華麗的西洋棋！正在連線...")
     piece_images = load_piece_images()
-    game_board = chess_game.Board()
+    # 棋盤由 PositionService 持有：socket.io 執行緒與畫面執行緒都透過 mutate() 修改，畫面只讀快照
+    positions = PositionService()
 
     # 2. NEW! 連線到 WebSocket 伺服器
     sio = socketio.Client()
     
     # 3. NEW! 定義事件處理器
-    game_state = {'status': 'connecting', 'room': None, 'my_color': None}
+    # seq 是本局目前的半回合數，跟伺服器的序號對齊；跳號或重新連線時靠它向伺服器要補傳
+    # token 是伺服器發的 session 憑證，斷線重連時帶著它就能回到原本的座位
+    game_state = {'status': 'connecting', 'room': None, 'my_color': None, 'seq': 0, 'token': None}
+
+    def notify_redraw():
+        # socket.io 的執行緒不能直接畫圖，丟一個事件讓主迴圈醒來重畫 (pygame.event.post 可以跨執行緒呼叫)
+        pygame.event.post(pygame.event.Event(REDRAW_EVENT))
+
+    def request_resync():
+        sio.emit('resync', {'room': game_state['room'], 'seq': protocol.pack_seq(game_state['seq'])})
 
     @sio.event
     def connect():
+        if game_state['room'] and (game_state.get('resume') or game_state['status'] == 'playing'):
+            print("重新連上伺服器！正在同步棋局...")
+            request_resync(); return
         print("成功連線到伺服器！正在加入遊戲...")
-        sio.emit('join_game', {'username': 'Player'})
+        sio.emit('join_game', {'username': 'Player', 'protocol': 'binary'})
 
     @sio.event
     def disconnect():
-        print("與伺服器斷線！"); game_state['status'] = 'disconnected'
+        print("與伺服器斷線！")
+        game_state['resume'] = game_state['status'] in ('playing', 'opponent_reconnecting') # 對局中斷線，重連後要接回座位
+        game_state['status'] = 'disconnected'; notify_redraw()
+
+    @sio.on('session')
+    def on_session(data):
+        game_state['token'] = data['token']
+        if data.get('room'):
+            # 在保留期內連回來了，座位還是我們的
+            game_state['status'] = 'playing'; game_state['room'] = data['room']; game_state['my_color'] = data['color']
+        elif game_state.get('resume'):
+            print("座位已經不保留了，這局無法繼續"); game_state['status'] = 'disconnected'
+        game_state['resume'] = False
+        notify_redraw()
 
     @sio.on('waiting_for_player')
     def on_waiting(data):
         game_state['status'] = 'waiting'; game_state['room'] = data['room']; game_state['my_color'] = 'white'
-        pygame.display.set_caption(f"等待對手... (你是白方)")
+        pygame.display.set_caption(f"等待對手... (你是白方)"); notify_redraw()
 
     @sio.on('game_start')
     def on_game_start(data):
         game_state['status'] = 'playing'; game_state['room'] = data['room']
         # 伺服器會告訴我們誰是白方誰是黑方
         game_state['my_color'] = 'white' if sio.sid == data['white'] else 'black'
-        pygame.display.set_caption(f"遊戲進行中！你是 {game_state['my_color']} 方")
+        pygame.display.set_caption(f"遊戲進行中！你是 {game_state['my_color']} 方"); notify_redraw()
 
     @sio.on('opponent_moved')
     def on_opponent_moved(move):
-        start_notation, end_notation = move
+        start_notation, end_notation = move[0], move[1]
         print(f"收到對手棋步: {start_notation} -> {end_notation}")
-        game_board.move_piece(start_notation, end_notation)
+        with positions.mutate() as game_board:
+            game_board.move_piece(start_notation, end_notation, *move[2:])
+            game_state['seq'] += 1
+        notify_redraw()
+
+    @sio.on('opponent_move_bin')
+    def on_opponent_move_bin(data):
+        seq, move = protocol.unpack_move(data)
+        with positions.mutate() as game_board:
+            if seq != game_state['seq']:
+                # 中間漏了封包 (或重複收到)，不要硬套，直接向伺服器要缺的部分
+                print(f"棋步序號不連續 (收到 {seq}，預期 {game_state['seq']})，向伺服器重新同步")
+                request_resync(); return
+            print(f"收到對手棋步: {chess_game.move_to_uci(move)}")
+            game_board.push_move(move)
+            game_state['seq'] += 1
+        notify_redraw()
+
+    @sio.on('move_ack')
+    def on_move_ack(data):
+        game_state['acked'] = protocol.unpack_seq(data)
+
+    @sio.on('move_rejected')
+    def on_move_rejected(data):
+        print(f"伺服器駁回了棋步 {data['move']}: {data['reason']}")
+        # 我們在送出時已經先在本地走了這步，被駁回就退回來，維持跟伺服器一致
+        with positions.mutate() as game_board:
+            if game_board.current_turn != game_state['my_color'] and game_board.move_stack:
+                game_board.unmake_move(); game_state['seq'] -= 1
+        notify_redraw()
+        if data['reason'] == 'out_of_sync':
+            request_resync()
+
+    @sio.on('resync')
+    def on_resync(data):
+        if 'error' in data:
+            print(f"無法同步棋局: {data['error']}"); game_state['status'] = 'disconnected'; notify_redraw(); return
+        if 'moves' in data and data['from'] != game_state['seq']:
+            # 本地已經跟伺服器對不上了，要一份完整的局面快照
+            sio.emit('resync', {'room': game_state['room'], 'seq': protocol.pack_seq(0xFFFF)}); return
+        with positions.mutate() as game_board:
+            game_state['seq'] = protocol.apply_resync(game_board, data)
+        notify_redraw()
 
     @sio.on('opponent_disconnected')
     def on_opponent_disconnected():
-        game_state['status'] = 'opponent_disconnected'
+        if game_state['status'] != 'game_over': game_state['status'] = 'opponent_disconnected'
+        notify_redraw()
+
+    @sio.on('opponent_reconnecting')
+    def on_opponent_reconnecting(data):
+        game_state['status'] = 'opponent_reconnecting'; notify_redraw()
+
+    @sio.on('opponent_reconnected')
+    def on_opponent_reconnected():
+        if game_state['status'] == 'opponent_reconnecting': game_state['status'] = 'playing'
+        notify_redraw()
+
+    @sio.on('room_closed')
+    def on_room_closed(data):
+        if game_state['status'] != 'game_over': game_state['status'] = 'room_closed'
+        notify_redraw()
+
+    @sio.on('game_over')
+    def on_game_over(data):
+        # 伺服器判定對局結束 (將死、逼和、50 步、三次重複、子力不足)
+        print(f"對局結束: {data['result']} ({data['reason']})")
+        game_state['status'] = 'game_over'; game_state['outcome'] = (data['result'], data['reason'])
+        pygame.display.set_caption(f"對局結束 {data['result']}"); notify_redraw()
 
     # 4. 建立連線
     server_address = input("請輸入伺服器網址 (本地測試請用 http://127.0.0.1:5000): ")
-    try: sio.connect(server_address)
+    try: sio.connect(server_address, auth=lambda: {'token': game_state['token']}) # 每次 (重新) 連線都帶上最新的 token
     except Exception as e: print(f"連線失敗: {e}"); return
 
     # 5. 狀態變數
     selected_piece_pos = None; valid_moves_for_piece = []
-    
+    renderer = BoardRenderer(screen, piece_images, font); clock = pygame.time.Clock()
+    pygame.event.set_blocked(pygame.MOUSEMOTION) # 滑鼠移動不影響畫面，不需要因此醒來
+
     running = True
     while running:
-        # 事件處理
-        for event in pygame.event.get():
+        # 事件處理：沒事做的時候阻塞在 event.wait (等對手時幾乎不吃 CPU)，有事件就連同後面排隊的一起處理
+        for event in [pygame.event.wait(idle_wakeup_ms)] + pygame.event.get():
             if event.type == pygame.QUIT: running = False
+            if event.type == pygame.VIDEOEXPOSE: renderer.invalidate()
             
-            if game_state['status'] == 'playing' and game_board.current_turn == game_state['my_color']:
+            if game_state['status'] == 'playing' and positions.snapshot().turn == game_state['my_color']:
                 if event.type == pygame.MOUSEBUTTONDOWN:
                     pixel_pos = pygame.mouse.get_pos(); col = pixel_pos[0] // SQUARE_SIZE; row = pixel_pos[1] // SQUARE_SIZE
                     clicked_pos = (row, col)
 
                     if selected_piece_pos:
-                        is_a_valid_move = any(move[1] == clicked_pos for move in valid_moves_for_piece)
-                        if is_a_valid_move:
-                            start_notation = game_board.coords_to_notation(selected_piece_pos)
-                            end_notation = game_board.coords_to_notation(clicked_pos)
-                            sio.emit('move', {'room': game_state['room'], 'move': (start_notation, end_notation)})
-                            game_board.move_piece(start_notation, end_notation)
+                        # 查表找棋步；選棋子之後局面若被網路改掉，查不到就當作沒點
+                        move = positions.find_move(selected_piece_pos, clicked_pos)
+                        if move is not None:
+                            with positions.mutate() as game_board:
+                                sio.emit('move_bin', protocol.pack_move(game_state['seq'], move))
+                                game_board.push_move(move)
+                                game_state['seq'] += 1
                         selected_piece_pos = None; valid_moves_for_piece = []
                     else:
-                        piece = game_board.get_piece(clicked_pos)
+                        piece = positions.snapshot().rows[row][col]
                         if piece != '.' and (piece.isupper() if game_state['my_color'] == 'white' else piece.islower()):
                             selected_piece_pos = clicked_pos
-                            all_legal_moves = game_board.generate_legal_moves(game_board.current_turn)
-                            valid_moves_for_piece = [move for move in all_legal_moves if move[0] == selected_piece_pos]
-
-        # 繪製畫面
-        draw_board(screen)
-        draw_highlights(screen, selected_piece_pos, valid_moves_for_piece)
-        draw_pieces(screen, game_board.board, piece_images)
-
-        # 繪製狀態訊息
-        if game_state['status'] == 'waiting':
-             draw_message(screen, font, "等待對手加入...")
-        elif game_state['status'] == 'opponent_disconnected':
-             draw_message(screen, font, "對手已斷線！")
-        # 這裡可以加入更多遊戲結束的判斷與繪圖
+                            valid_moves_for_piece = positions.moves_from(selected_piece_pos) # 背景已經算好的表，O(1)
 
-        pygame.display.flip()
+        # 繪製畫面：只送出有變動的格子 (和狀態訊息)
+        dirty_rects = renderer.render(positions.snapshot().rows, selected_piece_pos, valid_moves_for_piece,
+                                      status_message(game_state))
+        if dirty_rects: pygame.display.update(dirty_rects)
+        clock.tick(max_fps)
 
     sio.disconnect()
+    positions.close()
     pygame.quit()
 
 if __name__ == '__main__':
@@ -0,0 +1,184 @@
+# 壓力測試：一次開很多個 socket.io 機器人連到 server.py，配對後用 chess_game.Board 隨機下合法棋
+# 統計連線、配對、棋步轉送 (A 送出到 B 收到) 的延遲分佈 (p50/p95/p99)、吞吐量與錯誤數
+# 用法：python loadtest.py --url http://127.0.0.1:5000 --bots 1000 --move-rate 2
+# 伺服器等太久 (BOT_WAIT_SECONDS) 會改配電腦對手，那種局的轉送延遲包含引擎思考時間，另外統計；
+# 要完全排除就用 BOT_WAIT_SECONDS=0 啟動伺服器，或讓 --pairing-timeout 比它短
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter
+
+import socketio
+
+import chess_game
+import protocol
+
+BOT_SID_PREFIX = 'bot:' # 跟 server.BOT_SID_PREFIX 一樣：電腦對手的 sid
+
+class LatencyHistogram:
+    def __init__(self):
+        self.samples = []
+
+    def add(self, seconds): self.samples.append(seconds)
+
+    def percentile(self, p):
+        if not self.samples: return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+    def summary(self):
+        return (f"n={len(self.samples):<7} p50={self.percentile(50) * 1000:8.1f}ms  "
+                f"p95={self.percentile(95) * 1000:8.1f}ms  p99={self.percentile(99) * 1000:8.1f}ms  "
+                f"max={max(self.samples, default=0) * 1000:8.1f}ms")
+
+class LoadStats:
+    def __init__(self):
+        self.connect = LatencyHistogram()
+        self.pairing = LatencyHistogram()
+        self.relay = LatencyHistogram()
+        self.bot_relay = LatencyHistogram() # 對手是電腦的局：送出到收到電腦回應，含引擎思考時間
+        self.bot_games = 0
+        self.errors = Counter()
+        self.results = Counter() # 伺服器判定的結束原因 (checkmate、stalemate ...)
+        self.moves_sent = 0
+        self.games_finished = 0
+        self.relay_sent = {} # (房間, 第幾手) -> 送出時間，讓收到的一方算出轉送延遲
+
+async def play_one_game(bot_id, args, stats):
+    sio = socketio.AsyncClient(reconnection=False)
+    board = chess_game.Board()
+    state = {'room': None, 'color': None, 'join_sent': 0.0, 'bot': False}
+    game_started = asyncio.Event(); my_turn = asyncio.Event(); game_over = asyncio.Event()
+
+    @sio.on('game_start')
+    async def on_game_start(data):
+        state['room'] = data['room']
+        state['color'] = 'white' if sio.sid == data['white'] else 'black'
+        state['bot'] = data['black' if state['color'] == 'white' else 'white'].startswith(BOT_SID_PREFIX)
+        if state['bot']: stats.bot_games += 1
+        else: stats.pairing.add(time.perf_counter() - state['join_sent'])
+        game_started.set()
+        if state['color'] == 'white': my_turn.set()
+
+    @sio.on('opponent_moved')
+    async def on_opponent_moved(move):
+        sent_at = stats.relay_sent.pop((state['room'], len(board.move_stack)), None)
+        if sent_at is not None: (stats.bot_relay if state['bot'] else stats.relay).add(time.perf_counter() - sent_at)
+        parsed = chess_game.parse_uci(''.join(move))
+        if parsed is None:
+            stats.errors['bad_relay'] += 1; game_over.set(); return
+        board.push_move(parsed)
+        my_turn.set()
+
+    @sio.on('move_rejected')
+    async def on_move_rejected(data):
+        stats.errors[f"rejected:{data.get('reason')}"] += 1
+        game_over.set()
+
+    @sio.on('opponent_disconnected')
+    async def on_opponent_disconnected(*_):
+        game_over.set(); my_turn.set()
+
+    @sio.on('opponent_reconnecting')
+    async def on_opponent_reconnecting(*_):
+        # 到了 --max-plies 雙方都會主動斷線，先走的那個在伺服器看來也是斷線，這不算錯誤
+        if len(board.move_stack) < args.max_plies:
+            stats.errors['opponent_dropped'] += 1
+        game_over.set(); my_turn.set()
+
+    @sio.on('room_closed')
+    async def on_room_closed(*_):
+        game_over.set(); my_turn.set()
+
+    @sio.on('game_over')
+    async def on_game_over(data):
+        stats.results[data.get('reason')] += 1
+        game_over.set(); my_turn.set()
+
+    @sio.event
+    async def disconnect():
+        game_over.set(); my_turn.set()
+
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(sio.connect(args.url, transports=['websocket']), args.timeout)
+    except Exception as e:
+        stats.errors[f"connect:{type(e).__name__}"] += 1
+        return
+    stats.connect.add(time.perf_counter() - started)
+
+    try:
+        state['join_sent'] = time.perf_counter()
+        await sio.emit('join_game', {'username': f'bot{bot_id}'})
+        try:
+            await asyncio.wait_for(game_started.wait(), args.pairing_timeout)
+        except asyncio.TimeoutError:
+            stats.errors['pairing_timeout'] += 1
+            return
+
+        while not game_over.is_set():
+            await my_turn.wait(); my_turn.clear()
+            if game_over.is_set() or len(board.move_stack) >= args.max_plies:
+                break
+            await asyncio.sleep(random.expovariate(args.move_rate) if args.move_rate > 0 else 0)
+            moves = list(board.iter_moves())
+            if not moves:
+                break # 將死或逼和，由斷線通知對手
+            move = random.choice(moves)
+            stats.relay_sent[(state['room'], len(board.move_stack))] = time.perf_counter()
+            board.push_move(move)
+            await sio.emit('move', {'room': state['room'], 'move': protocol.move_to_notation(move)})
+            stats.moves_sent += 1
+            if len(board.move_stack) >= args.max_plies:
+                break # 對手收到這一步也會停，雙方停在同一手
+        stats.games_finished += 1
+    finally:
+        await sio.disconnect()
+
+async def run_bot(bot_id, args, stats, deadline):
+    for _ in range(args.games_per_bot):
+        if time.perf_counter() > deadline: break
+        await play_one_game(bot_id, args, stats)
+
+async def run(args):
+    stats = LoadStats()
+    deadline = time.perf_counter() + args.duration
+    started = time.perf_counter()
+    tasks = []
+    for bot_id in range(args.bots):
+        tasks.append(asyncio.create_task(run_bot(bot_id, args, stats, deadline)))
+        if args.ramp > 0: await asyncio.sleep(1 / args.ramp) # 控制每秒新增幾個連線
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    print(f"\n=== {args.bots} 個機器人，共 {elapsed:.1f}s ===")
+    print(f"connect  {stats.connect.summary()}")
+    print(f"pairing  {stats.pairing.summary()}")
+    print(f"relay    {stats.relay.summary()}")
+    if stats.bot_games:
+        print(f"bot      {stats.bot_games} 局配到電腦對手 (不算在 pairing/relay 裡)，回應 {stats.bot_relay.summary()}")
+    print(f"moves sent {stats.moves_sent}  ({stats.moves_sent / elapsed:.1f} moves/s)  games finished {stats.games_finished}")
+    if stats.results:
+        print("results  " + ", ".join(f"{name}={count}" for name, count in stats.results.most_common()))
+    if stats.errors:
+        print("errors   " + ", ".join(f"{name}={count}" for name, count in stats.errors.most_common()))
+    return stats
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='server.py 的壓力測試')
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--bots', type=int, default=100, help='同時在線的機器人數量 (兩兩配成一局)')
+    parser.add_argument('--move-rate', type=float, default=1.0, help='每個機器人輪到自己時平均每秒下幾步 (0 代表立刻下)')
+    parser.add_argument('--max-plies', type=int, default=200, help='每局最多幾個半回合')
+    parser.add_argument('--games-per-bot', type=int, default=1)
+    parser.add_argument('--duration', type=float, default=300.0, help='超過這個秒數就不再開新局')
+    parser.add_argument('--ramp', type=float, default=200.0, help='每秒新增幾個連線 (0 代表一次全開)')
+    parser.add_argument('--timeout', type=float, default=10.0, help='連線逾時秒數')
+    parser.add_argument('--pairing-timeout', type=float, default=20.0,
+                        help='等配對的秒數；預設比伺服器的 BOT_WAIT_SECONDS (30) 短，等不到人就算逾時而不是改跟電腦下')
+    args = parser.parse_args(argv)
+    asyncio.run(run(args))
+
+if __name__ == '__main__':
+    main()
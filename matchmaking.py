@@ -0,0 +1,136 @@
+# 配對與房間登記：等待中的房間排在 FIFO 佇列裡，房間依狀態建立索引，加入、配對、離開都是 O(1)
+from collections import OrderedDict
+
+WAITING, PLAYING, FINISHED = 'waiting', 'playing', 'finished'
+ROOM_STATES = (WAITING, PLAYING, FINISHED)
+
+class Room:
+    __slots__ = ('room_id', 'players', 'state', 'bucket', 'board')
+
+    def __init__(self, room_id, bucket=None):
+        self.room_id = room_id
+        self.players = [] # players[0] 是白方，players[1] 是黑方
+        self.state = WAITING
+        self.bucket = bucket
+        self.board = None # 開局後由伺服器放上權威棋盤
+
+    def color_of(self, sid):
+        if self.players and self.players[0] == sid: return 'white'
+        if len(self.players) > 1 and self.players[1] == sid: return 'black'
+        return None
+
+    def opponent_of(self, sid):
+        for player in self.players:
+            if player != sid: return player
+        return None
+
+class MatchmakingQueue:
+    # 每個分組 (積分區間、時間制) 各自一條 FIFO；OrderedDict 讓取出最早的與中途移除都是 O(1)
+    def __init__(self, rating_bucket_width=200):
+        self.rating_bucket_width = rating_bucket_width
+        self._buckets = {}
+        self._bucket_of = {}
+
+    def bucket_for(self, time_control=None, rating=None):
+        # 兩個值都來自客戶端：時間制只接受字串或整數，積分不是數字就當作沒給，其他型別一律忽略 (分組要能當 dict 的鍵)
+        if not isinstance(time_control, (str, int)) or isinstance(time_control, bool):
+            time_control = None
+        try:
+            rating_bucket = None if rating is None else int(rating) // self.rating_bucket_width
+        except (TypeError, ValueError, OverflowError):
+            rating_bucket = None
+        return (time_control, rating_bucket)
+
+    def enqueue(self, room_id, bucket=None):
+        self._buckets.setdefault(bucket, OrderedDict())[room_id] = True
+        self._bucket_of[room_id] = bucket
+
+    def pop(self, bucket=None):
+        # 取出這個分組裡等最久的房間，沒有人在等就回傳 None
+        waiting = self._buckets.get(bucket)
+        if not waiting:
+            return None
+        room_id, _ = waiting.popitem(last=False)
+        del self._bucket_of[room_id]
+        if not waiting: del self._buckets[bucket]
+        return room_id
+
+    def remove(self, room_id):
+        bucket = self._bucket_of.pop(room_id, None)
+        waiting = self._buckets.get(bucket)
+        if waiting is None or room_id not in waiting:
+            return False
+        del waiting[room_id]
+        if not waiting: del self._buckets[bucket]
+        return True
+
+    def __contains__(self, room_id): return room_id in self._bucket_of
+    def __len__(self): return len(self._bucket_of)
+
+class RoomRegistry:
+    # 房間總表，另外維護「狀態 -> 房間」與「sid -> 房間」兩個索引，不必為了找房間掃描全部
+    def __init__(self):
+        self.rooms = {}
+        self.sid_to_room = {}
+        self._by_state = {state: set() for state in ROOM_STATES}
+
+    def create(self, room_id, sid, bucket=None):
+        # 房號必須唯一：蓋掉還有人坐著的舊房間，舊房間玩家的 sid 對應就會指到別人的棋局
+        if room_id in self.rooms:
+            raise ValueError(f"房號 {room_id} 已經存在")
+        room = Room(room_id, bucket)
+        self.rooms[room_id] = room
+        self._by_state[WAITING].add(room_id)
+        self.add_player(room, sid)
+        return room
+
+    def add_player(self, room, sid):
+        room.players.append(sid)
+        self.sid_to_room[sid] = room.room_id
+
+    def rebind(self, old_sid, new_sid):
+        # 玩家重新連線換了 sid：座位 (顏色) 不變，只換掉對應
+        room = self.room_of(old_sid)
+        if room is None:
+            return None
+        room.players[room.players.index(old_sid)] = new_sid
+        del self.sid_to_room[old_sid]
+        self.sid_to_room[new_sid] = room.room_id
+        return room
+
+    def leave(self, sid):
+        # 玩家離開結束的房間：只清掉他的 sid 對應，座位 (顏色) 留著，房間等所有人都走了再關
+        room = self.room_of(sid)
+        if room is not None: del self.sid_to_room[sid]
+        return room
+
+    def seated(self, room):
+        return [sid for sid in room.players if self.sid_to_room.get(sid) == room.room_id]
+
+    def set_state(self, room, state):
+        self._by_state[room.state].discard(room.room_id)
+        room.state = state
+        self._by_state[state].add(room.room_id)
+
+    def get(self, room_id): return self.rooms.get(room_id)
+
+    def room_of(self, sid):
+        room_id = self.sid_to_room.get(sid)
+        return None if room_id is None else self.rooms.get(room_id)
+
+    def remove(self, room_id):
+        # 關閉房間時，連同房內所有玩家的 sid 對應一起清掉
+        room = self.rooms.pop(room_id, None)
+        if room is None:
+            return None
+        self._by_state[room.state].discard(room_id)
+        for sid in room.players:
+            if self.sid_to_room.get(sid) == room_id: del self.sid_to_room[sid]
+        return room
+
+    def count(self, state=None):
+        return len(self.rooms) if state is None else len(self._by_state[state])
+
+    def room_ids(self, state): return self._by_state[state]
+
+    def __len__(self): return len(self.rooms)
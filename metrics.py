@@ -0,0 +1,169 @@
+# 伺服器的觀測數據：計數器 (counter)、量表 (gauge)、延遲直方圖 (histogram)，用 Prometheus 的文字格式輸出
+# 熱路徑上只是對 dict 裡的數字加一；量表可以給一個 collect 函式，被抓取 (/metrics) 時才計算，平常零成本
+# EventLog 是抽樣、不阻塞的結構化日誌：呼叫端只把一筆 dict 丟進有上限的佇列，背景執行緒寫成 JSON lines
+import bisect
+import functools
+import json
+import queue
+import random
+import sys
+import threading
+import time
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra: pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _number(value):
+    if value == float('inf'): return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, help_text, labels=(), collect=None):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        self.collect = collect # 有給的話，抓取時呼叫它取得 {標籤值 tuple: 數值} 或單一數值
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def samples(self):
+        if self.collect is None:
+            with self._lock:
+                return list(self._values.items())
+        values = self.collect()
+        return list(values.items()) if isinstance(values, dict) else [((), values)]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        for label_values, value in self.samples():
+            lines.append(f"{self.name}{_labels(self.label_names, label_values)} {_number(value)}")
+        return lines
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, *label_values):
+        with self._lock: self._values[label_values] = value
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *label_values):
+        # 每個標籤組合存 [各區間的次數..., 總和]；輸出時才累加成 Prometheus 要的「小於等於」次數
+        with self._lock:
+            counts = self._values.get(label_values)
+            if counts is None:
+                counts = self._values[label_values] = [0] * (len(self.buckets) + 2)
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        for label_values, counts in self.samples():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, label_values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, label_values)} {_number(counts[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, label_values)} {cumulative}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labels=(), collect=None):
+        return self._add(Counter(name, help_text, labels, collect))
+
+    def gauge(self, name, help_text, labels=(), collect=None):
+        return self._add(Gauge(name, help_text, labels, collect))
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help_text, labels, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+def timed(latency, errors, name):
+    # 包住一個處理函式：記錄耗時 (直方圖的 _count 就是呼叫次數)，丟出例外時錯誤計數加一
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return handler(*args, **kwargs)
+            except Exception:
+                errors.inc(name)
+                raise
+            finally:
+                latency.observe(time.perf_counter() - started, name)
+        return wrapper
+    return decorator
+
+class EventLog:
+    # sample_rate 是預設的抽樣比例；個別事件可以用 sample=1.0 強制一定記錄 (例如少見但重要的事件)
+    # 佇列滿了 (寫不夠快) 就直接丟掉並計數，絕不讓呼叫端等待
+    def __init__(self, stream=sys.stdout, sample_rate=1.0, max_pending=10000):
+        self.stream = stream
+        self.sample_rate = sample_rate
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, name='event-log', daemon=True)
+        self._thread.start()
+
+    def event(self, name, sample=None, **fields):
+        rate = self.sample_rate if sample is None else sample
+        if rate < 1.0 and random.random() >= rate:
+            return
+        fields['event'] = name
+        fields['ts'] = round(time.time(), 3)
+        if rate < 1.0: fields['sample_rate'] = rate # 分析時乘回 1 / sample_rate 就是實際數量
+        try:
+            self._queue.put_nowait(fields)
+        except queue.Full:
+            self.dropped += 1
+
+    def pending(self): return self._queue.qsize()
+
+    def _run(self):
+        while True:
+            record = self._queue.get()
+            self.stream.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+            if self._queue.empty():
+                self.stream.flush() # 一批寫完才 flush 一次
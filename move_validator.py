@@ -0,0 +1,34 @@
+# 伺服器端的棋步驗證：真正的規則檢查丟到行程池 (或執行緒池) 裡做，不佔用 eventlet 的事件迴圈
+import chess_game
+from worker_pool import WorkerPool
+
+def validate_move(fen, uci):
+    # 在 worker 裡執行：從 FEN 還原局面，確認這步棋真的合法
+    # 回傳 (整數棋步, None, 走完後對方還有沒有合法棋步) 或 (None, 拒絕原因, None)；沒指定升變的兵走到底線視為升后
+    # 第三個值直接交給 Board.outcome(has_moves)，產生棋步這件最貴的事就不必回到事件迴圈上再做一次
+    move = chess_game.parse_uci(uci)
+    if move is None:
+        return None, 'bad_format', None
+    board = chess_game.Board.from_fen(fen)
+    from_sq, to_sq, promotion = chess_game.decode_move(move)
+    code = board.squares[from_sq]
+    if code == chess_game.EMPTY:
+        return None, 'empty_square', None
+    if code >> 3 != board.side:
+        return None, 'not_your_piece', None
+    for legal in board.iter_moves(origin=from_sq):
+        if (legal >> 6) & 63 == to_sq and (legal >> 12 == promotion or (promotion == 0 and legal >> 12 == chess_game.QUEEN)):
+            board.push_move(legal)
+            return legal, None, board.has_legal_move()
+    return None, 'illegal_move', None
+
+class MoveValidator:
+    # workers=0 代表直接在呼叫端驗證 (測試或單機除錯用)；sleep 見 WorkerPool
+    def __init__(self, workers=None, use_processes=True, sleep=None):
+        self._pool = WorkerPool(workers, use_processes, name='move-validator', sleep=sleep)
+        self.workers = self._pool.workers
+
+    def validate(self, fen, uci):
+        return self._pool.run(validate_move, fen, uci)
+
+    def shutdown(self): self._pool.shutdown()
@@ -0,0 +1,119 @@
+# 開局庫：離線從 PGN 建好，執行時用 mmap 直接查，不需要啟動時解析，多個 worker 行程共用同一份頁面快取
+# 檔案格式：
+#   標頭 16 bytes：魔術字 b'CHESSBK1' + 筆數 (uint64)
+#   之後每筆 12 bytes：局面的 Zobrist 雜湊 (uint64)、棋步 (uint16，chess_game 的編碼)、權重 (uint16)
+#   依 (雜湊, 權重由大到小) 排序，同一個局面的棋步連在一起，查詢就是一次二分搜尋
+# 建庫：python opening_book.py build games.pgn book.bin --plies 20
+import mmap
+import random
+import struct
+from collections import Counter
+
+import chess_game
+import pgn
+
+MAGIC = b'CHESSBK1'
+HEADER = struct.Struct('>8sQ')
+ENTRY = struct.Struct('>QHH')
+KEY = struct.Struct('>Q')
+MAX_WEIGHT = 0xFFFF
+
+def build_book(games, plies=20, min_weight=1):
+    # 把每局前 plies 個半回合的 (局面, 棋步) 累計起來：贏棋那方的棋步 2 分、和棋 1 分、輸棋那方不計
+    # 回傳排序好的 [(雜湊, 棋步, 權重)]
+    points = Counter()
+    for game in games:
+        result = game.headers.get('Result')
+        board = chess_game.Board()
+        for san in game.moves[:plies]:
+            move = board.parse_san(san)
+            if move is None:
+                break # 不合法或看不懂的棋步，這局後面都不採用
+            mover = board.side
+            score = 1 if result == '1/2-1/2' else 2 if result == ('1-0' if mover == chess_game.WHITE else '0-1') else 0
+            if score: points[board.zobrist_key, move] += score
+            board.push_move(move)
+    top = max(points.values(), default=0)
+    scale = MAX_WEIGHT / top if top > MAX_WEIGHT else 1 # 權重只有 16 位元，太大就等比例縮小
+    entries = [(key, move, max(1, int(weight * scale))) for (key, move), weight in points.items() if weight >= min_weight]
+    entries.sort(key=lambda entry: (entry[0], -entry[2], entry[1]))
+    return entries
+
+def write_book(path, entries):
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(entries)))
+        for entry in entries:
+            f.write(ENTRY.pack(*entry))
+
+class OpeningBook:
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._count = HEADER.unpack_from(self._data, 0)
+        if magic != MAGIC or HEADER.size + self._count * ENTRY.size > len(self._data):
+            self.close()
+            raise ValueError(f"{path} 不是開局庫檔案")
+
+    def __len__(self): return self._count
+
+    def _key_at(self, index):
+        return KEY.unpack_from(self._data, HEADER.size + index * ENTRY.size)[0]
+
+    def entries(self, key):
+        # 這個雜湊的所有 (棋步, 權重)，權重大的在前
+        low, high = 0, self._count
+        while low < high: # 找第一筆 >= key 的位置
+            mid = (low + high) // 2
+            if self._key_at(mid) < key: low = mid + 1
+            else: high = mid
+        found = []
+        offset = HEADER.size + low * ENTRY.size
+        while low < self._count:
+            entry_key, move, weight = ENTRY.unpack_from(self._data, offset)
+            if entry_key != key: break
+            found.append((move, weight))
+            low += 1; offset += ENTRY.size
+        return found
+
+    def moves(self, board):
+        # 只留下在這個局面真的合法的棋步 (防雜湊碰撞)
+        candidates = self.entries(board.zobrist_key)
+        if not candidates:
+            return []
+        legal = set(board.analyze_position()[0])
+        return [(move, weight) for move, weight in candidates if move in legal]
+
+    def pick(self, board, rng=random):
+        # 依權重隨機挑一步，讓開局有變化；不在庫裡回傳 None
+        candidates = self.moves(board)
+        if not candidates:
+            return None
+        return rng.choices([move for move, _ in candidates], weights=[weight for _, weight in candidates])[0]
+
+    def close(self):
+        self._data.close(); self._file.close()
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='從 PGN 建立開局庫')
+    parser.add_argument('command', choices=['build', 'show'])
+    parser.add_argument('paths', nargs='+', help='build: PGN 檔... 輸出檔；show: 開局庫檔')
+    parser.add_argument('--plies', type=int, default=20, help='每局只取前幾個半回合')
+    parser.add_argument('--min-weight', type=int, default=2, help='權重低於這個值的棋步不收')
+    parser.add_argument('--fen', default=chess_game.START_FEN, help='show: 要查的局面')
+    args = parser.parse_args()
+    if args.command == 'build':
+        *sources, output = args.paths
+        def all_games():
+            for source in sources:
+                with open(source, encoding='utf-8', errors='replace') as f:
+                    yield from pgn.read_games(f)
+        entries = build_book(all_games(), args.plies, args.min_weight)
+        write_book(output, entries)
+        print(f"寫入 {len(entries)} 筆到 {output}")
+    else:
+        book = OpeningBook(args.paths[0])
+        board = chess_game.Board.from_fen(args.fen)
+        for move, weight in book.moves(board):
+            print(f"{chess_game.move_to_uci(move)}  {weight}")
+        book.close()
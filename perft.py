@@ -0,0 +1,111 @@
+# perft：數出固定深度內所有合法棋步的節點數，拿來驗證 chess_game 的走子產生器，也當作效能基準
+# 用法：
+#   python -m perft                          # 跑整套基準局面，比對節點數並回報 nodes/sec
+#   python -m perft --depth 4 --divide       # 起始局面 perft 4，列出每個第一步各自的節點數
+#   python -m perft --fen "<FEN>" --depth 3
+import argparse
+import sys
+import time
+
+import chess_game
+
+# 標準測試局面與已知的節點數 {深度: 節點數}
+BENCH_POSITIONS = (
+    ('start', chess_game.START_FEN, {1: 20, 2: 400, 3: 8902, 4: 197281, 5: 4865609}),
+    ('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+     {1: 48, 2: 2039, 3: 97862, 4: 4085603}),
+    ('position3', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1', {1: 14, 2: 191, 3: 2812, 4: 43238, 5: 674624}),
+    ('position4', 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+     {1: 6, 2: 264, 3: 9467, 4: 422333}),
+    ('position5', 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8', {1: 44, 2: 1486, 3: 62379, 4: 2103487}),
+    ('position6', 'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10',
+     {1: 46, 2: 2079, 3: 89890, 4: 3894594}),
+    # 吃過路兵、王車易位、升變的邊界情況
+    ('ep_illegal_pin', '3k4/3p4/8/K1P4r/8/8/8/8 b - - 0 1', {6: 1134888}),
+    ('ep_capture_gives_check', '8/8/1k6/2b5/2pP4/8/5K2/8 b - d3 0 1', {6: 1440467}),
+    ('short_castle_gives_check', '5k2/8/8/8/8/8/8/4K2R w K - 0 1', {6: 661072}),
+    ('long_castle_gives_check', '3k4/8/8/8/8/8/8/R3K3 w Q - 0 1', {6: 803711}),
+    ('castling_rights', 'r3k2r/1b4bq/8/8/8/8/7B/R3K2R w KQkq - 0 1', {4: 1274206}),
+    ('castling_prevented', 'r3k2r/8/3Q4/8/8/5q2/8/R3K2R b KQkq - 0 1', {4: 1720476}),
+    ('promote_out_of_check', '2K2r2/4P3/8/8/8/8/8/3k4 w - - 0 1', {6: 3821001}),
+    ('discovered_check', '8/8/1P2K3/8/2n5/1q6/8/5k2 b - - 0 1', {5: 1004658}),
+    ('promote_to_give_check', '4k3/1P6/8/8/8/8/K7/8 w - - 0 1', {6: 217342}),
+    ('underpromote_to_give_check', '8/P1k5/K7/8/8/8/8/8 w - - 0 1', {6: 92683}),
+    ('self_stalemate', 'K1k5/8/P7/8/8/8/8/8 w - - 0 1', {6: 2217}),
+    ('stalemate_and_checkmate', '8/k1P5/8/1K6/8/8/8/8 w - - 0 1', {7: 567584}),
+    ('stalemate_and_checkmate_2', '8/8/2k5/5q2/5n2/8/5K2/8 b - - 0 1', {4: 23527}),
+)
+
+def perft(board, depth):
+    if depth <= 0:
+        return 1
+    moves = list(board.iter_moves())
+    if depth == 1:
+        return len(moves) # 最後一層只要數合法棋步，不必真的走下去
+    nodes = 0
+    for move in moves:
+        board.push_move(move)
+        nodes += perft(board, depth - 1)
+        board.unmake_move()
+    return nodes
+
+def divide(board, depth):
+    # 把 perft 拆成每個第一步各自的節點數，跟其他引擎比對時可以快速找出是哪一步算錯
+    results = []
+    for move in list(board.iter_moves()):
+        board.push_move(move)
+        results.append((chess_game.move_to_uci(move), perft(board, depth - 1)))
+        board.unmake_move()
+    return sorted(results)
+
+def run_benchmark(max_nodes=500000, names=None, out=print):
+    # 每個局面從淺到深逐層跑 (預期節點數超過 max_nodes 的深度就跳過)，回報每一層的耗時與 nodes/sec
+    failures = 0; total_nodes = 0; total_time = 0.0
+    for name, fen, expected in BENCH_POSITIONS:
+        if names and name not in names:
+            continue
+        for depth, expected_nodes in sorted(expected.items()):
+            if expected_nodes > max_nodes:
+                continue
+            board = chess_game.Board.from_fen(fen)
+            started = time.perf_counter()
+            nodes = perft(board, depth)
+            elapsed = time.perf_counter() - started
+            total_nodes += nodes; total_time += elapsed
+            status = 'ok' if nodes == expected_nodes else f'FAIL (expected {expected_nodes})'
+            if nodes != expected_nodes: failures += 1
+            out(f"{name:<28} depth {depth}  nodes {nodes:>9}  {elapsed:8.3f}s  {nodes / max(elapsed, 1e-9):>10.0f} nps  {status}")
+    out(f"{'total':<28}          nodes {total_nodes:>9}  {total_time:8.3f}s  {total_nodes / max(total_time, 1e-9):>10.0f} nps")
+    if failures:
+        out(f"{failures} 個節點數對不上！")
+    return failures == 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='chess_game 走子產生器的 perft 驗證與效能基準')
+    parser.add_argument('--fen', help='要計算的局面，沒給就跑整套基準 (或搭配 --depth 算起始局面)')
+    parser.add_argument('--depth', type=int, help='perft 深度')
+    parser.add_argument('--divide', action='store_true', help='列出每個第一步各自的節點數')
+    parser.add_argument('--max-nodes', type=int, default=500000, help='基準模式下，預期節點數超過這個值的深度就跳過')
+    parser.add_argument('--position', action='append', help='基準模式只跑指定名稱的局面 (可重複)')
+    args = parser.parse_args(argv)
+
+    if args.fen is None and args.depth is None:
+        return 0 if run_benchmark(args.max_nodes, args.position) else 1
+
+    board = chess_game.Board.from_fen(args.fen or chess_game.START_FEN)
+    depth = args.depth or 1
+    started = time.perf_counter()
+    if args.divide:
+        results = divide(board, depth)
+        for uci, count in results:
+            print(f"{uci}: {count}")
+        nodes = sum(count for _, count in results)
+        print(f"\n共 {len(results)} 步")
+    else:
+        nodes = perft(board, depth)
+    elapsed = time.perf_counter() - started
+    print(f"nodes {nodes}  time {elapsed:.3f}s  {nodes / max(elapsed, 1e-9):.0f} nps")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,74 @@
+# PGN 讀取：一行一行串流，一次只在記憶體裡留一局，多大的檔案都可以讀
+# read_games(檔案) 逐局產生 PgnGame(headers, moves, line, move_lines)
+#   moves 是 SAN 字串列表，line 是這局在檔案裡的起始行號，move_lines 是每一步所在的行號 (回報錯誤位置用)
+# SAN 轉成棋步由 Board.parse_san / Board.apply_san 負責
+import re
+from collections import namedtuple
+
+PgnGame = namedtuple('PgnGame', 'headers moves line move_lines')
+
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+HEADER_RE = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+MOVE_NUMBER_RE = re.compile(r'^\d+\.+')
+
+def _movetext_tokens(text, state):
+    # 去掉 {註解}、;行尾註解、(變化)、$NAG 之後剩下的記號；註解和變化可以跨行，所以深度存在 state 裡
+    token = []
+    i = 0
+    while i < len(text):
+        ch = text[i]
+        if state['comment']:
+            if ch == '}': state['comment'] = False
+        elif ch == '{':
+            state['comment'] = True
+        elif ch == ';':
+            break
+        elif ch == '(':
+            state['variation'] += 1
+        elif ch == ')':
+            state['variation'] = max(0, state['variation'] - 1)
+        elif state['variation']:
+            pass
+        elif ch.isspace():
+            if token: yield ''.join(token); token = []
+        else:
+            token.append(ch)
+            i += 1
+            continue
+        if token: yield ''.join(token); token = []
+        i += 1
+    if token: yield ''.join(token)
+
+def read_games(stream):
+    headers, moves, move_lines, start_line = {}, [], [], None
+    state = {'comment': False, 'variation': 0}
+    in_movetext = False
+    for line_number, line in enumerate(stream, 1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', 'replace')
+        stripped = line.strip()
+        if not state['comment'] and not state['variation'] and stripped.startswith('['):
+            if in_movetext:
+                # 上一局沒有結果記號就接著下一局的標頭，照樣當成一局結束
+                yield PgnGame(headers, moves, start_line, move_lines)
+                headers, moves, move_lines, start_line, in_movetext = {}, [], [], None, False
+            match = HEADER_RE.match(stripped)
+            if match:
+                headers[match.group(1)] = match.group(2).replace('\\"', '"')
+                if start_line is None: start_line = line_number
+            continue
+        if stripped.startswith('%'):
+            continue # PGN 的跳脫行
+        for token in _movetext_tokens(line, state):
+            if start_line is None: start_line = line_number
+            in_movetext = True
+            if token in RESULTS:
+                headers.setdefault('Result', token)
+                yield PgnGame(headers, moves, start_line, move_lines)
+                headers, moves, move_lines, start_line, in_movetext = {}, [], [], None, False
+                continue
+            token = MOVE_NUMBER_RE.sub('', token)
+            if token and not token.startswith('$'):
+                moves.append(token); move_lines.append(line_number)
+    if moves or headers:
+        yield PgnGame(headers, moves, start_line, move_lines)
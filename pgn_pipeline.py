@@ -0,0 +1,170 @@
+# 大量棋譜的驗證與統計：串流讀 PGN → 分批丟進行程池用 chess_game 的規則重走一遍 → 依原本順序收回結果
+# 同時在處理中的批次有上限，記憶體用量跟檔案大小無關，幾 GB 的棋譜也是一局一局流過去
+# 用法：python pgn_pipeline.py games.pgn [更多檔案...] --workers 8 --jsonl results.jsonl
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+import chess_game
+import pgn
+
+def new_result(headers, line):
+    return {'line': line, 'white': headers.get('White'), 'black': headers.get('Black'),
+            'result': headers.get('Result', '*'), 'plies': 0, 'captures': 0, 'checks': 0, 'castles': 0,
+            'promotions': 0, 'error': None, 'outcome': None, 'result_mismatch': False}
+
+def analyze_game(game):
+    # 在 worker 裡執行；棋譜是不受信任的輸入，任何一局出了意料之外的錯都只記在那一局 ('internal_error')，
+    # 不能讓整批、整個幾 GB 的串流跟著停下來
+    try:
+        return replay_game(game)
+    except Exception as error:
+        headers, _, line, _ = game
+        result = new_result(headers, line)
+        result['error'] = {'ply': None, 'move': None, 'san': None, 'line': line, 'reason': 'internal_error',
+                           'detail': repr(error)}
+        return result
+
+def replay_game(game):
+    # 從頭走一遍並統計；遇到不合法的棋步就停在那裡，回報它在檔案裡的位置
+    headers, moves, line, move_lines = game
+    board = chess_game.Board()
+    result = new_result(headers, line)
+    if 'FEN' in headers:
+        try:
+            board.set_fen(headers['FEN'])
+        except ValueError:
+            result['error'] = {'ply': 0, 'move': None, 'san': None, 'line': line, 'reason': 'bad_fen'}
+            return result
+    start_ply = (board.fullmove_number - 1) * 2 + board.side
+    squares = board.squares
+    for ply, san in enumerate(moves):
+        move = board.parse_san(san)
+        if move is None:
+            number = (start_ply + ply) // 2 + 1
+            result['error'] = {'ply': ply, 'move': f"{number}{'.' if board.side == chess_game.WHITE else '...'} {san}",
+                               'san': san, 'line': move_lines[ply], 'reason': 'illegal_move'}
+            break
+        from_sq, to_sq, promotion = chess_game.decode_move(move)
+        p_type = squares[from_sq] & 7
+        if squares[to_sq] or (p_type == chess_game.PAWN and from_sq & 7 != to_sq & 7):
+            result['captures'] += 1
+        if p_type == chess_game.KING and abs(to_sq - from_sq) == 2:
+            result['castles'] += 1
+        if promotion:
+            result['promotions'] += 1
+        board.push_move(move)
+        if board._in_check(board.side):
+            result['checks'] += 1
+    result['plies'] = len(board.move_stack)
+    if result['error'] is None:
+        outcome = board.outcome()
+        if outcome is not None:
+            result['outcome'] = list(outcome)
+            # 棋盤上已經將死或逼和，標頭卻寫別的結果
+            decisive = outcome[1] in (chess_game.CHECKMATE, chess_game.STALEMATE)
+            result['result_mismatch'] = decisive and result['result'] != outcome[0]
+    return result
+
+def analyze_batch(batch):
+    return [analyze_game(game) for game in batch]
+
+def run_pipeline(stream, workers=None, batch_size=256, max_pending=None, executor=None):
+    # 逐局產生 analyze_game 的結果，順序跟檔案裡一樣；workers=0 代表直接在目前行程處理
+    workers = (os.cpu_count() or 1) if workers is None else workers
+    max_pending = max_pending or max(2, workers * 2)
+    own_executor = executor is None and workers > 0
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    pending = deque()
+    batch = []
+    try:
+        for game in pgn.read_games(stream):
+            batch.append(tuple(game))
+            if len(batch) < batch_size:
+                continue
+            if executor is None:
+                yield from analyze_batch(batch)
+            else:
+                pending.append(executor.submit(analyze_batch, batch))
+                while len(pending) >= max_pending: # 處理中的批次滿了，先等最早的那批，讀檔也跟著停下來
+                    yield from pending.popleft().result()
+            batch = []
+        if batch and executor is None:
+            yield from analyze_batch(batch)
+        elif batch:
+            pending.append(executor.submit(analyze_batch, batch))
+        while pending:
+            yield from pending.popleft().result()
+    finally:
+        if own_executor: executor.shutdown(cancel_futures=True)
+
+class PipelineStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.games = 0
+        self.plies = 0
+        self.illegal = 0
+        self.mismatches = 0
+        self.results = Counter()
+        self.outcomes = Counter()
+        self.totals = Counter()
+
+    def add(self, result):
+        self.games += 1
+        self.plies += result['plies']
+        self.results[result['result']] += 1
+        if result['error']: self.illegal += 1
+        if result['result_mismatch']: self.mismatches += 1
+        if result['outcome']: self.outcomes[result['outcome'][1]] += 1
+        for key in ('captures', 'checks', 'castles', 'promotions'):
+            self.totals[key] += result[key]
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.started
+        lines = [f"{self.games} 局  {self.plies} 個半回合  {elapsed:.1f}s  "
+                 f"{self.games / elapsed if elapsed else 0:.0f} games/s  {self.plies / elapsed if elapsed else 0:.0f} plies/s",
+                 f"不合法 {self.illegal}  結果與棋盤不符 {self.mismatches}",
+                 "結果   " + ", ".join(f"{name}={count}" for name, count in self.results.most_common()),
+                 "結束於 " + (", ".join(f"{name}={count}" for name, count in self.outcomes.most_common()) or '-'),
+                 "合計   " + ", ".join(f"{name}={count}" for name, count in self.totals.items())]
+        return '\n'.join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='用 chess_game 的規則驗證並統計 PGN 棋譜')
+    parser.add_argument('paths', nargs='+', help="PGN 檔案，- 代表標準輸入")
+    parser.add_argument('--workers', type=int, default=None, help='行程數 (預設為 CPU 核心數，0 代表不開行程)')
+    parser.add_argument('--batch-size', type=int, default=256, help='每次丟給 worker 幾局')
+    parser.add_argument('--jsonl', help='把每一局的結果寫成 JSON lines')
+    parser.add_argument('--progress', type=int, default=100000, help='每處理幾局印一次進度 (0 代表不印)')
+    args = parser.parse_args(argv)
+
+    stats = PipelineStats()
+    out = open(args.jsonl, 'w', encoding='utf-8') if args.jsonl else None
+    try:
+        for path in args.paths:
+            stream = sys.stdin if path == '-' else open(path, encoding='utf-8', errors='replace')
+            try:
+                for result in run_pipeline(stream, args.workers, args.batch_size):
+                    stats.add(result)
+                    error = result['error']
+                    if error:
+                        print(f"{path}:{error['line']}: {error['reason']} {error['move'] or ''} "
+                              f"(第 {result['line']} 行開始的對局 {result['white']} - {result['black']})")
+                    if out is not None:
+                        out.write(json.dumps(dict(result, path=path), ensure_ascii=False) + '\n')
+                    if args.progress and stats.games % args.progress == 0:
+                        print(f"... {stats.games} 局", file=sys.stderr)
+            finally:
+                if stream is not sys.stdin: stream.close()
+    finally:
+        if out is not None: out.close()
+    print(stats.summary())
+    return stats
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+# 客戶端的局面服務：畫面執行緒與 socket.io 執行緒共用同一個棋盤，所有修改都要經過 mutate()
+# 每次局面改變，背景執行緒就把新局面的合法棋步表 (依起點分組) 先算好
+# 畫面只讀取不可變的 PositionSnapshot，點棋子時查表就好，不會在畫面執行緒上產生棋步
+import threading
+from contextlib import contextmanager
+
+import chess_game
+
+class PositionSnapshot:
+    # 某一個版本的局面：rows 是 8 個字串 (可以直接 rows[row][col] 取棋子字元)
+    # moves 是 {起點: ((起點, 終點, 棋步), ...)}；背景執行緒還沒算完時是 None
+    __slots__ = ('version', 'rows', 'turn', 'moves')
+
+    def __init__(self, version, rows, turn, moves=None):
+        self.version = version; self.rows = rows; self.turn = turn; self.moves = moves
+
+def build_move_table(board):
+    table = {}
+    for move in board.analyze_position()[0]:
+        start_pos, end_pos = divmod(move & 63, 8), divmod((move >> 6) & 63, 8)
+        table.setdefault(start_pos, []).append((start_pos, end_pos, move))
+    return {start_pos: tuple(moves) for start_pos, moves in table.items()}
+
+class PositionService:
+    def __init__(self, board=None):
+        self._board = board if board is not None else chess_game.Board()
+        self._lock = threading.RLock()
+        self._changed = threading.Condition(self._lock)
+        self._closed = False
+        self._snapshot = self._make_snapshot(0)
+        self._thread = threading.Thread(target=self._run, name='move-table', daemon=True)
+        self._thread.start()
+
+    def _make_snapshot(self, version):
+        squares = self._board.squares
+        rows = tuple(''.join(chess_game.PIECE_CHARS[code] for code in squares[row * 8:row * 8 + 8]) for row in range(8))
+        return PositionSnapshot(version, rows, self._board.current_turn)
+
+    @contextmanager
+    def mutate(self):
+        # with positions.mutate() as board: ... 期間獨佔棋盤；離開時發佈新版本並叫背景執行緒重算棋步表
+        with self._lock:
+            try:
+                yield self._board
+            finally:
+                self._snapshot = self._make_snapshot(self._snapshot.version + 1)
+                self._changed.notify()
+
+    def snapshot(self):
+        # 換參考是原子操作，讀取不用鎖
+        return self._snapshot
+
+    def moves_from(self, start_pos):
+        snapshot = self._snapshot
+        if snapshot.moves is not None:
+            return snapshot.moves.get(start_pos, ())
+        # 背景執行緒還沒算完 (剛走完棋的那一瞬間)，只算這一格
+        with self._lock:
+            from_sq = start_pos[0] * 8 + start_pos[1]
+            return tuple((start_pos, divmod((move >> 6) & 63, 8), move) for move in self._board.iter_moves(origin=from_sq))
+
+    def find_move(self, start_pos, end_pos):
+        # 找出對應的 16 位元棋步 (兵走到底線預設升后)
+        for _, target, move in self.moves_from(start_pos):
+            if target == end_pos and move >> 12 in (0, chess_game.QUEEN): return move
+        return None
+
+    def close(self):
+        with self._lock:
+            self._closed = True; self._changed.notify()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._closed and self._snapshot.moves is not None:
+                    self._changed.wait()
+                if self._closed: return
+                snapshot = self._snapshot
+                board = self._board.copy()
+            # 在鎖外面產生棋步，網路執行緒可以同時套用新的棋步
+            table = build_move_table(board)
+            with self._lock:
+                if self._snapshot is snapshot: # 算的期間局面沒變才發佈，否則下一輪重算
+                    self._snapshot = PositionSnapshot(snapshot.version, snapshot.rows, snapshot.turn, table)
@@ -0,0 +1,60 @@
+# 精簡的二進位棋步協定
+#   一步棋 = 4 bytes：2 bytes 序號 (這是本局第幾個半回合，從 0 開始) + 2 bytes 棋步 (chess_game 的 16 位元編碼)
+#   伺服器收下後回 'move_ack' (2 bytes 序號)，再把同樣 4 bytes 轉給對手
+#   客戶端發現序號跳號或重新連線時送 'resync' (自己已經有的半回合數)，伺服器只補傳缺少的棋步，落後太多就直接給 FEN
+import struct
+
+import chess_game
+
+MOVE_FRAME = struct.Struct('>HH')
+SEQ_FRAME = struct.Struct('>H')
+MOVE_WORD = struct.Struct('>H')
+RESYNC_DELTA_LIMIT = 64 # 缺超過這麼多步就改送 FEN 快照
+
+def pack_move(seq, move):
+    return MOVE_FRAME.pack(seq, move)
+
+def unpack_move(data):
+    # 長度或型別不對就丟 ValueError
+    if not isinstance(data, (bytes, bytearray)) or len(data) != MOVE_FRAME.size:
+        raise ValueError('move frame must be 4 bytes')
+    return MOVE_FRAME.unpack(data)
+
+def pack_seq(seq):
+    return SEQ_FRAME.pack(seq)
+
+def unpack_seq(data):
+    if not isinstance(data, (bytes, bytearray)) or len(data) != SEQ_FRAME.size:
+        raise ValueError('sequence frame must be 2 bytes')
+    return SEQ_FRAME.unpack(data)[0]
+
+def pack_moves(moves):
+    return b''.join(MOVE_WORD.pack(move) for move in moves)
+
+def unpack_moves(data):
+    if len(data) % MOVE_WORD.size:
+        raise ValueError('move list length must be even')
+    return [word for (word,) in MOVE_WORD.iter_unpack(data)]
+
+def resync_payload(history, client_seq, fen):
+    # history 是伺服器手上這一局所有的棋步；client_seq 是客戶端目前已經有的半回合數
+    seq = len(history)
+    if 0 <= client_seq <= seq and seq - client_seq <= RESYNC_DELTA_LIMIT:
+        return {'seq': seq, 'from': client_seq, 'moves': pack_moves(history[client_seq:])}
+    return {'seq': seq, 'fen': fen}
+
+def apply_resync(board, payload):
+    # 把伺服器回的補傳套到本地棋盤上，回傳新的序號
+    if 'fen' in payload:
+        board.set_fen(payload['fen'])
+    else:
+        for move in unpack_moves(payload['moves']):
+            board.push_move(move)
+    return payload['seq']
+
+def move_to_notation(move):
+    # 轉回舊的 (起點, 終點[, 升變]) JSON 格式，給還沒改用二進位協定的客戶端
+    from_sq, to_sq, promotion = chess_game.decode_move(move)
+    notation = [chess_game.square_name(from_sq), chess_game.square_name(to_sq)]
+    if promotion: notation.append(chess_game.PIECE_CHARS[promotion | chess_game.BLACK_PIECE])
+    return notation
@@ -1,64 +1,632 @@
-from flask import Flask
-from flask_socketio import SocketIO, emit, join_room, leave_room, send
+# NEW! The server runs on eventlet. Patch the standard library before anything else imports socket, select or time:
+# the Redis message queue refuses an unpatched socket module, and the backend clients (redis-py, the multiprocessing
+# manager proxy behind local://) then wait on the hub instead of blocking it. thread=False keeps real OS threads and
+# the real queue module for the journal writer, the event log and the process pools' management threads, so their
+# blocking file I/O (fsync) and pipe reads never run on the hub.
+import eventlet
+eventlet.monkey_patch(thread=False)
+
+from flask import Flask, Response
+from flask_socketio import SocketIO, emit as socketio_emit, join_room, leave_room, send
 from flask import request # NEW! We need to import 'request' to get the session ID
+import argparse
+import itertools
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+import chess_game
+from move_validator import MoveValidator
+from matchmaking import MatchmakingQueue, RoomRegistry, WAITING, PLAYING, FINISHED
+import state_backend
+import protocol
+import metrics
+from game_journal import GameJournal
+from engine import Engine
+from session_manager import SessionManager, TimerWheel
+
+# NEW! Multi-worker deployment: every worker publishes its emits through a shared message queue
+# (e.g. SOCKETIO_MESSAGE_QUEUE=redis://localhost:6379/0) so emit(..., room=...) reaches players on other workers.
+# STATE_BACKEND picks where shared matchmaking/room state lives (memory://, local://host:port or redis://...).
+WORKER_ID = os.environ.get('WORKER_ID', '0')
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'a_super_secret_key_that_no_one_will_guess'
-socketio = SocketIO(app, cors_allowed_origins="*")
+socketio = SocketIO(app, async_mode='eventlet', cors_allowed_origins="*", message_queue=os.environ.get('SOCKETIO_MESSAGE_QUEUE'))
+
+# UPDATED! Rooms live in an indexed registry and waiting rooms in a FIFO queue,
+# so joining never scans every open room. Each room carries the server's authoritative board.
+# A room paired entirely on this worker keeps its board in memory here (board is not None), so the
+# move-relay path never leaves the process. Rooms paired across workers keep their position in the backend.
+registry = RoomRegistry()
+match_queue = MatchmakingQueue()
+backend = state_backend.create_backend(os.environ.get('STATE_BACKEND'))
+pending_rooms = set() # rooms with a move currently being validated
+binary_sids = set() # NEW! players that asked for the compact binary move protocol in join_game
+room_numbers = itertools.count(1) # NEW! suffix that keeps every room id this worker creates unique
+
+# NEW! Rule checks run in a worker pool so one busy room never stalls the event loop for the others.
+# MOVE_VALIDATION_WORKERS=0 validates inline; MOVE_VALIDATION_MODE=thread uses threads instead of processes.
+# UPDATED! Results are awaited by polling with socketio.sleep, so a waiting handler never holds one of eventlet's tpool threads.
+validator = MoveValidator(workers=int(os.environ['MOVE_VALIDATION_WORKERS']) if 'MOVE_VALIDATION_WORKERS' in os.environ else None,
+                          use_processes=os.environ.get('MOVE_VALIDATION_MODE', 'process') == 'process', sleep=socketio.sleep)
+
+# NEW! A player left waiting longer than BOT_WAIT_SECONDS (0 disables it) is paired with the engine instead.
+# Its searches run in their own worker pool with a fixed time budget per move, so bot games never block the relay loop.
+# OPENING_BOOK / ENDGAME_TABLES point at the mmap'ed lookup files; every worker process shares their pages.
+# UPDATED! At most BOT_MAX_SEARCHES searches run at once (0 = no cap); further bot moves wait their turn without holding a thread.
+BOT_WAIT_SECONDS = float(os.environ.get('BOT_WAIT_SECONDS', '30'))
+BOT_SID_PREFIX = 'bot:'
+bot_engine = Engine(workers=int(os.environ['BOT_ENGINE_WORKERS']) if 'BOT_ENGINE_WORKERS' in os.environ else None,
+                    time_limit=float(os.environ.get('BOT_THINK_SECONDS', '0.5')),
+                    book_path=os.environ.get('OPENING_BOOK'), tables_dir=os.environ.get('ENDGAME_TABLES'),
+                    sleep=socketio.sleep, max_searches=int(os.environ.get('BOT_MAX_SEARCHES', '8')) or None)
+
+# NEW! Players are identified by a session token, sent in a 'session' event and presented again in the connect auth
+# ({'token': ...}). A player who drops out of a running game keeps the seat for SESSION_GRACE_SECONDS (0 closes the
+# room at once, as before); rooms without a move for ROOM_IDLE_SECONDS are closed. All of these timeouts sit on one
+# timer wheel that a single sweeper task advances every SESSION_SWEEP_SECONDS, reclaiming expired rooms in bulk.
+SESSION_SWEEP_SECONDS = float(os.environ.get('SESSION_SWEEP_SECONDS', '1'))
+sessions = SessionManager(grace_seconds=float(os.environ.get('SESSION_GRACE_SECONDS', '30')),
+                          idle_seconds=float(os.environ.get('ROOM_IDLE_SECONDS', '600')),
+                          timers=TimerWheel(tick=SESSION_SWEEP_SECONDS))
+
+def is_bot(sid):
+    return sid is not None and sid.startswith(BOT_SID_PREFIX)
+
+# NEW! Every accepted move of a game hosted on this worker is appended to an on-disk journal by a background
+# writer (the move path only enqueues). After a restart the unfinished games are replayed back into rooms.
+journal = GameJournal(os.path.join(os.environ.get('GAME_JOURNAL_DIR', 'journal'), f"worker-{WORKER_ID}"),
+                     on_error=lambda error: event_log.event('journal_error', sample=1.0, error=repr(error)))
+
+# NEW! Metrics, scraped from GET /metrics in the Prometheus text format. Counters and latency histograms are
+# bumped on the hot path (a dict update); the gauges are only computed when scraped.
+# Per-event logging is structured (JSON lines), sampled at LOG_SAMPLE_RATE and written by a background thread,
+# so a slow stdout never stalls a handler. Rare events (recovered rooms, bot games) are always logged.
+metrics_registry = metrics.MetricsRegistry()
+event_log = metrics.EventLog(sample_rate=float(os.environ.get('LOG_SAMPLE_RATE', '0.01')))
+handler_latency = metrics_registry.histogram('chess_handler_seconds', 'Socket.IO handler latency in seconds.', ['handler'])
+handler_errors = metrics_registry.counter('chess_handler_errors_total', 'Socket.IO handlers that raised.', ['handler'])
+emits_total = metrics_registry.counter('chess_emits_total', 'Socket.IO messages emitted, by event.', ['event'])
+moves_rejected = metrics_registry.counter('chess_moves_rejected_total', 'Moves rejected, by reason.', ['reason'])
+games_finished = metrics_registry.counter('chess_games_finished_total', 'Games finished on this worker, by reason.', ['reason'])
+connected_sids = metrics_registry.gauge('chess_connected_sids', 'Clients connected to this worker.')
+metrics_registry.gauge('chess_rooms', 'Rooms registered on this worker, by state.', ['state'],
+                       collect=lambda: {(state,): registry.count(state) for state in (WAITING, PLAYING, FINISHED)})
+metrics_registry.gauge('chess_waiting_players', 'Players waiting for an opponent on this worker.', collect=lambda: len(match_queue))
+metrics_registry.gauge('chess_pending_validations', 'Rooms with a move being validated.', collect=lambda: len(pending_rooms))
+metrics_registry.gauge('chess_sessions', 'Player sessions, connected or holding a seat.', collect=lambda: len(sessions))
+metrics_registry.gauge('chess_held_seats', 'Seats held for disconnected players.', collect=sessions.held)
+metrics_registry.gauge('chess_bot_searches', 'Bot searches submitted to the engine pool and not yet finished.', collect=bot_engine.searching)
+metrics_registry.gauge('chess_timers', 'Grace, idle and bot-wait timeouts scheduled on the timer wheel.', collect=lambda: len(sessions.timers))
+rooms_reclaimed = metrics_registry.counter('chess_rooms_reclaimed_total', 'Rooms closed by the sweeper, by reason.', ['reason'])
+metrics_registry.gauge('chess_journal_pending', 'Journal records not yet written to disk.', collect=journal.pending)
+metrics_registry.gauge('chess_journal_writer_up', '1 while the journal writer thread is running.', collect=lambda: int(journal.alive()))
+metrics_registry.counter('chess_journal_errors_total', 'Journal write or compaction failures.', collect=lambda: journal.errors)
+metrics_registry.counter('chess_journal_lost_total', 'Journal records that were never written.', collect=lambda: journal.lost)
+metrics_registry.gauge('chess_log_pending', 'Log events not yet written.', collect=event_log.pending)
+metrics_registry.counter('chess_log_dropped_total', 'Log events dropped because the log queue was full.', collect=lambda: event_log.dropped)
+
+def timed(name):
+    return metrics.timed(handler_latency, handler_errors, name)
+
+def emit(event, *args, **kwargs):
+    # Reply/broadcast from inside a handler (flask_socketio.emit), counted per event
+    emits_total.inc(event)
+    return socketio_emit(event, *args, **kwargs)
 
-rooms = {}
-sid_to_room = {}
+def broadcast(event, *args, **kwargs):
+    # Same for emits that may run outside a request context (background tasks, relays)
+    emits_total.inc(event)
+    return socketio.emit(event, *args, **kwargs)
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics_registry.render(), content_type=metrics.CONTENT_TYPE)
+
+def restore_journaled_games():
+    for game in journal.recover():
+        meta = game['meta']
+        room = registry.create(game['game_id'], meta['white'], tuple(meta['bucket']) if meta.get('bucket') else None)
+        registry.add_player(room, meta['black'])
+        registry.set_state(room, PLAYING)
+        room.board = game['board']
+        # Nobody is connected yet: hold both seats so the players can come back with their tokens
+        sessions.touch_room(room.room_id)
+        for sid, token in zip(room.players, meta.get('tokens') or ()):
+            if token: sessions.restore(token, sid, room.room_id)
+        event_log.event('room_restored', sample=1.0, room=room.room_id, plies=len(game['moves']))
+        if is_bot(meta['black']) and room.board.current_turn == 'black':
+            socketio.start_background_task(play_bot_move, room.room_id) # the engine owed a reply when we went down
 
 # UPDATED! This function now correctly accepts the connection arguments but we don't need them.
 @socketio.on('connect')
+@timed('handle_connect')
 def handle_connect(auth):
-    print(f'一個客戶端連線了！ SID: {request.sid}')
+    connected_sids.inc()
+    event_log.event('connect', sid=request.sid)
+    token = auth.get('token') if isinstance(auth, dict) else None
+    session, previous = sessions.connect(request.sid, token)
+    room = registry.rebind(previous, request.sid) if previous else None
+    if room is None:
+        return emit('session', {'token': session.token})
+    # NEW! Back within the grace period: the new sid takes over the seat (and the protocol choice) of the old one
+    if previous in binary_sids:
+        binary_sids.discard(previous); binary_sids.add(request.sid)
+    join_room(room.room_id)
+    event_log.event('resumed', sid=request.sid, room=room.room_id)
+    emit('session', {'token': session.token, 'room': room.room_id, 'color': room.color_of(request.sid)})
+    emit('opponent_reconnected', room=room.room_id, include_self=False)
 
 # UPDATED! This function now correctly accepts disconnect arguments.
 @socketio.on('disconnect')
+@timed('handle_disconnect')
 def handle_disconnect():
-    print(f'一個客戶端斷線了！ SID: {request.sid}')
-    room_id = sid_to_room.get(request.sid)
-    if room_id and room_id in rooms:
-        emit('opponent_disconnected', room=room_id, include_self=False)
-        # Clean up room info
-        if room_id in rooms:
-             del rooms[room_id]
-    if request.sid in sid_to_room:
-        del sid_to_room[request.sid]
+    connected_sids.dec()
+    event_log.event('disconnect', sid=request.sid)
+    held = sessions.disconnect(request.sid)
+    room = registry.room_of(request.sid)
+    if room and held and sessions.grace_seconds > 0 and room.board is not None and room.state == PLAYING:
+        # NEW! Hold the seat; the sweeper closes the room if the player is not back in time
+        emit('opponent_reconnecting', {'grace': sessions.grace_seconds}, room=room.room_id, include_self=False)
+        return
+    if room:
+        close_room(room, 'abandoned', skip_sid=request.sid)
+    binary_sids.discard(request.sid)
+
+def close_room(room, reason, skip_sid=None, notify=True):
+    # UPDATED! The only place a room is torn down (disconnect, expired seat, idle room), so every index entry of
+    # every player goes with it: sid mappings, held sessions and protocol flags.
+    # notify=False drops the room without telling its players (it was already closed, or nobody is left to tell).
+    if notify and reason == 'abandoned':
+        broadcast('opponent_disconnected', room=room.room_id, skip_sid=skip_sid)
+    elif notify:
+        broadcast('room_closed', {'room': room.room_id, 'reason': reason}, room=room.room_id)
+    socketio.close_room(room.room_id)
+    if room.board is not None and room.state == PLAYING:
+        journal.record_end(room.room_id, reason)
+    elif room.board is None and room.state == PLAYING:
+        end_shared_game(room.room_id, reason)
+    if match_queue.remove(room.room_id):
+        backend.remove_waiting(room.bucket, room.room_id)
+    backend.delete_room(room.room_id)
+    registry.remove(room.room_id)
+    pending_rooms.discard(room.room_id)
+    for sid in sessions.release(room.players, room.room_id):
+        binary_sids.discard(sid)
+
+def sweep_sessions():
+    # NEW! One background task for all grace and idle timeouts: advance the wheel, close whatever expired
+    # UPDATED! The bot wait is one more timer on the same wheel, not a sleeping background task per waiting room.
+    while True:
+        socketio.sleep(SESSION_SWEEP_SECONDS)
+        reclaimed = 0
+        for room_id, reason in sessions.expired():
+            room = registry.get(room_id)
+            if room is None:
+                continue
+            if reason == 'unmatched':
+                offer_bot_opponent(room)
+                continue
+            if reason == 'idle' and room.board is None and not shared_room_idle(room):
+                continue
+            close_room(room, reason)
+            rooms_reclaimed.inc(reason)
+            reclaimed += 1
+        if reclaimed:
+            event_log.event('rooms_reclaimed', rooms=reclaimed)
+
+def shared_room_idle(room):
+    # NEW! Moves of a shared room may be played on the other worker, so our idle timer alone proves nothing:
+    # the backend record says when the room last moved. Re-arms the timer for the rest of the idle period if needed.
+    record = refresh_shared_room(room)
+    if record is None:
+        return False # already gone
+    idle = time.time() - record.get('touched', 0)
+    if record.get('state') != FINISHED and idle < sessions.idle_seconds:
+        sessions.touch_room(room.room_id, sessions.idle_seconds - idle)
+        return False
+    return True
+
+def refresh_shared_room(room):
+    # NEW! A room shared with another worker can be paired, finished or closed over there; this worker only finds
+    # out from the backend record. Brings the local room up to date and returns the record, or drops the room
+    # locally (without notifying anyone, the other worker already did) and returns None once the record is gone.
+    record = backend.load_room(room.room_id)
+    if not record:
+        close_room(room, 'closed', notify=False)
+        return None
+    state = record.get('state')
+    if room.state == WAITING and state != WAITING:
+        registry.set_state(room, state) # our waiting room was paired by another worker
+        for sid in record['players']:
+            if registry.room_of(sid) is None: registry.add_player(room, sid)
+        match_queue.remove(room.room_id)
+        sessions.touch_room(room.room_id)
+    elif state == FINISHED and room.state != FINISHED:
+        registry.set_state(room, FINISHED)
+    return record
+
+def leave_finished_room(room):
+    # NEW! Give up the seat in a finished room; the room itself goes once no human on this worker is left in it
+    # (the opponent of a shared room sits on another worker and only has a session there).
+    leave_room(room.room_id)
+    registry.leave(request.sid)
+    sessions.release([request.sid], room.room_id)
+    if not any(not is_bot(sid) and sessions.get(sid) is not None for sid in registry.seated(room)):
+        close_room(room, 'finished', notify=False)
+
+def claim_local_room(bucket):
+    # Prefer a room waiting on this worker: both players then live here and the game never needs the backend.
+    while True:
+        room_id = match_queue.pop(bucket)
+        if room_id is None:
+            return None
+        if backend.remove_waiting(bucket, room_id):
+            return registry.get(room_id)
+        # Another worker already paired this room; it is now served through the backend.
+
+def claim_remote_room(bucket, sid):
+    room_id = backend.pop_waiting(bucket)
+    if room_id is None:
+        return None
+    record = backend.load_room(room_id)
+    if not record or record.get('state') != WAITING:
+        return None
+    record['players'].append(sid)
+    record['state'] = PLAYING
+    record['fen'] = chess_game.START_FEN
+    record['moves'] = []
+    record['keys'] = chess_game.Board().keys
+    record['touched'] = time.time() # UPDATED! when the shared room last moved, for both workers' idle timers
+    if sid in binary_sids:
+        record.setdefault('binary', []).append(sid)
+    if not backend.save_room(room_id, record, expected_version=record['version']):
+        return None
+    room = registry.create(room_id, record['players'][0], bucket)
+    registry.add_player(room, sid)
+    registry.set_state(room, PLAYING)
+    sessions.touch_room(room_id)
+    return room
 
 @socketio.on('join_game')
+@timed('handle_join_game')
 def handle_join_game(data):
     username = data.get('username', '匿名玩家')
-    
-    available_room = None
-    for room_id, players in rooms.items():
-        if len(players) == 1:
-            available_room = room_id
-            break
-            
-    if available_room:
+    # UPDATED! A player whose game is over may queue for the next one; anyone still seated gets told why nothing happened.
+    seated = registry.room_of(request.sid)
+    if seated is not None and seated.board is None and seated.state != FINISHED and refresh_shared_room(seated) is None:
+        seated = None # the shared room was closed by the other worker
+    if seated is not None and seated.state != FINISHED:
+        return emit('join_rejected', {'room': seated.room_id, 'reason': 'already_seated'})
+    if seated is not None:
+        leave_finished_room(seated)
+    if data.get('protocol') == 'binary':
+        binary_sids.add(request.sid)
+
+    # NEW! Players are only paired within the same time control / rating bucket (both optional, malformed values ignored).
+    bucket = match_queue.bucket_for(data.get('time_control'), data.get('rating'))
+
+    room = claim_local_room(bucket)
+    if room:
         # UPDATED! Use request.sid to track the new player
-        join_room(available_room)
-        rooms[available_room].append(request.sid)
-        sid_to_room[request.sid] = available_room
-        print(f"玩家 {username} ({request.sid}) 加入了房間 {available_room}")
-        emit('game_start', {'room': available_room, 'white': rooms[available_room][0], 'black': rooms[available_room][1]}, room=available_room)
+        join_room(room.room_id)
+        registry.add_player(room, request.sid)
+        registry.set_state(room, PLAYING)
+        room.board = chess_game.Board()
+        backend.delete_room(room.room_id) # the shared record was only needed while waiting
+        sessions.seat(request.sid, room.room_id)
+        sessions.touch_room(room.room_id)
+        journal.record_start(room.room_id, {'white': room.players[0], 'black': room.players[1],
+                                            'tokens': [sessions.token_of(sid) for sid in room.players],
+                                            'bucket': bucket, 'fen': chess_game.START_FEN})
+        event_log.event('join', sid=request.sid, username=username, room=room.room_id, paired='local')
+        emit('game_start', {'room': room.room_id, 'white': room.players[0], 'black': room.players[1]}, room=room.room_id)
+        return
+
+    room = claim_remote_room(bucket, request.sid)
+    if room:
+        join_room(room.room_id)
+        sessions.seat(request.sid, room.room_id)
+        event_log.event('join', sid=request.sid, username=username, room=room.room_id, paired='remote')
+        emit('game_start', {'room': room.room_id, 'white': room.players[0], 'black': room.players[1]}, room=room.room_id)
+        return
+
+    # UPDATED! Use request.sid to create the new room
+    # UPDATED! The sid alone is not unique: a player leaving a finished room may still share it with the opponent.
+    new_room_id = f"room_{request.sid}_{next(room_numbers)}"
+    join_room(new_room_id)
+    registry.create(new_room_id, request.sid, bucket)
+    sessions.seat(request.sid, new_room_id)
+    match_queue.enqueue(new_room_id, bucket)
+    backend.save_room(new_room_id, {'players': [request.sid], 'state': WAITING, 'bucket': bucket, 'owner': WORKER_ID,
+                                    'binary': [request.sid] if request.sid in binary_sids else []})
+    backend.push_waiting(bucket, new_room_id)
+    event_log.event('join', sid=request.sid, username=username, room=new_room_id, paired='waiting')
+    emit('waiting_for_player', {'room': new_room_id})
+    if BOT_WAIT_SECONDS > 0:
+        sessions.wait_for_opponent(new_room_id, BOT_WAIT_SECONDS)
+
+def offer_bot_opponent(room):
+    # NEW! Nobody showed up in time: seat the engine as black, unless a human claimed the room meanwhile.
+    room_id = room.room_id
+    if room.state != WAITING or not match_queue.remove(room_id):
+        return
+    if not backend.remove_waiting(room.bucket, room_id):
+        refresh_shared_room(room) # another worker paired it: follow it through the backend (and its idle timer)
+        return
+    registry.add_player(room, BOT_SID_PREFIX + room_id)
+    registry.set_state(room, PLAYING)
+    room.board = chess_game.Board()
+    backend.delete_room(room_id)
+    sessions.touch_room(room_id)
+    journal.record_start(room_id, {'white': room.players[0], 'black': room.players[1],
+                                   'tokens': [sessions.token_of(sid) for sid in room.players],
+                                   'bucket': room.bucket, 'fen': chess_game.START_FEN})
+    event_log.event('bot_joined', sample=1.0, room=room_id)
+    broadcast('game_start', {'room': room_id, 'white': room.players[0], 'black': room.players[1]}, room=room_id)
+
+def play_bot_move(room_id):
+    # Runs as a background task; the search itself happens in the engine's worker pool.
+    game = registry.get(room_id)
+    if game is None or game.board is None or game.state != PLAYING:
+        return
+    board = game.board
+    ply = len(board.move_stack)
+    # UPDATED! Hand over the position keys since the last irreversible move too, so the engine sees repetitions.
+    legal_move, has_moves = bot_engine.play(board.to_fen(), board.keys[-(board.halfmove_clock + 1):])
+    # The human may have left, or the room may have moved on, while the engine was thinking.
+    if legal_move is None or registry.get(room_id) is not game or len(game.board.move_stack) != ply:
+        return
+    game.board.push_move(legal_move)
+    journal.record_move(room_id, ply, legal_move)
+    sessions.touch_room(room_id)
+    relay_move(game, legal_move, ply, sender=game.players[1])
+    outcome = game.board.outcome(has_moves)
+    if outcome:
+        finish_game(game, outcome)
+
+def reject_move(move, reason, seq=None):
+    payload = {'move': move, 'reason': reason}
+    if seq is not None:
+        payload['seq'] = seq # the server's current ply, so a binary client can tell it is out of sync
+    moves_rejected.inc(reason)
+    emit('move_rejected', payload)
+
+def notation_to_uci(move):
+    if not isinstance(move, (list, tuple)) or len(move) not in (2, 3) or not all(isinstance(part, str) for part in move):
+        return None
+    return (move[0] + move[1] + (move[2] if len(move) == 3 else '')).lower()
+
+def apply_move(game, uci, seq=None):
+    # Validate a move from request.sid and apply it to the room's authoritative position.
+    # Returns (legal_move, ply, reject_reason, outcome); ply is the sequence number the move gets (or the current one)
+    # and outcome is the (result, reason) pair from Board.outcome() once the move ends the game.
+    # UPDATED! The worker also reports whether the opponent has a legal reply, so only the cheap draw checks run here.
+    if game.board is None:
+        return apply_shared_move(game, uci, seq)
+    if game.state != PLAYING:
+        return None, None, 'no_game', None
+    room, board = game.room_id, game.board
+    ply = len(board.move_stack)
+    if game.color_of(request.sid) != board.current_turn:
+        return None, ply, 'not_your_turn', None
+    if seq is not None and seq != ply:
+        return None, ply, 'out_of_sync', None
+    if room in pending_rooms:
+        return None, ply, 'busy', None
+
+    fen = board.to_fen()
+    pending_rooms.add(room)
+    try:
+        legal_move, reason, has_moves = validator.validate(fen, uci)
+    finally:
+        pending_rooms.discard(room)
+    # The room may have been closed while we were waiting for the worker.
+    if registry.get(room) is not game:
+        return None, ply, 'no_game', None
+    if legal_move is None:
+        return None, ply, reason, None
+    board.push_move(legal_move)
+    journal.record_move(room, ply, legal_move)
+    sessions.touch_room(room)
+    return legal_move, ply, None, board.outcome(has_moves)
+
+def apply_shared_move(game, uci, seq):
+    # NEW! Slow path for games whose players sit on different workers: the position lives in the backend
+    # and is updated with compare-and-set, so the two workers can never both apply a move.
+    # UPDATED! The other worker may have finished or closed the room; refresh_shared_room catches our copy up.
+    record = refresh_shared_room(game)
+    if record is None or record.get('state') != PLAYING:
+        return None, None, 'no_game', None
+    players, fen = record['players'], record['fen']
+    ply = len(record['moves'])
+    color = 'white' if players[0] == request.sid else 'black'
+    if color != ('white' if fen.split()[1] == 'w' else 'black'):
+        return None, ply, 'not_your_turn', None
+    if seq is not None and seq != ply:
+        return None, ply, 'out_of_sync', None
+
+    legal_move, reason, has_moves = validator.validate(fen, uci)
+    if legal_move is None:
+        return None, ply, reason, None
+    # UPDATED! The FEN carries the halfmove clock and 'keys' the position keys since the last capture or pawn move,
+    # which is all the repetition check can look at, so the position is rebuilt without replaying the game.
+    board = chess_game.Board.from_fen(fen)
+    board.keys = record['keys']
+    board.push_move(legal_move)
+    outcome = board.outcome(has_moves)
+    record['fen'] = board.to_fen()
+    record['keys'] = board.keys[-(board.halfmove_clock + 1):]
+    record['moves'].append(legal_move)
+    record['touched'] = time.time()
+    if outcome is not None:
+        record['state'], record['outcome'] = FINISHED, list(outcome)
+    if not backend.save_room(game.room_id, record, expected_version=record['version']):
+        return None, ply, 'busy', None
+    sessions.touch_room(game.room_id)
+    if outcome is not None:
+        journal_shared_game(game.room_id, record, f"{outcome[0]} {outcome[1]}")
+    return legal_move, ply, None, outcome
+
+def end_shared_game(room_id, reason):
+    # NEW! A shared game closed before it finished: whichever worker marks the record FINISHED first journals it.
+    record = backend.load_room(room_id)
+    if not record or record.get('state') != PLAYING:
+        return
+    record['state'] = FINISHED
+    if backend.save_room(room_id, record, expected_version=record['version']):
+        journal_shared_game(room_id, record, reason)
+
+def journal_shared_game(room_id, record, result):
+    # NEW! Moves of a shared game are split between two workers' journals otherwise, and two writers appending to
+    # one log cannot keep the sequence order. So a shared game is journaled once, whole, by the worker that ends it
+    # (the backend record holds every move): it reaches the archive and the export, but an unfinished shared game
+    # does not survive a restart (its players' sessions live on two workers and could not be resumed anyway).
+    players = record['players']
+    journal.record_start(room_id, {'white': players[0], 'black': players[1], 'bucket': record.get('bucket'),
+                                   'fen': chess_game.START_FEN, 'shared': True})
+    for seq, move in enumerate(record['moves']):
+        journal.record_move(room_id, seq, move)
+    journal.record_end(room_id, result)
+
+def finish_game(game, outcome):
+    # NEW! The move just played ended the game. The room stays registered as FINISHED (so 'resync' still works)
+    # until its players disconnect or join another game; further moves are rejected with 'no_game'.
+    result, reason = outcome
+    registry.set_state(game, FINISHED)
+    if game.board is not None:
+        journal.record_end(game.room_id, f"{result} {reason}")
+    games_finished.inc(reason)
+    event_log.event('game_over', room=game.room_id, result=result, reason=reason)
+    broadcast('game_over', {'room': game.room_id, 'result': result, 'reason': reason}, room=game.room_id)
+
+def relay_move(game, legal_move, ply, sender=None):
+    # Binary clients get the 4-byte frame, older clients the JSON notation.
+    # UPDATED! sender defaults to the current request; the bot passes its own sid from a background task.
+    sender = request.sid if sender is None else sender
+    if game.board is None:
+        record = backend.load_room(game.room_id) or {}
+        opponent = next((sid for sid in record.get('players', ()) if sid != sender), None)
+        wants_binary = opponent in record.get('binary', ())
     else:
-        # UPDATED! Use request.sid to create the new room
-        new_room_id = f"room_{request.sid}"
-        join_room(new_room_id)
-        rooms[new_room_id] = [request.sid]
-        sid_to_room[request.sid] = new_room_id
-        print(f"玩家 {username} ({request.sid}) 建立了新房間 {new_room_id}")
-        emit('waiting_for_player', {'room': new_room_id})
+        opponent = game.opponent_of(sender)
+        wants_binary = opponent in binary_sids
+    if opponent is None:
+        return
+    if is_bot(opponent):
+        socketio.start_background_task(play_bot_move, game.room_id)
+    elif wants_binary:
+        broadcast('opponent_move_bin', protocol.pack_move(ply, legal_move), room=opponent)
+    else:
+        broadcast('opponent_moved', protocol.move_to_notation(legal_move), room=opponent)
 
 @socketio.on('move')
+@timed('handle_move')
 def handle_move(data):
-    room = data['room']
-    move = data['move']
-    print(f"收到來自房間 {room} 的棋步: {move}")
-    emit('opponent_moved', move, room=room, include_self=False)
+    move = data.get('move')
+    # UPDATED! Never trust the room the client claims; use the one we assigned to this sid.
+    game = registry.room_of(request.sid)
+    if game is None:
+        return reject_move(move, 'no_game')
+    uci = notation_to_uci(move)
+    if uci is None:
+        return reject_move(move, 'bad_format')
+    legal_move, ply, reason, outcome = apply_move(game, uci)
+    if legal_move is None:
+        return reject_move(move, reason)
+    event_log.event('move', room=game.room_id, move=move)
+    relay_move(game, legal_move, ply)
+    if outcome:
+        finish_game(game, outcome)
+
+@socketio.on('move_bin')
+@timed('handle_move_bin')
+def handle_move_bin(data):
+    # NEW! Compact protocol: 2-byte sequence number + 2-byte move, acked with the sequence number.
+    try:
+        seq, move = protocol.unpack_move(data)
+    except ValueError:
+        return reject_move(None, 'bad_format')
+    game = registry.room_of(request.sid)
+    if game is None:
+        return reject_move(None, 'no_game')
+    legal_move, ply, reason, outcome = apply_move(game, chess_game.move_to_uci(move), seq)
+    if legal_move is None:
+        return reject_move(move, reason, seq=ply)
+    emit('move_ack', protocol.pack_seq(ply))
+    relay_move(game, legal_move, ply)
+    if outcome:
+        finish_game(game, outcome)
+
+@socketio.on('resync')
+@timed('handle_resync')
+def handle_resync(data):
+    # NEW! A client that missed moves (gap in sequence numbers, or a reconnect) sends how many plies it has;
+    # we answer with just the missing moves, or a FEN snapshot if it is too far behind.
+    try:
+        client_seq = protocol.unpack_seq(data.get('seq'))
+    except ValueError:
+        return emit('resync', {'error': 'bad_format'})
+    # UPDATED! Only the sender's own room; a room id named by the client is ignored, so nobody can read other games.
+    game = registry.room_of(request.sid)
+    if game is None:
+        return emit('resync', {'error': 'no_game'})
+    if game.board is not None:
+        history = game.board.move_history()
+        fen = game.board.to_fen()
+    else:
+        record = backend.load_room(game.room_id)
+        if not record or 'fen' not in record:
+            return emit('resync', {'error': 'no_game'})
+        history, fen = record['moves'], record['fen']
+    emit('resync', protocol.resync_payload(history, client_seq, fen))
+
+def run_cluster(workers, host, base_port):
+    # NEW! Start one server process per worker on consecutive ports. Put them behind a load balancer with
+    # sticky sessions (Socket.IO needs every request of a sid to hit the same worker).
+    if not os.environ.get('SOCKETIO_MESSAGE_QUEUE'):
+        sys.exit("多個 worker 需要共用訊息佇列：請設定 SOCKETIO_MESSAGE_QUEUE (例如 redis://localhost:6379/0)")
+    env = dict(os.environ)
+    backend_server = None
+    if not env.get('STATE_BACKEND'):
+        # Without Redis, one local process holds the shared state and the workers reach it over a socket.
+        ready = multiprocessing.Queue()
+        backend_server = multiprocessing.Process(target=state_backend.serve_local_backend, kwargs={'ready': ready}, daemon=True)
+        backend_server.start()
+        backend_host, backend_port = ready.get()
+        env['STATE_BACKEND'] = f"local://{backend_host}:{backend_port}"
+    env.setdefault('MOVE_VALIDATION_WORKERS', '1') # the workers already use every core
+    env.setdefault('BOT_ENGINE_WORKERS', '1')
+    processes = []
+    for worker_id in range(workers):
+        worker_env = dict(env, WORKER_ID=str(worker_id))
+        processes.append(subprocess.Popen([sys.executable, __file__, '--host', host, '--port', str(base_port + worker_id)], env=worker_env))
+        print(f"worker {worker_id} 在 {host}:{base_port + worker_id}")
+    try:
+        for process in processes:
+            process.wait()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+    finally:
+        if backend_server is not None:
+            backend_server.terminate()
+
+restore_journaled_games()
+socketio.start_background_task(sweep_sessions)
 
 if __name__ == '__main__':
-    socketio.run(app, host='0.0.0.0', port=5000)
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=1, help='number of server processes (ports port..port+N-1)')
+    args = parser.parse_args()
+    if args.workers > 1:
+        run_cluster(args.workers, args.host, args.port)
+    else:
+        try:
+            socketio.run(app, host=args.host, port=args.port)
+        finally:
+            journal.close() # flush whatever the writer still has queued
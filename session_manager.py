@@ -0,0 +1,152 @@
+# 玩家 session：用穩定的 token 認人，不靠每次連線都會換的 sid
+# 對局中斷線時座位先保留 grace_seconds 秒，帶著同一個 token 回來就接回原本的房間；逾時才算棄局
+# 所有逾時 (斷線保留、房間閒置、等對手太久改配電腦) 都排在同一個時間輪上，由伺服器的清理工作定期一次取出到期的房間整批回收
+import secrets
+import time
+
+class TimerWheel:
+    # 雜湊時間輪：slots 個格子，每格 tick 秒，排程與取消都是 O(1)，不管掛了多少個逾時都不需要各自的計時器
+    # 超過一圈的期限照樣放進對應的格子，輪到時期限還沒到就留著等下一圈
+    def __init__(self, tick=1.0, slots=512, clock=time.monotonic):
+        self.tick = tick
+        self.clock = clock
+        self._slots = [{} for _ in range(slots)] # 每格是 {key: 期限}
+        self._slot_of = {}
+        self._cursor = int(clock() / tick) # 已經處理到第幾個 tick
+
+    def schedule(self, key, delay):
+        # 同一個 key 重新排程會取代原本的期限
+        self.cancel(key)
+        deadline = self.clock() + delay
+        slot = (int(deadline / self.tick) + 1) % len(self._slots) # 放在期限之後的那一格，輪到時一定已經到期
+        self._slots[slot][key] = deadline
+        self._slot_of[key] = slot
+
+    def cancel(self, key):
+        slot = self._slot_of.pop(key, None)
+        if slot is not None:
+            del self._slots[slot][key]
+
+    def advance(self, now=None):
+        # 推進到 now，回傳所有到期的 key；落後超過一圈時每格看一次就夠了
+        now = self.clock() if now is None else now
+        target = int(now / self.tick)
+        expired = []
+        for step in range(1, min(target - self._cursor, len(self._slots)) + 1):
+            slot = self._slots[(self._cursor + step) % len(self._slots)]
+            due = [key for key, deadline in slot.items() if deadline <= now]
+            for key in due:
+                del slot[key]; del self._slot_of[key]
+            expired.extend(due)
+        self._cursor = max(self._cursor, target)
+        return expired
+
+    def __contains__(self, key): return key in self._slot_of
+    def __len__(self): return len(self._slot_of)
+
+class Session:
+    __slots__ = ('token', 'sid', 'room_id', 'connected')
+
+    def __init__(self, token, sid, room_id=None, connected=True):
+        self.token = token
+        self.sid = sid # 最後一次連線的 sid；斷線保留期間房間裡登記的還是它
+        self.room_id = room_id
+        self.connected = connected
+
+class SessionManager:
+    # 只有坐在房間裡的 session 會在斷線後保留，其他的斷線就丟掉，所以記憶體只跟連線數 + 保留中的座位數成正比
+    def __init__(self, grace_seconds=30, idle_seconds=600, timers=None):
+        self.grace_seconds = grace_seconds
+        self.idle_seconds = idle_seconds
+        self.timers = TimerWheel() if timers is None else timers
+        self._sessions = {} # token -> Session
+        self._token_of = {} # sid -> token (包含斷線保留中的舊 sid)
+
+    def connect(self, sid, token=None):
+        # 回傳 (session, 舊 sid)：token 還有效就接回原本的 session，舊 sid 是房間裡要換掉的那個；否則開新的 session
+        session = self._sessions.get(token) if token else None
+        if session is None:
+            session = Session(secrets.token_urlsafe(16), sid)
+            self._sessions[session.token] = session
+            self._token_of[sid] = session.token
+            return session, None
+        previous = session.sid
+        self.timers.cancel(('grace', session.token))
+        self._token_of.pop(previous, None)
+        self._token_of[sid] = session.token
+        session.sid, session.connected = sid, True
+        return session, previous
+
+    def restore(self, token, sid, room_id):
+        # 從日誌恢復的房間：玩家還沒連回來，先當成斷線中，保留期內帶 token 回來就能接回座位
+        session = Session(token, sid, room_id, connected=False)
+        self._sessions[token] = session
+        self._token_of[sid] = token
+        self.timers.schedule(('grace', token), self.grace_seconds)
+
+    def get(self, sid):
+        token = self._token_of.get(sid)
+        return None if token is None else self._sessions.get(token)
+
+    def token_of(self, sid): return self._token_of.get(sid)
+
+    def seat(self, sid, room_id):
+        session = self.get(sid)
+        if session is not None: session.room_id = room_id
+
+    def disconnect(self, sid):
+        # 坐在房間裡的 session 開始保留期並回傳；沒有座位的直接丟掉，回傳 None
+        session = self.get(sid)
+        if session is None or session.sid != sid:
+            return None
+        if session.room_id is None:
+            self._forget(session)
+            return None
+        session.connected = False
+        self.timers.schedule(('grace', session.token), self.grace_seconds)
+        return session
+
+    def touch_room(self, room_id, seconds=None):
+        # 房間有動靜 (開局、每一步棋) 就把閒置期限往後延；seconds 可以指定剩下的秒數 (跨 worker 的房間用)
+        self.timers.schedule(('idle', room_id), self.idle_seconds if seconds is None else seconds)
+
+    def wait_for_opponent(self, room_id, seconds):
+        # 等待中的房間 seconds 秒後還沒人來，expired() 會回報 'unmatched'
+        self.timers.schedule(('bot', room_id), seconds)
+
+    def release(self, sids, room_id):
+        # 房間關閉：清掉玩家的座位，斷線中的 session 一併丟掉；回傳被丟掉的 sid
+        self.timers.cancel(('idle', room_id)); self.timers.cancel(('bot', room_id))
+        dropped = []
+        for sid in sids:
+            session = self.get(sid)
+            if session is None or session.room_id != room_id:
+                continue
+            session.room_id = None
+            if not session.connected:
+                self._forget(session); dropped.append(sid)
+        return dropped
+
+    def expired(self):
+        # 到期的 (房間, 原因)：'abandoned' 是斷線的玩家沒在保留期內回來，'idle' 是房間太久沒有動靜，
+        # 'unmatched' 是等對手等太久 (要不要改配電腦由呼叫端決定，房間這時可能早就開局了)
+        rooms = {}
+        for kind, key in self.timers.advance():
+            if kind == 'idle' or kind == 'bot':
+                rooms.setdefault(key, 'idle' if kind == 'idle' else 'unmatched')
+                continue
+            session = self._sessions.get(key)
+            if session is None or session.connected:
+                continue
+            if session.room_id is None: self._forget(session)
+            else: rooms[session.room_id] = 'abandoned' # 關房間時 release 會把它丟掉
+        return list(rooms.items())
+
+    def held(self): return sum(1 for session in self._sessions.values() if not session.connected)
+
+    def _forget(self, session):
+        self.timers.cancel(('grace', session.token))
+        self._sessions.pop(session.token, None)
+        if self._token_of.get(session.sid) == session.token: del self._token_of[session.sid]
+
+    def __len__(self): return len(self._sessions)
@@ -0,0 +1,134 @@
+# 多個伺服器 worker 共用的房間狀態：等待配對的佇列、房間紀錄 (玩家、狀態、局面 FEN)
+# sid 對應的房間不放在這裡：負載平衡用 sticky session，一個 sid 只會連到一個 worker，那個 worker 自己的 RoomRegistry 就知道
+# 三種實作介面相同：
+#   memory://              單一行程 (或測試) 用，全部放在本行程的 dict
+#   local://host:port      由一個本機行程持有 InMemoryBackend，其他 worker 經 multiprocessing 的 socket 存取
+#   redis://host:port/db   正式環境，用 Redis (需要另外安裝 redis 套件)
+import json
+import threading
+from collections import OrderedDict
+from multiprocessing.managers import BaseManager
+from urllib.parse import urlparse
+
+DEFAULT_AUTHKEY = b'chess-state-backend'
+
+def _bucket_key(bucket):
+    return json.dumps(bucket)
+
+class InMemoryBackend:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queues = {}
+        self._rooms = {}
+
+    def push_waiting(self, bucket, room_id):
+        with self._lock:
+            self._queues.setdefault(_bucket_key(bucket), OrderedDict())[room_id] = True
+
+    def pop_waiting(self, bucket):
+        with self._lock:
+            waiting = self._queues.get(_bucket_key(bucket))
+            if not waiting: return None
+            return waiting.popitem(last=False)[0]
+
+    def remove_waiting(self, bucket, room_id):
+        # 回傳 True 代表這次呼叫真的把房間從佇列拿掉了 (也就是搶到了這個房間)
+        with self._lock:
+            waiting = self._queues.get(_bucket_key(bucket))
+            if waiting is None or room_id not in waiting: return False
+            del waiting[room_id]
+            return True
+
+    def load_room(self, room_id):
+        with self._lock:
+            record = self._rooms.get(room_id)
+            return None if record is None else dict(record)
+
+    def save_room(self, room_id, record, expected_version=None):
+        # expected_version 不是 None 時做 compare-and-set：紀錄的版本對不上就不寫入，回傳 False
+        with self._lock:
+            current = self._rooms.get(room_id)
+            if expected_version is not None and (current is None or current.get('version') != expected_version):
+                return False
+            record = dict(record)
+            record['version'] = (current.get('version', 0) if current else 0) + 1
+            self._rooms[room_id] = record
+            return True
+
+    def delete_room(self, room_id):
+        with self._lock: self._rooms.pop(room_id, None)
+
+class _BackendManager(BaseManager):
+    pass
+
+def serve_local_backend(host='127.0.0.1', port=0, authkey=DEFAULT_AUTHKEY, ready=None):
+    # 在目前行程裡持有一份 InMemoryBackend，讓同一台機器上的其他 worker 透過本機 socket 共用 (會一直阻塞)
+    shared = InMemoryBackend()
+    _BackendManager.register('backend', callable=lambda: shared)
+    server = _BackendManager(address=(host, port), authkey=authkey).get_server()
+    if ready is not None:
+        ready.put(server.address)
+    server.serve_forever()
+
+def LocalSocketBackend(host, port, authkey=DEFAULT_AUTHKEY):
+    _BackendManager.register('backend')
+    manager = _BackendManager(address=(host, port), authkey=authkey)
+    manager.connect()
+    return manager.backend()
+
+class RedisBackend:
+    # 房間紀錄存成 JSON 字串；等待佇列用 Redis list (LPOP 取最早的、LREM 搶特定房間都是原子操作)
+    def __init__(self, url, prefix='chess:'):
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("RedisBackend 需要 redis 套件：pip install redis") from None
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self._watch_error = redis.WatchError
+        self.prefix = prefix
+
+    def push_waiting(self, bucket, room_id):
+        self._redis.rpush(f"{self.prefix}queue:{_bucket_key(bucket)}", room_id)
+
+    def pop_waiting(self, bucket):
+        return self._redis.lpop(f"{self.prefix}queue:{_bucket_key(bucket)}")
+
+    def remove_waiting(self, bucket, room_id):
+        return self._redis.lrem(f"{self.prefix}queue:{_bucket_key(bucket)}", 1, room_id) > 0
+
+    def load_room(self, room_id):
+        raw = self._redis.get(f"{self.prefix}room:{room_id}")
+        return None if raw is None else json.loads(raw)
+
+    def save_room(self, room_id, record, expected_version=None):
+        key = f"{self.prefix}room:{room_id}"
+        with self._redis.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                raw = pipe.get(key)
+                current = json.loads(raw) if raw else None
+                if expected_version is not None and (current is None or current.get('version') != expected_version):
+                    pipe.unwatch()
+                    return False
+                record = dict(record)
+                record['version'] = (current.get('version', 0) if current else 0) + 1
+                pipe.multi()
+                pipe.set(key, json.dumps(record))
+                pipe.execute()
+                return True
+            except self._watch_error:
+                return False
+
+    def delete_room(self, room_id):
+        self._redis.delete(f"{self.prefix}room:{room_id}")
+
+def create_backend(url=None):
+    # 依網址挑實作；沒設定就用單一行程的記憶體版本
+    if not url or url.startswith('memory'):
+        return InMemoryBackend()
+    parsed = urlparse(url)
+    if parsed.scheme == 'local':
+        return LocalSocketBackend(parsed.hostname or '127.0.0.1', parsed.port)
+    if parsed.scheme in ('redis', 'rediss'):
+        return RedisBackend(url)
+    raise ValueError(f"不支援的狀態後端: {url}")
@@ -0,0 +1,5 @@
+# 模組都放在專案根目錄，直接跑 pytest 時也要找得到
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,32 @@
+import pytest
+
+import chess_game
+from chess_game import Board
+
+def test_round_trip():
+    for fen in (chess_game.START_FEN, 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+                'rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3'):
+        assert Board.from_fen(fen).to_fen() == fen
+
+@pytest.mark.parametrize('fen', [
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP w KQkq - 0 1',             # 只有 7 排
+    'rnbqkbnr/pppppppp/9/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',    # 一排 9 格
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR x KQkq - 0 1',    # 輪到誰不正確
+    'rnbq1bnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQ - 0 1',      # 黑方沒有國王
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - x 1',    # 回合數不是整數
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KXkq - 0 1',    # 易位權不正確
+    'P3k3/8/8/8/8/8/8/4K3 w - - 0 1',                              # 兵在第 8 排
+    '4k3/8/8/8/8/8/8/p3K3 b - - 0 1',                              # 兵在第 1 排
+    'rnbqkbnr/pppp1ppp/8/4p3/8/8/PPPPPPPP/RNBQKBNR w KQkq e3 0 2', # 輪白方時過路兵格子要在第 6 排
+    'rnbqkbnr/pppp1ppp/8/8/4p3/8/PPPPPPPP/RNBQKBNR w KQkq e6 0 2', # 前面沒有黑兵
+    'rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e4 0 1', # 不是第 3 排
+])
+def test_rejects_bad_fen(fen):
+    board = Board()
+    with pytest.raises(ValueError):
+        board.set_fen(fen)
+    assert board.to_fen() == chess_game.START_FEN # 解析失敗不會改到原本的局面
+
+def test_castling_rights_need_king_and_rook_at_home():
+    board = Board.from_fen('r3k3/8/8/8/8/8/8/4K2R w KQkq - 0 1')
+    assert board.to_fen() == 'r3k3/8/8/8/8/8/8/4K2R w Kq - 0 1'
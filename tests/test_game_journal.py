@@ -0,0 +1,126 @@
+import io
+import json
+import os
+import shutil
+import time
+
+import chess_game
+import game_journal
+from game_journal import END, MOVE, START, ArchiveReader, GameJournal, encode_record, replay
+
+def uci_moves(*ucis):
+    board, moves = chess_game.Board(), []
+    for uci in ucis:
+        move = next(m for m in board.iter_moves() if chess_game.move_to_uci(m) == uci)
+        board.push_move(move); moves.append(move)
+    return moves
+
+def game_bytes(game_id, moves, result=None):
+    data = encode_record(START, json.dumps({'game_id': game_id, 'fen': chess_game.START_FEN}).encode())
+    for seq, move in enumerate(moves):
+        data += encode_record(MOVE, game_journal.protocol.pack_move(seq, move))
+    if result is not None:
+        data += encode_record(END, result.encode())
+    return data
+
+def test_replay_rebuilds_the_position():
+    moves = uci_moves('e2e4', 'e7e5', 'g1f3')
+    game = replay(game_bytes('g1', moves, '1-0 resign'))
+    assert game['game_id'] == 'g1' and game['moves'] == moves and game['result'] == '1-0 resign'
+    assert game['board'].to_fen() == 'rnbqkbnr/pppp1ppp/8/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R b KQkq - 1 2'
+
+def test_replay_ignores_a_torn_final_record():
+    moves = uci_moves('e2e4', 'e7e5')
+    data = game_bytes('g1', moves)
+    game = replay(data[:-1])
+    assert game['moves'] == moves[:1] and game['result'] is None
+
+def test_replay_stops_at_a_sequence_gap():
+    moves = uci_moves('e2e4', 'e7e5')
+    data = game_bytes('g1', moves[:1]) + encode_record(MOVE, game_journal.protocol.pack_move(5, moves[1]))
+    assert replay(data)['moves'] == moves[:1]
+
+def test_unfinished_games_are_recovered(tmp_path):
+    journal = GameJournal(str(tmp_path), flush_interval=0.01)
+    moves = uci_moves('d2d4', 'd7d5')
+    journal.record_start('open', {'white': 'a', 'black': 'b', 'fen': chess_game.START_FEN})
+    for seq, move in enumerate(moves):
+        journal.record_move('open', seq, move)
+    journal.record_start('done', {'white': 'c', 'black': 'd', 'fen': chess_game.START_FEN})
+    journal.record_end('done', '1/2-1/2 agreement')
+    journal.close()
+    games = GameJournal(str(tmp_path)).recover()
+    assert [game['game_id'] for game in games] == ['open']
+    assert games[0]['moves'] == moves and games[0]['meta']['white'] == 'a'
+
+def test_finished_games_are_compacted_into_the_archive(tmp_path):
+    journal = GameJournal(str(tmp_path), flush_interval=0.01)
+    for game_id, ucis in (('g1', ('e2e4', 'e7e5')), ('g2', ('c2c4',))):
+        journal.record_start(game_id, {'fen': chess_game.START_FEN})
+        for seq, move in enumerate(uci_moves(*ucis)):
+            journal.record_move(game_id, seq, move)
+        journal.record_end(game_id, '0-1 checkmate')
+    journal.close()
+    assert os.listdir(os.path.join(tmp_path, 'active')) == []
+    reader = ArchiveReader(str(tmp_path))
+    try:
+        assert len(reader) == 2
+        assert reader.find('g2')['moves'] == uci_moves('c2c4')
+        assert reader.find('missing') is None
+    finally:
+        reader.close()
+    out = io.StringIO()
+    game_journal.export_games(str(tmp_path), out)
+    exported = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [(game['game_id'], game['moves'], game['result']) for game in exported] == [
+        ('g1', ['e2e4', 'e7e5'], '0-1 checkmate'), ('g2', ['c2c4'], '0-1 checkmate')]
+
+def test_empty_archive_reads_as_empty(tmp_path):
+    GameJournal(str(tmp_path)).close()
+    reader = ArchiveReader(str(tmp_path))
+    assert len(reader) == 0 and list(reader) == []
+    reader.close()
+
+def test_write_failures_are_reported_and_the_writer_survives(tmp_path):
+    errors = []
+    journal = GameJournal(str(tmp_path), flush_interval=0.01, on_error=errors.append)
+    active = os.path.join(tmp_path, 'active')
+    shutil.rmtree(active)
+    open(active, 'w').close() # active/ 變成一般檔案，開日誌檔一定失敗
+    journal.record_start('lost', {'fen': chess_game.START_FEN})
+    deadline = time.monotonic() + 5
+    while not errors and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert journal.errors == 1 and journal.lost == 1 and isinstance(errors[0], OSError)
+    assert journal.alive()
+    os.remove(active); os.makedirs(active)
+    journal.record_start('kept', {'fen': chess_game.START_FEN})
+    journal.close()
+    assert os.listdir(active) == ['kept.log'] and journal.errors == 1
+    journal.record_start('late', {}) # 寫入執行緒停了之後的紀錄只計數
+    assert journal.lost == 2
+
+def archive_games(directory, game_ids):
+    journal = GameJournal(directory, flush_interval=0.01)
+    for game_id in game_ids:
+        journal.record_start(game_id, {'fen': chess_game.START_FEN})
+        journal.record_move(game_id, 0, uci_moves('e2e4')[0])
+        journal.record_end(game_id, '1-0 resign')
+    journal.close()
+
+def test_find_uses_the_sorted_index_and_the_tail_after_it(tmp_path, monkeypatch):
+    monkeypatch.setattr(game_journal, 'SORTED_REBUILD_TAIL', 4)
+    archive_games(str(tmp_path), [f'g{i}' for i in range(10)])
+    reader = ArchiveReader(str(tmp_path))
+    assert reader._sorted_count == 10 # 尾巴超過 4 局，開啟時重建了排序索引
+    reader.close()
+    archive_games(str(tmp_path), ['late1', 'late2'])
+    reader = ArchiveReader(str(tmp_path))
+    try:
+        assert reader._sorted_count == 10 and len(reader) == 12
+        for game_id in [f'g{i}' for i in range(10)] + ['late1', 'late2']:
+            assert reader.find(game_id)['game_id'] == game_id
+        assert reader.find('missing') is None
+        assert [game['game_id'] for game in reader][:2] == ['g0', 'g1'] # 逐局讀取還是封存順序
+    finally:
+        reader.close()
@@ -0,0 +1,64 @@
+import pytest
+
+from matchmaking import FINISHED, PLAYING, WAITING, MatchmakingQueue, RoomRegistry
+
+def test_queue_is_fifo_per_bucket():
+    queue = MatchmakingQueue()
+    blitz, rapid = queue.bucket_for('3+2', 1500), queue.bucket_for('10+0', 1500)
+    for room_id, bucket in (('a', blitz), ('b', rapid), ('c', blitz)):
+        queue.enqueue(room_id, bucket)
+    assert len(queue) == 3 and 'b' in queue
+    assert queue.pop(blitz) == 'a'
+    assert queue.pop(blitz) == 'c'
+    assert queue.pop(blitz) is None
+    assert queue.pop(rapid) == 'b' and len(queue) == 0
+
+def test_queue_remove():
+    queue = MatchmakingQueue()
+    for room_id in 'abc': queue.enqueue(room_id)
+    assert queue.remove('b') and not queue.remove('b') and not queue.remove('zzz')
+    assert 'b' not in queue
+    assert [queue.pop(), queue.pop(), queue.pop()] == ['a', 'c', None]
+
+def test_bucket_for():
+    queue = MatchmakingQueue(rating_bucket_width=200)
+    assert queue.bucket_for('5+0', 1450) == queue.bucket_for('5+0', '1599') == ('5+0', 7)
+    assert queue.bucket_for(300, None) == (300, None)
+    # 客戶端送來的奇怪型別不能讓分組變成無法雜湊的鍵，也不能丟例外
+    for time_control in (['5+0'], {'base': 5}, True, 1.5):
+        assert queue.bucket_for(time_control)[0] is None
+    for rating in ('abc', [1500], float('inf'), float('nan')):
+        assert queue.bucket_for('5+0', rating) == ('5+0', None)
+
+def test_registry_indexes():
+    registry = RoomRegistry()
+    room = registry.create('r1', 'alice')
+    assert registry.room_of('alice') is room and registry.count(WAITING) == 1
+    registry.add_player(room, 'bob')
+    registry.set_state(room, PLAYING)
+    assert room.color_of('alice') == 'white' and room.color_of('bob') == 'black'
+    assert room.opponent_of('alice') == 'bob'
+    assert registry.room_ids(PLAYING) == {'r1'} and registry.count(WAITING) == 0
+    registry.rebind('bob', 'bob2')
+    assert registry.room_of('bob') is None and registry.room_of('bob2') is room
+    assert room.players == ['alice', 'bob2']
+    assert registry.remove('r1') is room
+    assert registry.room_of('alice') is None and len(registry) == 0 and registry.count(PLAYING) == 0
+
+def test_leave_keeps_the_seat():
+    registry = RoomRegistry()
+    room = registry.create('r1', 'alice')
+    registry.add_player(room, 'bob')
+    registry.set_state(room, FINISHED)
+    assert registry.leave('alice') is room
+    assert registry.room_of('alice') is None and registry.seated(room) == ['bob']
+    assert room.color_of('alice') == 'white'
+    assert registry.leave('alice') is None
+
+def test_create_refuses_an_existing_room_id():
+    registry = RoomRegistry()
+    room = registry.create('r1', 'alice')
+    registry.add_player(room, 'bob')
+    with pytest.raises(ValueError):
+        registry.create('r1', 'carol')
+    assert registry.get('r1') is room and registry.room_of('bob') is room and registry.room_of('carol') is None
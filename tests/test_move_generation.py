@@ -0,0 +1,33 @@
+import chess_game
+from chess_game import Board
+
+EP_FEN = 'rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3'
+
+def ucis(moves):
+    return {chess_game.move_to_uci(move) for move in moves}
+
+def test_en_passant_for_the_side_to_move():
+    board = Board.from_fen(EP_FEN)
+    assert 'e5f6' in ucis(board.iter_moves())
+    assert 'e5d6' not in ucis(board.iter_moves()) # d 兵不是剛剛走兩步的
+
+def test_no_en_passant_for_the_other_side():
+    # 輪黑方時過路兵格子在第 3 排，白方的兵不能拿它來吃
+    board = Board.from_fen('rnbqkbnr/pppppp1p/8/8/3PPPp1/8/PPP3PP/RNBQKBNR b KQkq f3 0 3')
+    assert 'g4f3' in ucis(board.iter_moves())
+    assert ((6, 6), (5, 5)) not in board.generate_legal_moves('white') # g2 吃到空的 f3
+
+def test_probing_the_other_side_keeps_the_board_intact():
+    # 列出不是輪到的那一方的棋步會 make/unmake，走完輪到誰、局面都要還原
+    board = Board.from_fen(EP_FEN)
+    list(board.generate_legal_moves('black'))
+    assert board.to_fen() == EP_FEN
+    assert board.current_turn == 'white'
+
+def test_push_and_unmake_restore_the_position():
+    board = Board.from_fen(EP_FEN)
+    key = board.zobrist_key
+    for move in list(board.iter_moves()):
+        board.push_move(move)
+        board.unmake_move()
+        assert board.to_fen() == EP_FEN and board.zobrist_key == key, chess_game.move_to_uci(move)
@@ -0,0 +1,40 @@
+import pytest
+
+import chess_game
+from move_validator import MoveValidator, validate_move
+
+PROMOTION_FEN = '4k3/1P6/8/8/8/8/8/4K3 w - - 0 1'
+
+def uci(result):
+    return chess_game.move_to_uci(result[0])
+
+def test_legal_move():
+    move, reason, has_moves = validate_move(chess_game.START_FEN, 'e2e4')
+    assert chess_game.move_to_uci(move) == 'e2e4' and reason is None and has_moves is True
+
+@pytest.mark.parametrize('move, reason', [
+    ('e2', 'bad_format'), ('e2e9', 'bad_format'), ('hello', 'bad_format'),
+    ('e4e5', 'empty_square'),
+    ('e7e5', 'not_your_piece'),
+    ('e2e5', 'illegal_move'), ('e1g1', 'illegal_move'),
+])
+def test_rejections(move, reason):
+    assert validate_move(chess_game.START_FEN, move) == (None, reason, None)
+
+def test_promotion_defaults_to_a_queen():
+    assert uci(validate_move(PROMOTION_FEN, 'b7b8')) == 'b7b8q'
+    assert uci(validate_move(PROMOTION_FEN, 'b7b8n')) == 'b7b8n'
+
+def test_checkmate_reports_no_moves_left():
+    fen = 'rnbqkbnr/pppp1ppp/8/4p3/6P1/5P2/PPPPP2P/RNBQKBNR b KQkq - 0 2'
+    move, reason, has_moves = validate_move(fen, 'd8h4')
+    assert chess_game.move_to_uci(move) == 'd8h4' and reason is None and has_moves is False
+
+def test_validator_runs_inline_with_no_workers():
+    validator = MoveValidator(workers=0)
+    try:
+        assert validator.workers == 0
+        assert validator.validate(chess_game.START_FEN, 'g1f3')[1] is None
+        assert validator.validate(chess_game.START_FEN, 'g1g3') == (None, 'illegal_move', None)
+    finally:
+        validator.shutdown()
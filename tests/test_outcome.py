@@ -0,0 +1,61 @@
+import chess_game
+from chess_game import Board
+
+def play(board, *ucis):
+    for uci in ucis:
+        board.push_move(next(m for m in board.iter_moves() if chess_game.move_to_uci(m) == uci))
+    return board
+
+def test_checkmate():
+    board = play(Board(), 'f2f3', 'e7e5', 'g2g4', 'd8h4')
+    assert not board.has_legal_move()
+    assert board.outcome() == (chess_game.BLACK_WINS, chess_game.CHECKMATE)
+
+def test_stalemate():
+    board = Board.from_fen('7k/5Q2/6K1/8/8/8/8/8 b - - 0 1')
+    assert not board.has_legal_move()
+    assert board.outcome() == (chess_game.DRAW, chess_game.STALEMATE)
+
+def test_outcome_trusts_a_precomputed_has_moves():
+    board = play(Board(), 'f2f3', 'e7e5', 'g2g4', 'd8h4')
+    assert board.outcome(False) == (chess_game.BLACK_WINS, chess_game.CHECKMATE)
+    assert Board().outcome(True) is None
+
+def test_fifty_move_rule():
+    board = Board.from_fen('4k3/8/8/8/8/8/8/R3K3 w - - 99 80')
+    assert board.outcome() is None
+    play(board, 'a1a2')
+    assert board.outcome() == (chess_game.DRAW, chess_game.FIFTY_MOVES)
+
+def test_threefold_repetition():
+    board = Board()
+    shuffle = ('g1f3', 'g8f6', 'f3g1', 'f6g8')
+    play(board, *shuffle)
+    assert board.repetition_count() == 2 and board.outcome() is None
+    play(board, *shuffle[:3])
+    assert board.outcome() is None
+    play(board, shuffle[3])
+    assert board.repetition_count() == 3
+    assert board.outcome() == (chess_game.DRAW, chess_game.REPETITION)
+
+def test_repetition_does_not_look_past_an_irreversible_move():
+    board = play(Board(), 'g1f3', 'g8f6', 'f3g1', 'f6g8', 'e2e4')
+    assert board.repetition_count() == 1
+
+def test_repetition_needs_the_same_side_to_move():
+    # 同樣的棋子位置但輪到不同的一方，不算同一個局面
+    board = play(Board(), 'g1f3', 'g8f6', 'f3g1', 'f6g8', 'b1c3', 'b8c6', 'c3b1')
+    assert board.repetition_count() == 1
+
+def test_insufficient_material():
+    for fen in ('8/8/4k3/8/8/3K4/8/8 w - - 0 1', '8/8/4k3/8/8/3KN3/8/8 w - - 0 1',
+                '8/8/4k3/8/8/3KB3/8/8 w - - 0 1', '8/3b4/4k3/8/8/3K4/4B3/8 w - - 0 1'):
+        assert Board.from_fen(fen).is_insufficient_material(), fen
+        assert Board.from_fen(fen).outcome() == (chess_game.DRAW, chess_game.INSUFFICIENT_MATERIAL)
+    for fen in ('8/8/4k3/8/8/3KNN2/8/8 w - - 0 1', '8/8/4k3/8/8/3KP3/8/8 w - - 0 1',
+                '8/2b5/4k3/8/8/3K4/4B3/8 w - - 0 1', '8/8/4k3/8/8/3KR3/8/8 w - - 0 1'):
+        assert not Board.from_fen(fen).is_insufficient_material(), fen
+
+def test_has_legal_move_when_only_the_king_is_stuck():
+    board = Board.from_fen('k7/P7/1K6/8/8/8/8/7b b - - 0 1') # 黑王動不了，但象還能走
+    assert board.has_legal_move()
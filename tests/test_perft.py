@@ -0,0 +1,18 @@
+import pytest
+
+import chess_game
+import perft
+
+# 只跑節點數一萬以內的深度，整套幾秒內跑完；更深的基準用 python -m perft
+FAST_CASES = [(name, fen, depth, nodes) for name, fen, counts in perft.BENCH_POSITIONS
+              for depth, nodes in counts.items() if nodes <= 10000]
+
+@pytest.mark.parametrize('name, fen, depth, nodes', FAST_CASES, ids=[f"{c[0]}-d{c[2]}" for c in FAST_CASES])
+def test_perft_node_counts(name, fen, depth, nodes):
+    board = chess_game.Board.from_fen(fen)
+    assert perft.perft(board, depth) == nodes
+    assert board.to_fen() == chess_game.Board.from_fen(fen).to_fen() # make/unmake 之後局面要完全還原
+
+def test_divide_sums_to_perft():
+    board = chess_game.Board()
+    assert sum(count for _, count in perft.divide(board, 2)) == 400
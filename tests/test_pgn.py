@@ -0,0 +1,74 @@
+import io
+
+import pytest
+
+import chess_game
+import pgn
+from chess_game import Board
+
+SAMPLE = '''[Event "Test"]
+[White "Alice"]
+[Black "Bob \\"B\\""]
+[Result "1-0"]
+
+1. e4 {king's pawn; not a line comment} e5 2. Nf3 (2. f4 exf4 {gambit}
+3. Nf3) 2... Nc6 $1 3. Bb5 ; Ruy Lopez
+a6 1-0
+
+[Event "No result"]
+
+1. d4 d5
+[Event "Third"]
+1. c4 *
+'''
+
+def test_read_games():
+    games = list(pgn.read_games(io.StringIO(SAMPLE)))
+    assert len(games) == 3
+    first, second, third = games
+    assert first.headers['White'] == 'Alice' and first.headers['Black'] == 'Bob "B"'
+    assert first.moves == ['e4', 'e5', 'Nf3', 'Nc6', 'Bb5', 'a6']
+    assert first.line == 1
+    assert first.move_lines == [6, 6, 6, 7, 7, 8]
+    # 沒有結果記號，遇到下一局的標頭就當作結束
+    assert second.moves == ['d4', 'd5'] and second.line == 10 and 'Result' not in second.headers
+    assert third.moves == ['c4'] and third.headers['Result'] == '*'
+
+def test_read_games_accepts_bytes_and_a_missing_final_result():
+    games = list(pgn.read_games(io.BytesIO(b'1. e4 e5 2. Nf3\n')))
+    assert [game.moves for game in games] == [['e4', 'e5', 'Nf3']]
+
+def play_san(board, *sans):
+    return [chess_game.move_to_uci(board.apply_san(san)) for san in sans]
+
+def test_apply_san():
+    board = Board()
+    assert play_san(board, 'e4', 'e5', 'Nf3', 'Nc6', 'Bc4', 'Bc5', 'O-O', 'Nf6+') == \
+        ['e2e4', 'e7e5', 'g1f3', 'b8c6', 'f1c4', 'f8c5', 'e1g1', 'g8f6']
+
+def test_san_disambiguation():
+    board = Board.from_fen('4k3/8/8/8/8/8/4K3/R6R w - - 0 1')
+    assert board.parse_san('Rd1') is None # 兩個城堡都走得到 d1
+    assert chess_game.move_to_uci(board.parse_san('Rad1')) == 'a1d1'
+    assert chess_game.move_to_uci(board.parse_san('Rhd1')) == 'h1d1'
+    board = Board.from_fen('4k3/8/8/8/R7/8/8/R3K3 w - - 0 1')
+    assert chess_game.move_to_uci(board.parse_san('R1a2')) == 'a1a2'
+    assert chess_game.move_to_uci(board.parse_san('R4a2')) == 'a4a2'
+
+def test_san_castling_and_promotion():
+    board = Board.from_fen('r3k2r/8/8/8/8/8/8/4K3 b kq - 0 1')
+    assert chess_game.move_to_uci(board.parse_san('O-O-O')) == 'e8c8'
+    assert chess_game.move_to_uci(board.parse_san('0-0')) == 'e8g8'
+    board = Board.from_fen('r3k3/1P6/8/8/8/8/8/4K3 w q - 0 1')
+    assert chess_game.move_to_uci(board.parse_san('bxa8=Q+')) == 'b7a8q'
+    assert chess_game.move_to_uci(board.parse_san('b8N')) == 'b7b8n'
+    assert board.parse_san('b8') is None # 升變一定要寫升成什麼
+
+def test_illegal_san_leaves_the_board_unchanged():
+    board = Board()
+    play_san(board, 'e4')
+    fen = board.to_fen()
+    for san in ('e4', 'Ke7', 'Nf3', 'O-O', 'xyz', 'Qh4#'):
+        with pytest.raises(ValueError):
+            board.apply_san(san)
+        assert board.to_fen() == fen
@@ -0,0 +1,47 @@
+import io
+
+import pgn_pipeline
+
+GAMES = '''[White "A"]
+[Result "0-1"]
+1. f3 e5 2. g4 Qh4# 0-1
+
+[White "B"]
+1. e4 e5 2. Ke2 Ke7 3. Kxe5 *
+
+[White "C"]
+[FEN "8/8/8/8/8/8/8/8 w - - 0 1"]
+1. e4 *
+
+[White "D"]
+1. d4 1-0
+'''
+
+def run(**kwargs):
+    return list(pgn_pipeline.run_pipeline(io.StringIO(GAMES), workers=0, **kwargs))
+
+def test_results_in_file_order():
+    results = run(batch_size=2)
+    assert [result['white'] for result in results] == ['A', 'B', 'C', 'D']
+    mate, illegal, bad_fen, ok = results
+    assert mate['outcome'] == ['0-1', 'checkmate'] and mate['checks'] == 1 and not mate['result_mismatch']
+    assert illegal['error']['reason'] == 'illegal_move'
+    assert illegal['error']['move'] == '3. Kxe5' and illegal['error']['line'] == 6 and illegal['plies'] == 4
+    assert bad_fen['error']['reason'] == 'bad_fen'
+    assert ok['error'] is None and ok['plies'] == 1
+
+def test_an_unexpected_error_only_fails_that_game(monkeypatch):
+    replay_game = pgn_pipeline.replay_game
+    def flaky(game):
+        if game[0].get('White') == 'B': raise RuntimeError('boom')
+        return replay_game(game)
+    monkeypatch.setattr(pgn_pipeline, 'replay_game', flaky)
+    results = run()
+    assert [result['error'] and result['error']['reason'] for result in results] == \
+        [None, 'internal_error', 'bad_fen', None]
+    assert 'boom' in results[1]['error']['detail'] and results[1]['line'] == 5
+
+def test_stats():
+    stats = pgn_pipeline.PipelineStats()
+    for result in run(): stats.add(result)
+    assert stats.games == 4 and stats.illegal == 2 and stats.outcomes['checkmate'] == 1
@@ -0,0 +1,65 @@
+import pytest
+
+import chess_game
+import protocol
+
+def play(board, count):
+    moves = []
+    for _ in range(count):
+        move = next(board.iter_moves())
+        board.push_move(move); moves.append(move)
+    return moves
+
+def test_move_frame_round_trip():
+    move = chess_game.parse_uci('e7e8q')
+    frame = protocol.pack_move(513, move)
+    assert len(frame) == 4
+    assert protocol.unpack_move(frame) == (513, move)
+    assert protocol.unpack_move(bytearray(frame)) == (513, move)
+
+@pytest.mark.parametrize('data', [b'', b'\x00\x01\x02', b'\x00' * 5, 'abcd', None, [0, 0, 0, 0]])
+def test_bad_move_frames_are_rejected(data):
+    with pytest.raises(ValueError):
+        protocol.unpack_move(data)
+
+def test_sequence_frame_round_trip():
+    assert protocol.unpack_seq(protocol.pack_seq(0xFFFF)) == 0xFFFF
+    with pytest.raises(ValueError):
+        protocol.unpack_seq(b'\x00')
+    with pytest.raises(ValueError):
+        protocol.unpack_seq(3)
+
+def test_move_list_round_trip():
+    moves = play(chess_game.Board(), 6)
+    assert protocol.unpack_moves(protocol.pack_moves(moves)) == moves
+    with pytest.raises(ValueError):
+        protocol.unpack_moves(b'\x00\x01\x02')
+
+def test_resync_sends_only_the_missing_moves():
+    server = chess_game.Board()
+    history = play(server, 10)
+    client = chess_game.Board()
+    play(client, 4)
+    payload = protocol.resync_payload(history, 4, server.to_fen())
+    assert payload['from'] == 4 and 'fen' not in payload
+    assert protocol.apply_resync(client, payload) == 10
+    assert client.to_fen() == server.to_fen()
+
+@pytest.mark.parametrize('client_seq', [11, 0xFFFF])
+def test_resync_falls_back_to_a_snapshot_when_out_of_range(client_seq):
+    server = chess_game.Board()
+    history = play(server, 10)
+    payload = protocol.resync_payload(history, client_seq, server.to_fen())
+    assert payload == {'seq': 10, 'fen': server.to_fen()}
+    client = chess_game.Board()
+    assert protocol.apply_resync(client, payload) == 10
+    assert client.to_fen() == server.to_fen()
+
+def test_resync_falls_back_to_a_snapshot_when_too_far_behind():
+    history = list(range(protocol.RESYNC_DELTA_LIMIT + 1))
+    assert 'fen' in protocol.resync_payload(history, 0, chess_game.START_FEN)
+    assert 'moves' in protocol.resync_payload(history, 1, chess_game.START_FEN)
+
+def test_move_to_notation():
+    assert protocol.move_to_notation(chess_game.parse_uci('e2e4')) == ['e2', 'e4']
+    assert protocol.move_to_notation(chess_game.parse_uci('a7a8n')) == ['a7', 'a8', 'n']
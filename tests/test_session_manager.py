@@ -0,0 +1,113 @@
+from session_manager import SessionManager, TimerWheel
+
+class FakeClock:
+    def __init__(self): self.now = 0.0
+    def __call__(self): return self.now
+
+def make_wheel(tick=1.0, slots=8):
+    clock = FakeClock()
+    return TimerWheel(tick=tick, slots=slots, clock=clock), clock
+
+def test_timer_fires_after_deadline():
+    wheel, clock = make_wheel()
+    wheel.schedule('a', 3)
+    clock.now = 2.5
+    assert wheel.advance() == []
+    clock.now = 4.0
+    assert wheel.advance() == ['a']
+    assert 'a' not in wheel and len(wheel) == 0
+
+def test_cancel_and_reschedule():
+    wheel, clock = make_wheel()
+    wheel.schedule('a', 2); wheel.schedule('b', 2)
+    wheel.cancel('a')
+    wheel.schedule('b', 5) # 重新排程取代原本的期限
+    clock.now = 3.0
+    assert wheel.advance() == []
+    clock.now = 6.0
+    assert wheel.advance() == ['b']
+
+def test_deadline_beyond_one_round_waits_for_its_round():
+    wheel, clock = make_wheel(slots=4)
+    wheel.schedule('far', 10)
+    for now in range(1, 10):
+        clock.now = float(now)
+        assert wheel.advance() == []
+    clock.now = 11.0
+    assert wheel.advance() == ['far']
+
+def test_advance_after_long_pause_sees_every_slot_once():
+    wheel, clock = make_wheel(slots=4)
+    for i in range(6):
+        wheel.schedule(i, i + 1)
+    clock.now = 100.0
+    assert sorted(wheel.advance()) == list(range(6))
+    assert len(wheel) == 0
+
+def make_sessions(grace=30, idle=600):
+    wheel, clock = make_wheel(slots=64)
+    return SessionManager(grace_seconds=grace, idle_seconds=idle, timers=wheel), clock
+
+def test_unseated_session_is_dropped_on_disconnect():
+    sessions, _ = make_sessions()
+    session, previous = sessions.connect('sid1')
+    assert previous is None
+    assert sessions.disconnect('sid1') is None
+    assert sessions.get('sid1') is None and len(sessions) == 0
+
+def test_reconnect_within_grace_keeps_the_seat():
+    sessions, clock = make_sessions()
+    session, _ = sessions.connect('sid1')
+    sessions.seat('sid1', 'room')
+    assert sessions.disconnect('sid1') is session
+    assert sessions.held() == 1
+    clock.now = 10.0
+    resumed, previous = sessions.connect('sid2', session.token)
+    assert resumed is session and previous == 'sid1'
+    assert resumed.sid == 'sid2' and resumed.connected and resumed.room_id == 'room'
+    assert sessions.get('sid1') is None
+    clock.now = 100.0
+    assert sessions.expired() == [] # 保留期的計時器已經取消
+
+def test_grace_expiry_abandons_the_room():
+    sessions, clock = make_sessions()
+    session, _ = sessions.connect('sid1')
+    sessions.seat('sid1', 'room')
+    sessions.disconnect('sid1')
+    clock.now = 32.0
+    assert sessions.expired() == [('room', 'abandoned')]
+    assert sessions.release(['sid1', 'sid2'], 'room') == ['sid1']
+    assert len(sessions) == 0
+    assert sessions.connect('sid3', session.token)[1] is None # token 已經失效，開新的 session
+
+def test_idle_rooms_expire_and_touch_postpones_them():
+    sessions, clock = make_sessions(idle=60)
+    sessions.touch_room('room')
+    clock.now = 50.0
+    sessions.touch_room('room')
+    clock.now = 70.0
+    assert sessions.expired() == []
+    clock.now = 112.0
+    assert sessions.expired() == [('room', 'idle')]
+
+def test_unmatched_rooms_are_reported_until_released():
+    sessions, clock = make_sessions()
+    sessions.wait_for_opponent('a', 30); sessions.wait_for_opponent('b', 30)
+    sessions.release([], 'b')
+    clock.now = 32.0
+    assert sessions.expired() == [('a', 'unmatched')]
+
+def test_release_keeps_connected_sessions():
+    sessions, _ = make_sessions()
+    session, _ = sessions.connect('sid1')
+    sessions.seat('sid1', 'room')
+    assert sessions.release(['sid1'], 'room') == []
+    assert sessions.get('sid1') is session and session.room_id is None
+
+def test_restored_seat_can_be_claimed_or_expires():
+    sessions, clock = make_sessions()
+    sessions.restore('tok1', 'old1', 'room'); sessions.restore('tok2', 'old2', 'room')
+    resumed, previous = sessions.connect('new1', 'tok1')
+    assert previous == 'old1' and resumed.room_id == 'room'
+    clock.now = 32.0
+    assert sessions.expired() == [('room', 'abandoned')]
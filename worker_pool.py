@@ -0,0 +1,57 @@
+# 伺服器把吃 CPU 的工作 (棋步驗證、電腦對手的搜尋) 丟進行程池 (或執行緒池) 的共用部分，不佔用 eventlet 的事件迴圈
+# 等結果時不佔任何執行緒：給了 sleep (伺服器傳 socketio.sleep) 就用它輪詢 future.done()，
+# 間隔從 0.5 ms 倍增到 20 ms，等待中的 greenlet 只是一個計時器，其他房間照常跑
+# (以前用 eventlet.tpool 等，每個等待都要佔住 tpool 的一條執行緒，電腦對手一多，所有棋步驗證都排在它們後面)
+# max_pending 限制同時送出的工作數，超過的呼叫端用同樣的方式等空位
+# workers=0 代表直接在呼叫端執行 (測試或單機除錯用)
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+POLL_MIN, POLL_MAX = 0.0005, 0.02
+
+class WorkerPool:
+    def __init__(self, workers=None, use_processes=True, name='worker', sleep=None, max_pending=None):
+        workers = (os.cpu_count() or 1) if workers is None else workers
+        self.workers = workers
+        self.sleep = sleep # None 代表直接阻塞在 future.result() (命令列、一般執行緒)
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_pending) if max_pending else None
+        if workers <= 0:
+            self._executor = None
+        elif use_processes:
+            self._executor = ProcessPoolExecutor(max_workers=workers)
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+
+    def submit(self, fn, *args):
+        return self._executor.submit(fn, *args)
+
+    def run(self, fn, *args):
+        # 執行 fn(*args) 並回傳結果
+        if self._executor is None:
+            return fn(*args)
+        if self._slots is not None:
+            self._wait(lambda: self._slots.acquire(blocking=False))
+        with self._lock: self.in_flight += 1
+        try:
+            future = self.submit(fn, *args)
+            if self.sleep is not None:
+                self._wait(future.done)
+            return future.result()
+        finally:
+            with self._lock: self.in_flight -= 1
+            if self._slots is not None: self._slots.release()
+
+    def _wait(self, ready):
+        sleep = self.sleep or time.sleep
+        delay = POLL_MIN
+        while not ready():
+            sleep(delay)
+            delay = min(delay * 2, POLL_MAX)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)